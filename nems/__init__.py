@@ -6,9 +6,61 @@ log = logging.getLogger(__name__)
 
 NEMS_PATH = os.path.abspath(os.path.dirname(__file__) + '/..')
 
+def _resolve_settings(config, settings, names):
+    '''
+    Sets each of names on config from the environment, settings.py or
+    config's own default, in that order of preference, and stores the
+    value in the environment.
+    '''
+    from os import environ
+    for s in names:
+        if s in environ:
+            # If it's already in the environment, don't need
+            # to do anything else.
+            pass
+        elif hasattr(settings, s):
+            log.info("Found setting: %s in %s, adding "
+                     "value to environment ... ", s, settings.__name__)
+            d = getattr(settings, s)
+            if d is None:
+                d = ''
+            environ[s] = str(d)
+        else:
+            log.info("No value specified for: %s. Using default value "
+                     "in %s", s, config.__name__)
+            d = getattr(config, s)
+            if d is None:
+                d = ''
+            environ[s] = str(d)
+        setattr(config, s, environ[s])
+
+
+def _setting_names(config):
+    # Ignore python magic variables and any that are not in all caps.
+    return [s for s in config.__dir__()
+            if not s.startswith('__') and s == s.upper()]
+
+
+def init_logging():
+    '''
+    Sets up the console and log file handlers from the NEMS_LOG_* settings.
+    Runs on `import nems`, so that everything NEMS logs is saved; the rest
+    of the config is only loaded on first use (see get_config).
+    '''
+    from nems.configs import defaults as config
+    try:
+        from nems.configs import settings
+    except ImportError:
+        # load_config creates a blank settings.py later if needed
+        settings = object()
+    names = [s for s in _setting_names(config) if s.startswith('NEMS_LOG_')]
+    _resolve_settings(config, settings, names)
+    config.init_logging()
+
+
 def load_config():
     # Load the default settings
-    from os import environ, path, utime
+    from os import path, utime
     from nems.configs import defaults as config
 
     # leave defaults.py off the end of path
@@ -34,44 +86,35 @@ def load_config():
             log.info("Could not create settings.py in configs directory ...")
             settings = object()
 
-    for s in config.__dir__():
-        if s.startswith('__') or not (s == s.upper()):
-            # Ignore python magic variables and any that are not in
-            # all caps.
-            pass
-        elif s == s.upper():
-            if s in environ:
-                # If it's already in the environment, don't need
-                # to do anything else.
-                pass
-            elif hasattr(settings, s):
-                log.info("Found setting: %s in %s, adding "
-                         "value to environment ... ", s, settings.__name__)
-                d = getattr(settings, s)
-                if d is None:
-                    d = ''
-                environ[s] = str(d)
-            else:
-                log.info("No value specified for: %s. Using default value "
-                         "in %s", s, config.__name__)
-                d = getattr(config, s)
-                if d is None:
-                    d = ''
-                environ[s] = str(d)
-            setattr(config, s, environ[s])
+    _resolve_settings(config, settings, _setting_names(config))
 
     config.init_settings()
     return config
 
 
-_config = load_config()
+init_logging()
+
+# The rest of the config is loaded on first use rather than on
+# `import nems`, so that importing a submodule does not create settings.py
+# or fill the environment with settings nobody asked for.
+_config = None
+
+
+def get_config():
+    '''
+    Returns the NEMS config module, loading it the first time it is needed.
+    '''
+    global _config
+    if _config is None:
+        _config = load_config()
+    return _config
 
 
 def get_setting(setting):
     '''
     Get value of setting.
     '''
-    s = getattr(_config, setting)
+    s = getattr(get_config(), setting)
     # Necessary since environment variables can only hold strings,
     # but config settings some times need to be other types.
     # NOTE: Will not work for dictionaries, but tested fine so far
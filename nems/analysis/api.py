@@ -1,7 +1,10 @@
 from .fit_basic import (fit_basic, fit_random_subsets, fit_jackknifes,
-                        fit_subsets, fit_state_nfold)
+                        fit_subsets, fit_state_nfold,
+                        fit_progressive_subsets)
+from .fit_coarse_to_fine import fit_coarse_to_fine
 from .fit_iteratively import fit_iteratively, fit_module_sets
 from .fit_nfold import fit_nfold
+from .fit_population import fit_population, population_blocks
 from .fit_from_priors import fit_from_priors
 from .test_prediction import (generate_prediction,
                               standard_correlation,
@@ -1,5 +1,9 @@
 import logging
 
+import numpy as np
+
+import nems.modelspec as ms
+import nems.profiling
 import nems.utils
 
 log = logging.getLogger(__name__)
@@ -8,13 +12,18 @@ log = logging.getLogger(__name__)
 def basic_cost(sigma, unpacker, modelspec, data, segmentor,
                evaluator, metric):
     '''Standard cost function for use by fit_basic and other analyses.'''
-    updated_spec = unpacker(sigma)
-    # The segmentor takes a subset of the data for fitting each step
-    # Intended use is for CV or random selection of chunks of the data
-    # For fit_basic the 'segmentor' just passes it all through.
-    data_subset = segmentor(data)
-    updated_data_subset = evaluator(data_subset, updated_spec)
-    error = metric(updated_data_subset)
+    with nems.profiling.timer('cost_function'):
+        with nems.profiling.timer('unpacker'):
+            updated_spec = unpacker(sigma)
+        # The segmentor takes a subset of the data for fitting each step
+        # Intended use is for CV or random selection of chunks of the data
+        # For fit_basic the 'segmentor' just passes it all through.
+        with nems.profiling.timer('segmentor'):
+            data_subset = segmentor(data)
+        with nems.profiling.timer('evaluator'):
+            updated_data_subset = evaluator(data_subset, updated_spec)
+        with nems.profiling.timer('metric'):
+            error = metric(updated_data_subset)
     log.debug("inside cost function, current error: %.06f", error)
     log.debug("current sigma: %s", sigma)
 
@@ -29,3 +38,85 @@ def basic_cost(sigma, unpacker, modelspec, data, segmentor,
         basic_cost.error = error
 
     return error
+
+
+def residual_cost(sigma, unpacker, modelspec, data, segmentor, evaluator,
+                  metric):
+    '''
+    Same as basic_cost, but metric returns a vector of residuals (such as
+    nems.metrics.api.nmse_residuals), which is returned for least-squares
+    fitters.
+    '''
+    with nems.profiling.timer('cost_function'):
+        updated_spec = unpacker(sigma)
+        data_subset = segmentor(data)
+        with nems.profiling.timer('evaluator'):
+            updated_data_subset = evaluator(data_subset, updated_spec)
+        with nems.profiling.timer('metric'):
+            residuals = metric(updated_data_subset)
+
+    if hasattr(residual_cost, 'counter'):
+        residual_cost.counter += 1
+        if residual_cost.counter % 100 == 0:
+            log.info('Eval #%d. E=%.06f', residual_cost.counter,
+                     np.sum(residuals ** 2))
+            nems.utils.progress_fun()
+
+    return residuals
+
+
+def batch_cost(sigmas, unpacker, modelspec, data, segmentor, metric,
+               resp_name='resp'):
+    '''
+    Cost of each row of sigmas, computed in one vectorised evaluation (see
+    nems.modelspec.evaluate_batch). metric is a function of
+    (pred (K, n_chans, n_times), resp) that returns K errors, such as
+    nems.metrics.api.nmse_batch.
+    '''
+    with nems.profiling.timer('batch_cost_function'):
+        data_subset = segmentor(data)
+        with nems.profiling.timer('evaluator'):
+            pred = ms.evaluate_batch(data_subset,
+                                     (unpacker(s) for s in sigmas))
+        with nems.profiling.timer('metric'):
+            errors = metric(pred, data_subset[resp_name].as_continuous())
+    log.debug("inside batch cost function, %d sigmas, best error: %.06f",
+              len(errors), errors.min())
+
+    if hasattr(batch_cost, 'counter'):
+        before = batch_cost.counter
+        batch_cost.counter += len(errors)
+        if batch_cost.counter // 100 > before // 100:
+            log.info('Eval #%d. E=%.06f', batch_cost.counter, errors.min())
+            nems.utils.progress_fun()
+
+    return errors
+
+
+def population_cost(sigma, unpacker, data, segmentor, evaluator, metric,
+                    pred_name='pred', resp_name='resp'):
+    '''
+    Cost of each response channel of a population model (see
+    nems.analysis.fit_population). All channels are predicted in one
+    evaluation, and metric, a batch metric such as
+    nems.metrics.api.nmse_batch, scores each channel as one member of the
+    batch. Returns one error per channel.
+    '''
+    with nems.profiling.timer('cost_function'):
+        updated_spec = unpacker(sigma)
+        data_subset = segmentor(data)
+        with nems.profiling.timer('evaluator'):
+            result = evaluator(data_subset, updated_spec)
+        with nems.profiling.timer('metric'):
+            pred = result[pred_name].as_continuous()
+            resp = result[resp_name].as_continuous()
+            errors = metric(pred[:, np.newaxis, :], resp[:, np.newaxis, :])
+
+    if hasattr(population_cost, 'counter'):
+        population_cost.counter += 1
+        if population_cost.counter % 100 == 0:
+            log.info('Eval #%d. Mean E=%.06f', population_cost.counter,
+                     errors.mean())
+            nems.utils.progress_fun()
+
+    return errors
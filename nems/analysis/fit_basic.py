@@ -3,9 +3,16 @@ import logging
 import time
 from functools import partial
 
-from nems.analysis.cost_functions import basic_cost
+import numpy as np
+
+from nems.analysis.cost_functions import (basic_cost, batch_cost,
+                                          residual_cost)
 from nems.fitters.api import scipy_minimize
+from nems.fitters.checkpoint import Checkpoint
+from nems.fitters.util import memoize_cost, accepts_kwarg
+import nems.epoch as ep
 import nems.priors
+import nems.profiling
 import nems.fitters.mappers
 import nems.modelspec as ms
 import nems.metrics.api as metrics
@@ -18,9 +25,11 @@ log = logging.getLogger(__name__)
 def fit_basic(data, modelspec,
               fitter=scipy_minimize, cost_function=None,
               segmentor=nems.segmentors.use_all_data,
-              mapper=nems.fitters.mappers.simple_vector,
+              mapper=nems.fitters.mappers.compiled_vector,
               metric=lambda data: metrics.nmse(data, 'pred', 'resp'),
-              metaname='fit_basic', fit_kwargs={}, require_phi=True):
+              metaname='fit_basic', fit_kwargs={}, require_phi=True,
+              profile=False, evaluator=ms.evaluate, batch_metric=None,
+              cost_cache=256, checkpoint=None, residual_metric=None):
     '''
     Required Arguments:
      data          A recording object
@@ -30,12 +39,45 @@ def fit_basic(data, modelspec,
      fitter        A function of (sigma, costfn) that tests various points,
                    in fitspace (i.e. sigmas) using the cost function costfn,
                    and hopefully returns a better sigma after some time.
+                   If it accepts a stepinfo argument, it is given a dict
+                   in which it leaves the reason it stopped and its
+                   number of evaluations, stored in the 'stop_reason' and
+                   'n_evals' metadata.
+                   Time, evaluation and improvement budgets are passed in
+                   fit_kwargs (see nems.fitters.api.coordinate_descent).
      mapper        A class that has two methods, pack and unpack, which define
                    the mapping between modelspecs and a fitter's fitspace.
      segmentor     An function that selects a subset of the data during the
                    fitting process. This is NOT the same as est/val data splits
      metric        A function of a Recording that returns an error value
                    that is to be minimized.
+     profile       If True, record per-module and per-step timing during
+                   the fit (see nems.profiling) and store the table in the
+                   'profile' metadata of the returned modelspec.
+     evaluator     A function of (recording, modelspec) that returns the
+                   recording with the prediction added, such as
+                   ms.evaluate or ms.evaluate_unique_stim.
+     batch_metric  A function of (pred, resp) that returns one error per
+                   prediction in a (K, n_chans, n_times) batch, such as
+                   metrics.nmse_batch. If given, and every module can be
+                   compiled (see ms.evaluate_batch), fitters that accept a
+                   batch_cost_fn evaluate their probes in batches.
+     cost_cache    Number of recent sigmas whose error is kept, so that
+                   repeat evaluations are skipped (see
+                   nems.fitters.util.memoize_cost). 0 turns this off, as
+                   does a segmentor other than use_all_data. The cache
+                   hits and misses are stored in the 'cost_cache' metadata
+                   of the returned modelspec.
+     checkpoint    A nems.fitters.checkpoint.Checkpoint, or the path of
+                   one, where the best sigma so far and the state of the
+                   fitter (if it takes a checkpoint argument) are kept
+                   during the fit. If it exists, the fit resumes from it,
+                   and it is removed once the fit is done.
+     residual_metric  A function of a Recording that returns the vector of
+                   residuals whose sum of squares is the error, such as
+                   metrics.nmse_residuals. If given, it is passed to the
+                   fitter as residual_fn, for least-squares fitters such as
+                   nems.fitters.api.least_squares.
 
     Returns
     A list containing a single modelspec, which has the best parameters found
@@ -78,9 +120,6 @@ def fit_basic(data, modelspec,
     #    .bounds(modelspec) -> fitspace_bounds
     packer, unpacker, pack_bounds = mapper(modelspec)
 
-    # A function to evaluate the modelspec on the data
-    evaluator = nems.modelspec.evaluate
-
     my_cost_function = cost_function
     my_cost_function.counter = 0
 
@@ -90,18 +129,70 @@ def fit_basic(data, modelspec,
                       unpacker=unpacker, modelspec=modelspec,
                       data=data, segmentor=segmentor, evaluator=evaluator,
                       metric=metric)
+    if checkpoint is not None:
+        if isinstance(checkpoint, str):
+            checkpoint = Checkpoint(checkpoint)
+        checkpoint.match(modelspec, data)
+        cost_fn = checkpoint.watch(cost_fn)
+        if accepts_kwarg(fitter, 'checkpoint'):
+            fit_kwargs = dict(fit_kwargs, checkpoint=checkpoint)
+    if cost_cache and segmentor is nems.segmentors.use_all_data:
+        cost_fn = memoize_cost(cost_fn, cost_cache)
+
+    if residual_metric is not None:
+        residual_cost.counter = 0
+        residual_fn = partial(
+                residual_cost, unpacker=unpacker, modelspec=modelspec,
+                data=data, segmentor=segmentor, evaluator=evaluator,
+                metric=residual_metric)
+        fit_kwargs = dict(fit_kwargs, residual_fn=residual_fn)
+
+    if batch_metric is not None and not accepts_kwarg(fitter,
+                                                      'batch_cost_fn'):
+        log.info('Not evaluating in batches: %s does not take a '
+                 'batch_cost_fn', getattr(fitter, '__name__', fitter))
+    elif batch_metric is not None:
+        try:
+            ms.compile_modelspec(modelspec, data['stim'].fs)
+        except ValueError as e:
+            log.info('Not evaluating in batches: %s', e)
+        else:
+            batch_cost.counter = 0
+            batch_cost_fn = partial(
+                    batch_cost, unpacker=unpacker, modelspec=modelspec,
+                    data=data, segmentor=segmentor, metric=batch_metric)
+            if checkpoint is not None:
+                batch_cost_fn = checkpoint.watch(batch_cost_fn)
+            fit_kwargs = dict(fit_kwargs, batch_cost_fn=batch_cost_fn)
 
     # get initial sigma value representing some point in the fit space,
     # and corresponding bounds for each value
     sigma = packer(modelspec)
+    if checkpoint is not None:
+        sigma = checkpoint.resume_sigma(sigma)
     bounds = pack_bounds(modelspec)
 
     # Results should be a list of modelspecs
     # (might only be one in list, but still should be packaged as a list)
-    improved_sigma = fitter(sigma, cost_fn, bounds=bounds, **fit_kwargs)
+    stepinfo = {}
+    if accepts_kwarg(fitter, 'stepinfo'):
+        fit_kwargs = dict(fit_kwargs, stepinfo=stepinfo)
+    if profile:
+        nems.profiling.enable()
+    fitter_start = time.time()
+    try:
+        improved_sigma = fitter(sigma, cost_fn, bounds=bounds, **fit_kwargs)
+    finally:
+        # leave global profiling off even if the fitter raised
+        if profile:
+            stats = nems.profiling.finish_fit(time.time() - fitter_start)
     improved_modelspec = unpacker(improved_sigma)
+    if checkpoint is not None:
+        checkpoint.clear()
 
     elapsed_time = (time.time() - start_time)
+    if profile:
+        ms.set_modelspec_metadata(improved_modelspec, 'profile', stats)
 
     # TODO: Should this maybe be moved to a higher level
     # so it applies to ALL the fittters?
@@ -110,6 +201,16 @@ def fit_basic(data, modelspec,
     ms.set_modelspec_metadata(improved_modelspec, 'fit_time', elapsed_time)
     ms.set_modelspec_metadata(improved_modelspec, 'n_parms',
                               len(improved_sigma))
+    ms.set_modelspec_metadata(improved_modelspec, 'stop_reason',
+                              stepinfo.get('stop_reason'))
+    ms.set_modelspec_metadata(improved_modelspec, 'n_evals',
+                              stepinfo.get('n_evals'))
+    if hasattr(cost_fn, 'hits'):
+        log.info('Cost cache: %d hits, %d misses', cost_fn.hits,
+                 cost_fn.misses)
+        ms.set_modelspec_metadata(improved_modelspec, 'cost_cache',
+                                  {'hits': cost_fn.hits,
+                                   'misses': cost_fn.misses})
 
     results = [copy.deepcopy(improved_modelspec)]
     return results
@@ -130,6 +231,71 @@ def fit_random_subsets(data, modelspec, nsplits=1, rebuild_every=10000):
                      metaname='fit_random_subsets')
 
 
+def fit_progressive_subsets(data, modelspec, start_fraction=0.125, growth=2,
+                            epoch_regex='^STIM_', seed=0, analysis=fit_basic,
+                            metaname='fit_progressive_subsets',
+                            **analysis_kwargs):
+    '''
+    Fits modelspec to a random subset of the epochs of data that grows
+    geometrically, finishing with a fit to all of data.
+
+    The first fit uses start_fraction of the epochs matching epoch_regex,
+    and each following fit starts from the result of the one before, once
+    its fitter has stopped improving, with growth times as many epochs,
+    until all of data is used. Each subset contains the one before, so that
+    the parameters carried over were already fit to part of it, and the
+    early fits, which take most of the steps, evaluate the model on a
+    fraction of the data. Unlike fit_random_subsets, the final parameters
+    are fit to the whole estimation set.
+
+    Subsets are selected with the mask (see Recording.and_mask), so they
+    combine with a mask already in data, and analysis, which applies it,
+    takes the same arguments as fit_basic (see **analysis_kwargs).
+
+    Returns
+    A list containing a single modelspec, with the fraction of epochs and
+    fit time of each stage in its 'subset_schedule' metadata.
+    '''
+    start_time = time.time()
+    if not 0 < start_fraction <= 1 or growth <= 1:
+        raise ValueError('Need 0 < start_fraction <= 1 and growth > 1')
+
+    sig = data['resp']
+    names = ep.epoch_names_matching(sig.epochs, epoch_regex)
+    if not names:
+        raise ValueError('No epochs match {}'.format(epoch_regex))
+    indices = np.concatenate([sig.get_epoch_indices(n) for n in names])
+    order = np.random.RandomState(seed).permutation(len(indices))
+
+    schedule = []
+    fraction = start_fraction
+    while True:
+        n = min(int(np.ceil(fraction * len(indices))), len(indices))
+        stage_start = time.time()
+        if n < len(indices):
+            subset = indices[np.sort(order[:n])]
+            if 'mask' in data.signals.keys():
+                stage_data = data.and_mask(subset)
+            else:
+                stage_data = data.or_mask(subset)
+            log.info('Fitting to %d of %d epochs', n, len(indices))
+        else:
+            stage_data = data
+            log.info('Fitting to all %d epochs', n)
+        modelspec = analysis(stage_data, modelspec, **analysis_kwargs)[0]
+        schedule.append({'fraction': n / len(indices),
+                         'fit_time': time.time() - stage_start})
+        if n == len(indices):
+            break
+        fraction *= growth
+
+    ms.set_modelspec_metadata(modelspec, 'fitter', metaname)
+    ms.set_modelspec_metadata(modelspec, 'fit_time', time.time() - start_time)
+    ms.set_modelspec_metadata(modelspec, 'subset_schedule', schedule)
+
+    return [modelspec]
+
+
 def fit_state_nfold(data_list, modelspecs, generate_psth=False,
                     fitter=scipy_minimize, metric=None,
                     fit_kwargs={}):
@@ -0,0 +1,73 @@
+import copy
+import logging
+import time
+
+import nems.modelspec as ms
+import nems.priors
+from nems.analysis.fit_basic import fit_basic
+
+log = logging.getLogger(__name__)
+
+
+def fit_coarse_to_fine(data, modelspec, factors=(4, 2, 1),
+                       analysis=fit_basic, method='filter',
+                       metaname='fit_coarse_to_fine', **analysis_kwargs):
+    '''
+    Fits modelspec to data at a sequence of decreasing time resolutions,
+    starting each stage from the parameters found at the stage before.
+
+    Every evaluation of the model at 1/q of the sampling rate of data
+    costs about 1/q as much, so most of the fitter's steps are taken on
+    the coarse data, and the fit at full resolution starts close to its
+    optimum and only has to refine it.
+
+    Required Arguments:
+     data          A recording object
+     modelspec     A modelspec object
+
+    Optional Arguments:
+     factors       Decimation factors of the stages, from coarsest to
+                   finest. Each must divide the sampling rate of data, and
+                   the last one must be 1 so that the result is fit to
+                   data as given.
+     analysis      A function of (data, modelspec, **analysis_kwargs) that
+                   returns a list of fitted modelspecs, such as fit_basic.
+     method        How data are resampled (see Recording.resample).
+
+    Returns
+    A list containing a single modelspec, with the decimation factor,
+    sampling rate and fit time of each stage in its 'coarse_to_fine'
+    metadata.
+    '''
+    start_time = time.time()
+    if not factors or factors[-1] != 1:
+        raise ValueError('The last stage of a coarse to fine fit must be '
+                         'at full resolution (factor 1)')
+
+    modelspec = copy.deepcopy(modelspec)
+    for i, m in enumerate(modelspec):
+        if ('phi' not in m.keys()) and ('prior' in m.keys()):
+            log.debug('Phi not found for module, using mean of prior: %s', m)
+            modelspec[i] = nems.priors.set_mean_phi([m])[0]
+
+    original = modelspec
+    fs = data['resp'].fs
+    stages = []
+    previous = 1
+    for q in factors:
+        stage_start = time.time()
+        template = ms.resample_modelspec(original, q)
+        modelspec = ms.resample_modelspec(modelspec, q / previous,
+                                          like=template)
+        stage_data = data if q == 1 else data.resample(fs / q, method)
+        log.info('Fitting at %g Hz (1/%d of the sampling rate)', fs / q, q)
+        modelspec = analysis(stage_data, modelspec, **analysis_kwargs)[0]
+        stages.append({'factor': q, 'fs': fs / q,
+                       'fit_time': time.time() - stage_start})
+        previous = q
+
+    ms.set_modelspec_metadata(modelspec, 'fitter', metaname)
+    ms.set_modelspec_metadata(modelspec, 'fit_time', time.time() - start_time)
+    ms.set_modelspec_metadata(modelspec, 'coarse_to_fine', stages)
+
+    return [modelspec]
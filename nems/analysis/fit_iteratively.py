@@ -7,9 +7,12 @@ import numpy as np
 
 from nems.fitters.api import coordinate_descent
 from nems.analysis.cost_functions import basic_cost
+from nems.fitters.checkpoint import Checkpoint
+from nems.fitters.util import accepts_kwarg
 import nems.fitters.mappers
 import nems.metrics.api
 import nems.modelspec as ms
+import nems.profiling
 
 log = logging.getLogger(__name__)
 
@@ -18,7 +21,7 @@ def fit_module_sets(
         data, modelspec,
         cost_function=basic_cost, evaluator=ms.evaluate,
         segmentor=nems.segmentors.use_all_data,
-        mapper=nems.fitters.mappers.simple_vector,
+        mapper=nems.fitters.mappers.compiled_vector,
         metric=lambda data: nems.metrics.api.nmse(data, 'pred', 'resp'),
         fitter=coordinate_descent, fit_kwargs={}, metaname='fit_module_sets',
         module_sets=None, invert=False, tolerance=1e-4, max_iter=1000
@@ -60,6 +63,7 @@ def fit_module_sets(
     if invert:
         module_sets = _invert_subsets(modelspec, module_sets)
 
+    mapper = nems.fitters.mappers.compile_mapper(mapper, modelspec)
     ms.fit_mode_on(modelspec)
     start_time = time.time()
 
@@ -96,7 +100,8 @@ def _invert_subsets(modelspec, module_sets):
 
 
 def _module_set_loop(subset, data, modelspec, cost_function, fitter,
-                     mapper, segmentor, evaluator, metric, fit_kwargs):
+                     mapper, segmentor, evaluator, metric, fit_kwargs,
+                     checkpoint=None, stepinfo=None):
         log.info("Fitting subset: %s", subset)
         mods = [m['fn'] for i, m in enumerate(modelspec) if i in subset]
         log.info("%s\n", mods)
@@ -111,8 +116,20 @@ def _module_set_loop(subset, data, modelspec, cost_function, fitter,
                           metric=metric)
         sigma = packer(modelspec)
         bounds = pack_bounds(modelspec)
-
+        if checkpoint is not None:
+            cost_fn = checkpoint.watch(cost_fn)
+            if accepts_kwarg(fitter, 'checkpoint'):
+                fit_kwargs = dict(fit_kwargs, checkpoint=checkpoint)
+            sigma = checkpoint.resume_sigma(sigma)
+
+        if stepinfo is not None and accepts_kwarg(fitter, 'stepinfo'):
+            fit_kwargs = dict(fit_kwargs, stepinfo=stepinfo)
         improved_sigma = fitter(sigma, cost_fn, bounds=bounds, **fit_kwargs)
+        if checkpoint is not None:
+            if cost_function.error is None:
+                # resumed a fitter that had already finished
+                cost_fn(improved_sigma)
+            checkpoint.update(sigma=None, err=None)
         improved_modelspec = unpacker(improved_sigma)
 
         return improved_modelspec
@@ -123,11 +140,11 @@ def fit_iteratively(
         cost_function=basic_cost,
         fitter=coordinate_descent, evaluator=ms.evaluate,
         segmentor=nems.segmentors.use_all_data,
-        mapper=nems.fitters.mappers.simple_vector,
+        mapper=nems.fitters.mappers.compiled_vector,
         metric=lambda data: nems.metrics.api.nmse(data, 'pred', 'resp'),
         metaname='fit_basic', fit_kwargs={},
         module_sets=None, invert=False, tolerances=None, tol_iter=50,
-        fit_iter=10,
+        fit_iter=10, profile=False, checkpoint=None
         ):
     '''
     Required Arguments:
@@ -152,6 +169,15 @@ def fit_iteratively(
      invert        Boolean. Causes module_sets to specify the model indices
                    that should *not* be fit.
 
+     profile       If True, record per-module and per-step timing during
+                   the fit (see nems.profiling) and store the table in the
+                   'profile' metadata of the returned modelspec.
+
+     checkpoint    A nems.fitters.checkpoint.Checkpoint, or the path of
+                   one, where the parameters, the tolerance, iteration and
+                   module set being fit, and the state of the fitter are
+                   kept during the fit. If it exists, the fit resumes from
+                   it, and it is removed once the fit is done.
 
     Returns
     A list containing a single modelspec, which has the best parameters found
@@ -188,42 +214,91 @@ def fit_iteratively(
             log.debug('Phi not found for module, using mean of prior: {}'
                       .format(m))
             modelspec[i] = m
+    # the layout of the fit vector is the same for every module set
+    mapper = nems.fitters.mappers.compile_mapper(mapper, modelspec)
 
     error = np.inf
-    for tol in tolerances:
-        log.info("Fitting subsets with tol: %.2E fit_iter %d tol_iter %d",
-                 tol, fit_iter, tol_iter)
-        fit_kwargs.update({'tolerance': tol, 'max_iter': fit_iter})
-        max_error_reduction = np.inf
-        i = 0
-
-        while (max_error_reduction >= tol) and (i < tol_iter):
-            max_error_reduction = 0
-            j = 0
-            for subset in module_sets:
-                improved_modelspec = _module_set_loop(
-                        subset, data, modelspec, cost_function, fitter,
-                        mapper, segmentor, evaluator, metric, fit_kwargs
-                        )
-                new_error = cost_function.error
-                error_reduction = error-new_error
-                error = new_error
-                j += 1
-                if error_reduction > max_error_reduction:
-                    max_error_reduction = error_reduction
-            log.info("tol=%.2E, iter=%d/%d: max deltaE=%.6E",
-                     tol, i, tol_iter, max_error_reduction)
-            i += 1
-        log.info("Done with tol %.2E (i=%d, max_error_reduction %.7f)",
-                 tol, i, error_reduction)
+    error_reduction = np.inf
+    improved_modelspec = modelspec
+    stepinfo = {}
+    resume = None
+    if checkpoint is not None:
+        if isinstance(checkpoint, str):
+            checkpoint = Checkpoint(checkpoint)
+        checkpoint.match(modelspec, data)
+        full_packer, full_unpacker, _ = mapper(modelspec)
+        resume = checkpoint.get('position')
+        if resume is not None:
+            log.info("Resuming at tol %.2E, iter %d, subset %d",
+                     tolerances[resume['tolerance']], resume['iteration'],
+                     resume['subset'])
+            full_unpacker(checkpoint.get('phi'))
+            error = resume['error']
+
+    if profile:
+        nems.profiling.enable()
+    try:
+        for t, tol in enumerate(tolerances):
+            if resume is not None and t < resume['tolerance']:
+                continue
+            log.info("Fitting subsets with tol: %.2E fit_iter %d tol_iter %d",
+                     tol, fit_iter, tol_iter)
+            fit_kwargs.update({'tolerance': tol, 'max_iter': fit_iter})
+            max_error_reduction = np.inf
+            i = 0
+            if resume is not None:
+                i = resume['iteration']
+
+            while (max_error_reduction >= tol) and (i < tol_iter):
+                max_error_reduction = 0
+                first = 0
+                if resume is not None:
+                    max_error_reduction = resume['max_error_reduction']
+                    first = resume['subset']
+                    resume = None
+                for j, subset in enumerate(module_sets[first:], first):
+                    improved_modelspec = _module_set_loop(
+                            subset, data, modelspec, cost_function, fitter,
+                            mapper, segmentor, evaluator, metric, fit_kwargs,
+                            checkpoint, stepinfo
+                            )
+                    new_error = cost_function.error
+                    error_reduction = error-new_error
+                    error = new_error
+                    if error_reduction > max_error_reduction:
+                        max_error_reduction = error_reduction
+                    if checkpoint is not None:
+                        checkpoint.update(phi=np.array(full_packer(modelspec)),
+                                          position={
+                            'tolerance': t, 'iteration': i, 'subset': j + 1,
+                            'error': error,
+                            'max_error_reduction': max_error_reduction})
+                        checkpoint.save()
+                log.info("tol=%.2E, iter=%d/%d: max deltaE=%.6E",
+                         tol, i, tol_iter, max_error_reduction)
+                i += 1
+            log.info("Done with tol %.2E (i=%d, max_error_reduction %.7f)",
+                     tol, i, error_reduction)
+    finally:
+        # leave global profiling off even if a module set fit raised
+        if profile:
+            stats = nems.profiling.finish_fit(time.time() - start_time)
+
+    if checkpoint is not None:
+        checkpoint.clear()
 
     elapsed_time = (time.time() - start_time)
+    if profile:
+        ms.set_modelspec_metadata(improved_modelspec, 'profile', stats)
 
     # TODO: Should this maybe be moved to a higher level
     # so it applies to ALL the fittters?
     ms.fit_mode_off(improved_modelspec)
     ms.set_modelspec_metadata(improved_modelspec, 'fitter', metaname)
     ms.set_modelspec_metadata(improved_modelspec, 'fit_time', elapsed_time)
+    # of the last module set fit
+    ms.set_modelspec_metadata(improved_modelspec, 'stop_reason',
+                              stepinfo.get('stop_reason'))
     results = [copy.deepcopy(improved_modelspec)]
 
     return results
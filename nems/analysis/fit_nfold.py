@@ -12,11 +12,15 @@ log = logging.getLogger(__name__)
 def fit_nfold(data_list, modelspecs, generate_psth=False,
               fitter=scipy_minimize, analysis='fit_basic',
               metric=None, tolerances=None, module_sets=None,
-              tol_iter=100, fit_iter=20, fit_kwargs={}):
+              tol_iter=100, fit_iter=20, fit_kwargs={},
+              residual_metric=None):
     '''
     Takes njacks jackknifes, where each jackknife has some small
     fraction of data NaN'd out, and fits modelspec to them.
 
+    residual_metric is passed to fit_basic, for least-squares fitters; it
+    is not supported by fit_iteratively.
+
     TESTING:
     if input len(modelspecs) == len(data_list) then use each
       modelspec as initial condition for corresponding data_list fold
@@ -43,7 +47,8 @@ def fit_nfold(data_list, modelspecs, generate_psth=False,
                                 fitter=fitter,
                                 metric=metric,
                                 metaname='fit_nfold',
-                                fit_kwargs=fit_kwargs)
+                                fit_kwargs=fit_kwargs,
+                                residual_metric=residual_metric)
         elif analysis == 'fit_iteratively':
             models += fit_iteratively(
                         data_list[i], copy.deepcopy(modelspecs[msidx]),
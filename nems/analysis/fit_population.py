@@ -0,0 +1,133 @@
+import copy
+import logging
+import time
+from functools import partial
+
+import numpy as np
+
+from nems.analysis.cost_functions import population_cost
+from nems.fitters.api import block_coordinate_descent
+from nems.fitters.util import accepts_kwarg
+import nems.fitters.mappers
+import nems.metrics.api as metrics
+import nems.modelspec as ms
+import nems.priors
+import nems.segmentors
+
+log = logging.getLogger(__name__)
+
+
+def population_blocks(modelspec, n_units,
+                      mapper=nems.fitters.mappers.compiled_vector):
+    '''
+    Returns, for each element of the fit vector that mapper packs from
+    modelspec, the response channel (unit) it belongs to.
+
+    Every parameter must have one row per unit, i.e. a first dimension of
+    n_units, as keywords substituted with .R or xR do (e.g.
+    wc.18xR-fir.1x15xR-lvl.R-dexp.R). Raises ValueError otherwise. Row i is
+    assumed to act only on channel i, which is the case for weight
+    channels from the stimulus, FIR filter banks, level shifts, STP and
+    the static nonlinearities.
+    '''
+    template = copy.deepcopy(modelspec)
+    for m in template:
+        if m['fn'] == 'nems.modules.fir.basic' and n_units > 1:
+            raise ValueError('nems.modules.fir.basic sums its filters into '
+                             'one channel, use a filter bank (fir.1xNxR)')
+        for k, v in m.get('phi', {}).items():
+            v = np.asarray(v)
+            if v.ndim == 0 or v.shape[0] != n_units:
+                raise ValueError('{} of {} is not one row per unit ({} units)'
+                                 .format(k, m['fn'], n_units))
+            rows = np.arange(n_units).reshape((-1,) + (1,) * (v.ndim - 1))
+            m['phi'][k] = np.broadcast_to(rows, v.shape).astype(float)
+    packer, _, _ = mapper(template)
+    return np.asarray(packer(template)).astype(int)
+
+
+def fit_population(data, modelspec, fitter=block_coordinate_descent,
+                   segmentor=nems.segmentors.use_all_data,
+                   mapper=nems.fitters.mappers.compiled_vector,
+                   metric=metrics.nmse_batch, metaname='fit_population',
+                   fit_kwargs={}, evaluator=ms.evaluate):
+    '''
+    Fits every response channel of data at once with a modelspec that has
+    an independent set of parameters for each channel (see
+    population_blocks), instead of fitting each unit separately.
+
+    The stimulus is loaded and passed through the model once for all
+    units, and the fitter is given one error per unit, so that it can
+    treat each unit's parameters as an independent block: a probe of
+    block_coordinate_descent steps one parameter of every unit at once.
+
+    Required Arguments:
+     data          A recording object
+     modelspec     A modelspec object with one row of parameters per unit
+
+    Optional Arguments:
+     fitter        A function of (sigma, costfn, blocks) where costfn
+                   returns one error per block, such as
+                   block_coordinate_descent.
+     metric        A batch metric such as metrics.nmse_batch, used to score
+                   each unit as one member of the batch.
+     segmentor, mapper, evaluator
+                   As for fit_basic.
+
+    Returns
+    A list containing a single modelspec, with the error of each unit in
+    its 'unit_errors' metadata.
+    '''
+    start_time = time.time()
+
+    modelspec = copy.deepcopy(modelspec)
+    for i, m in enumerate(modelspec):
+        if ('phi' not in m.keys()) and ('prior' in m.keys()):
+            log.debug('Phi not found for module, using mean of prior: %s',
+                      m)
+            modelspec[i] = nems.priors.set_mean_phi([m])[0]
+
+    if 'mask' in data.signals.keys():
+        log.info("Data len pre-mask: %d", data['mask'].shape[1])
+        data = data.apply_mask()
+        log.info("Data len post-mask: %d", data['mask'].shape[1])
+
+    ms.fit_mode_on(modelspec)
+
+    units = data['resp'].chans
+    n_units = data['resp'].nchans
+    packer, unpacker, pack_bounds = mapper(modelspec)
+    blocks = population_blocks(modelspec, n_units, mapper)
+    log.info('Fitting %d units, %d parameters each', n_units,
+             np.bincount(blocks).max())
+
+    population_cost.counter = 0
+    cost_fn = partial(population_cost, unpacker=unpacker, data=data,
+                      segmentor=segmentor, evaluator=evaluator,
+                      metric=metric)
+
+    sigma = packer(modelspec)
+    bounds = pack_bounds(modelspec)
+    stepinfo = {}
+    if accepts_kwarg(fitter, 'stepinfo'):
+        fit_kwargs = dict(fit_kwargs, stepinfo=stepinfo)
+    improved_sigma = fitter(sigma, cost_fn, blocks=blocks, bounds=bounds,
+                            **fit_kwargs)
+    unit_errors = cost_fn(improved_sigma)
+    improved_modelspec = unpacker(improved_sigma)
+
+    elapsed_time = (time.time() - start_time)
+    ms.fit_mode_off(improved_modelspec)
+    ms.set_modelspec_metadata(improved_modelspec, 'fitter', metaname)
+    ms.set_modelspec_metadata(improved_modelspec, 'fit_time', elapsed_time)
+    ms.set_modelspec_metadata(improved_modelspec, 'n_parms',
+                              len(improved_sigma))
+    ms.set_modelspec_metadata(improved_modelspec, 'stop_reason',
+                              stepinfo.get('stop_reason'))
+    ms.set_modelspec_metadata(improved_modelspec, 'n_evals',
+                              stepinfo.get('n_evals'))
+    ms.set_modelspec_metadata(improved_modelspec, 'units', list(units or []))
+    ms.set_modelspec_metadata(improved_modelspec, 'unit_errors',
+                              [float(e) for e in unit_errors])
+
+    return [copy.deepcopy(improved_modelspec)]
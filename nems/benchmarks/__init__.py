@@ -0,0 +1,6 @@
+'''
+Benchmarks of NEMS hot paths on synthetic recordings.
+
+See nems.benchmarks.suite for the timing cases, and run
+`python -m nems.benchmarks --help` for the command line interface.
+'''
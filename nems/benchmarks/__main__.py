@@ -0,0 +1,3 @@
+from nems.benchmarks.suite import main
+
+main()
@@ -0,0 +1,240 @@
+'''
+Timing suite for the hot paths of a typical NEMS fit.
+
+Each case is timed on synthetic recordings (see nems.benchmarks.synthetic)
+of one or more preset sizes, and the results are returned as a
+JSON-friendly dict that can be saved with save_results() and compared
+against an earlier run with compare_results(). From the command line:
+
+    python -m nems.benchmarks --sizes small medium --output bench.json
+    python -m nems.benchmarks --compare old.json --output new.json
+'''
+
+import copy
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import nems.epoch as ep
+import nems.modelspec as ms
+import nems.priors
+import nems.utils
+from nems.analysis.api import fit_basic, generate_prediction, \
+    standard_correlation
+from nems.analysis.cost_functions import basic_cost
+from nems.benchmarks.synthetic import SIZES, synthetic_recording
+from nems.initializers import from_keywords
+from nems.preprocessing import mask_est_val_for_jackknife
+from nems.recording import Recording
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MODELS = [
+    'wc.18x1-fir.1x15-lvl.1-dexp.1',
+    'wc.18x1-stp.1-fir.1x15-lvl.1-dexp.1',
+    'wc.18x1-fir.1x15-lvl.1-dexp.1-stategain.S',
+]
+
+# Cases run for each model, named <case><keyword_string>
+MODEL_CASES = ['evaluate:', 'fit_basic:', 'standard_correlation:']
+
+
+def time_call(fn, repeat=3):
+    '''
+    Calls fn() `repeat` times and returns a dict with the min, mean and max
+    wall time in seconds. The minimum is the most stable estimate; the
+    others are affected by whatever else the machine is doing.
+    '''
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {'min': min(times), 'mean': float(np.mean(times)),
+            'max': max(times), 'repeat': repeat}
+
+
+def _recording_cases(rec, workdir, njacks, wanted):
+    resp = rec['resp']
+    stim_epochs = ep.epoch_names_matching(resp.epochs, '^STIM_')
+    targz = os.path.join(workdir, rec.name + '.tar.gz')
+    # Only do the (untimed) setup of the cases that will be run
+    per_stim = None
+    if wanted('replace_epochs'):
+        folded = resp.extract_epochs(stim_epochs)
+        per_stim = {k: np.nanmean(v, axis=0) for k, v in folded.items()}
+    if wanted('recording_load'):
+        rec.save_targz(targz)
+
+    return [
+        ('recording_save', lambda: rec.save_targz(targz)),
+        ('recording_load', lambda: Recording.load(targz)),
+        ('extract_epochs', lambda: resp.extract_epochs(stim_epochs)),
+        ('replace_epochs', lambda: resp.replace_epochs(per_stim)),
+        ('jackknife', lambda: mask_est_val_for_jackknife(
+                rec, epoch_name='TRIAL', njacks=njacks)),
+    ]
+
+
+def _model_cases(rec, keyword_string, fit_iter):
+    modelspec = from_keywords(keyword_string, rec=rec)
+    modelspec = nems.priors.set_mean_phi(modelspec)
+    est, val = rec.split_at_time(0.8)
+
+    def fit():
+        fit_basic(est, modelspec, fit_kwargs={'max_iter': fit_iter})
+
+    def correlation():
+        new_est, new_val = generate_prediction(est, val, [modelspec])
+        standard_correlation(new_est, new_val, [copy.deepcopy(modelspec)])
+
+    fns = [lambda: ms.evaluate(rec, modelspec), fit, correlation]
+    return [(c + keyword_string, fn) for c, fn in zip(MODEL_CASES, fns)]
+
+
+def run_benchmarks(sizes=('small',), models=DEFAULT_MODELS, repeat=3,
+                   fit_iter=10, njacks=5, cases=None):
+    '''
+    Runs the suite and returns the results.
+
+    Parameters
+    ----------
+    sizes : list of str
+        Keys of nems.benchmarks.synthetic.SIZES.
+    models : list of str
+        Keyword strings to evaluate and fit. `.S` and `.N` substitutions
+        are resolved against the synthetic recording.
+    repeat : int
+        Number of timed repetitions of each case.
+    fit_iter : int
+        max_iter passed to the fitter in the fit_basic cases.
+    njacks : int
+        Number of jackknifes generated in the jackknife case.
+    cases : list of str, optional
+        If given, only run cases whose name starts with one of these.
+
+    Returns
+    -------
+    results : dict
+        {'meta': {...environment...}, 'results': [{'size', 'case',
+        'n_times', 'min', 'mean', 'max', 'repeat', 'throughput'}, ...]}
+        where throughput is time bins processed per second (based on min).
+    '''
+    def wanted(name):
+        return not cases or any(name.startswith(c) for c in cases)
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix='nems_bench_')
+    try:
+        for size in sizes:
+            rec = synthetic_recording(name='synthetic_' + size, **SIZES[size])
+            n_times = rec['resp'].shape[1]
+            todo = _recording_cases(rec, workdir, njacks, wanted)
+            for kw in models:
+                # Skip building (and fitting) modelspecs nobody asked for
+                if any(wanted(c + kw) for c in MODEL_CASES):
+                    todo.extend(_model_cases(rec, kw, fit_iter))
+
+            for name, fn in todo:
+                if not wanted(name):
+                    continue
+                basic_cost.counter = 0
+                timing = time_call(fn, repeat=repeat)
+                entry = {'size': size, 'case': name, 'n_times': n_times}
+                entry.update(timing)
+                entry['throughput'] = n_times / timing['min']
+                if name.startswith('fit_basic:'):
+                    evals = basic_cost.counter / repeat
+                    entry['cost_evals'] = evals
+                    entry['time_per_eval'] = timing['min'] / max(evals, 1)
+                log.info('%s %s: %.4f s', size, name, timing['min'])
+                results.append(entry)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    meta = {
+        'date': nems.utils.iso8601_datestring(),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'fit_iter': fit_iter,
+    }
+    return {'meta': meta, 'results': results}
+
+
+def save_results(results, path):
+    '''Writes the output of run_benchmarks() to a JSON file.'''
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def load_results(path):
+    '''Reads a JSON file written by save_results().'''
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare_results(baseline, current, threshold=1.2):
+    '''
+    Compares two outputs of run_benchmarks() case by case.
+
+    Returns a list of (size, case, baseline_min, current_min, ratio) for
+    every case present in both, sorted by ratio (slowest first). Cases with
+    ratio > threshold are logged as regressions.
+    '''
+    old = {(r['size'], r['case']): r['min'] for r in baseline['results']}
+    rows = []
+    for r in current['results']:
+        key = (r['size'], r['case'])
+        if key in old:
+            ratio = r['min'] / old[key] if old[key] else np.inf
+            rows.append((r['size'], r['case'], old[key], r['min'], ratio))
+    rows.sort(key=lambda row: row[-1], reverse=True)
+    for size, case, before, after, ratio in rows:
+        if ratio > threshold:
+            log.warning('Regression in %s %s: %.4f s -> %.4f s (x%.2f)',
+                        size, case, before, after, ratio)
+    return rows
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Run NEMS benchmarks')
+    parser.add_argument('--sizes', nargs='+', default=['small'],
+                        choices=sorted(SIZES.keys()))
+    parser.add_argument('--models', nargs='+', default=DEFAULT_MODELS)
+    parser.add_argument('--cases', nargs='+', default=None,
+                        help='only run cases starting with these names')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--fit-iter', type=int, default=10)
+    parser.add_argument('--output', default=None,
+                        help='JSON file to write results to')
+    parser.add_argument('--compare', default=None,
+                        help='JSON file of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    results = run_benchmarks(sizes=args.sizes, models=args.models,
+                             repeat=args.repeat, fit_iter=args.fit_iter,
+                             cases=args.cases)
+    for r in results['results']:
+        print('{size:<8} {case:<60} {min:>10.4f} s'.format(**r))
+    if args.output:
+        save_results(results, args.output)
+    if args.compare:
+        for size, case, before, after, ratio in compare_results(
+                load_results(args.compare), results):
+            print('{:<8} {:<60} x{:.2f}'.format(size, case, ratio))
+
+
+if __name__ == '__main__':
+    main()
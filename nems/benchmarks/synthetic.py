@@ -0,0 +1,139 @@
+'''
+Synthetic recordings for benchmarking.
+
+The recordings produced here mimic the structure of a typical NEMS
+recording (a spectrogram-like 'stim', spiking 'resp' units and a 'state'
+signal with a pupil-like channel) with trial epochs in the usual
+PreStimSilence / STIM_xx / PostStimSilence layout, so that the same code
+paths are exercised as when fitting real data.
+'''
+
+import numpy as np
+import pandas as pd
+
+from nems.recording import Recording
+from nems.signal import RasterizedSignal
+
+# Named presets for synthetic_recording(**SIZES[name]).
+SIZES = {
+    'small': {'n_stim': 10, 'n_reps': 5},
+    'medium': {'n_stim': 30, 'n_reps': 10},
+    'large': {'n_stim': 60, 'n_reps': 20},
+}
+
+
+def synthetic_epochs(n_stim, n_reps, pre=0.5, dur=1.0, post=0.5, seed=0):
+    '''
+    Returns an epochs DataFrame for n_stim unique stimuli, each presented
+    n_reps times in random order. Every trial is tagged TRIAL and
+    REFERENCE and split into PreStimSilence, STIM_xx and PostStimSilence.
+
+    Returns
+    -------
+    epochs : pandas.DataFrame
+        With columns start, end, name (times in seconds).
+    order : numpy.ndarray
+        The stimulus index presented on each trial.
+    '''
+    rng = np.random.RandomState(seed)
+    order = np.tile(np.arange(n_stim), n_reps)
+    rng.shuffle(order)
+
+    trial_len = pre + dur + post
+    rows = []
+    for trial, stim_idx in enumerate(order):
+        t0 = trial * trial_len
+        t1 = t0 + trial_len
+        stim_name = 'STIM_{:03d}'.format(stim_idx)
+        rows.extend([
+            (t0, t1, 'TRIAL'),
+            (t0, t1, 'REFERENCE'),
+            (t0, t1, stim_name),
+            (t0, t0 + pre, 'PreStimSilence'),
+            (t1 - post, t1, 'PostStimSilence'),
+        ])
+    epochs = pd.DataFrame(rows, columns=['start', 'end', 'name'])
+    return epochs, order
+
+
+def synthetic_recording(n_stim=10, n_reps=5, n_chans=18, n_units=1,
+                        n_state=1, fs=100, pre=0.5, dur=1.0, post=0.5,
+                        n_lags=15, name='synthetic', seed=0):
+    '''
+    Generates a Recording with signals 'stim', 'resp' and 'state'.
+
+    The stimulus is a fixed random spectrogram per unique stimulus (so
+    repetitions are identical, as with real data), and each response unit
+    is a rectified linear STRF of the stimulus scaled by a slowly varying
+    pupil-like state, with Poisson noise. The 'state' signal has a constant
+    baseline channel followed by n_state random-walk channels.
+
+    Parameters
+    ----------
+    n_stim, n_reps : int
+        Number of unique stimuli and repetitions of each.
+    n_chans : int
+        Number of stimulus (spectral) channels.
+    n_units : int
+        Number of response channels.
+    n_state : int
+        Number of state channels, not counting the baseline.
+    fs : int
+        Sampling rate of all signals.
+    pre, dur, post : float
+        Duration (seconds) of the silence and stimulus segments of a trial.
+    n_lags : int
+        Number of time lags in the STRF used to generate the responses.
+
+    Returns
+    -------
+    rec : Recording
+    '''
+    rng = np.random.RandomState(seed)
+    epochs, order = synthetic_epochs(n_stim, n_reps, pre, dur, post, seed)
+
+    pre_bins = int(round(pre * fs))
+    dur_bins = int(round(dur * fs))
+    post_bins = int(round(post * fs))
+    trial_bins = pre_bins + dur_bins + post_bins
+    n_times = trial_bins * len(order)
+
+    # One spectrogram per unique stimulus, tiled out in presentation order.
+    templates = np.zeros((n_stim, n_chans, trial_bins))
+    templates[:, :, pre_bins:pre_bins+dur_bins] = \
+        rng.gamma(1.0, 1.0, size=(n_stim, n_chans, dur_bins))
+    stim = np.concatenate([templates[i] for i in order], axis=1)
+
+    state = np.ones((n_state + 1, n_times))
+    if n_state:
+        walk = np.cumsum(rng.normal(0, 1, size=(n_state, n_times)), axis=1)
+        walk -= walk.mean(axis=1, keepdims=True)
+        walk /= walk.std(axis=1, keepdims=True) + 1e-12
+        state[1:, :] = walk
+
+    strf = rng.normal(0, 1, size=(n_units, n_chans, n_lags))
+    strf *= np.exp(-np.arange(n_lags) / (n_lags / 3))
+    drive = np.zeros((n_units, n_times))
+    for u in range(n_units):
+        for lag in range(n_lags):
+            drive[u, lag:] += strf[u, :, lag] @ stim[:, :n_times-lag]
+    drive /= (drive.std(axis=1, keepdims=True) + 1e-12)
+    gain = 1 + 0.2 * state[1] if n_state else 1
+    rate = np.maximum(drive * gain, 0) + 0.1
+    resp = rng.poisson(rate).astype(float)
+
+    chans = ['{:d}'.format(c) for c in range(n_chans)]
+    state_chans = ['baseline'] + ['pupil'] + \
+        ['state{:d}'.format(s) for s in range(1, n_state)]
+    signals = {
+        'stim': RasterizedSignal(fs, stim, 'stim', name, chans=chans,
+                                 epochs=epochs),
+        'resp': RasterizedSignal(fs, resp, 'resp', name,
+                                 chans=['unit{:d}'.format(u)
+                                        for u in range(n_units)],
+                                 epochs=epochs),
+        'state': RasterizedSignal(fs, state, 'state', name,
+                                  chans=state_chans[:n_state+1],
+                                  epochs=epochs),
+    }
+    return Recording(signals)
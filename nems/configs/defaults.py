@@ -61,7 +61,7 @@ XFORMS_PLUGINS = []
 ################################################################################
 def configure_logging(filename=None):
     # Actual configuration needs to be done inside this function (called by
-    # init_settings) so that values in the NEMS_CONFIG file can override these.
+    # init_logging) so that values in the NEMS_CONFIG file can override these.
     config = {
         'version': 1,
         'formatters': {
@@ -102,13 +102,11 @@ def configure_logging(filename=None):
     logging.config.dictConfig(config)
 
 
-def init_settings():
+def init_logging():
+    # Called by __init__.py on import, with the logging settings already
+    # resolved against settings.py and the environment.
     log = logging.getLogger(__name__)
-
-    # This code is called by __init__.py after extra configuration files
-    # (specified by NEMS_CONFIG) are loaded. This ensures that all variables are
-    # set properly.
-    if NEMS_LOG_FILENAME is not None:
+    if NEMS_LOG_FILENAME:
         log_filename = os.path.join(NEMS_LOG_ROOT, NEMS_LOG_FILENAME)
         os.makedirs(NEMS_LOG_ROOT, exist_ok=True)
         # make LOG directory world-writeable
@@ -121,6 +119,12 @@ def init_settings():
     else:
         configure_logging()
 
+
+def init_settings():
+    # This code is called by __init__.py after extra configuration files
+    # (specified by NEMS_CONFIG) are loaded. This ensures that all variables are
+    # set properly. Logging was already set up by init_logging.
+
     # Log the settings to facilitate debugging. By convention, settings are in
     # all caps, so only log those variables.
     log = logging.getLogger(__name__)
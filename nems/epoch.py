@@ -1,6 +1,7 @@
 from functools import wraps
 import re
 import warnings
+import weakref
 
 import numpy as np
 import pandas as pd
@@ -444,17 +445,90 @@ def verify_epoch_integrity(epoch):
     raise NotImplementedError
 
 
+class EpochIndex:
+    '''
+    Read-only lookup structure for an epochs DataFrame: the names as a
+    pandas Categorical, start and end times as float64 arrays, and the row
+    positions of every name, so that looking up an epoch by name does not
+    scan the whole table. Use epoch_index() rather than building one
+    directly, since it is shared by everything referencing the same
+    DataFrame.
+    '''
+    def __init__(self, epochs):
+        self._name_values = np.array(epochs['name'].values, dtype=object)
+        self.names = pd.Categorical(self._name_values)
+        self.start = np.array(epochs['start'].values, dtype=float)
+        self.end = np.array(epochs['end'].values, dtype=float)
+
+        codes = self.names.codes
+        order = np.argsort(codes, kind='stable')
+        splits = np.searchsorted(codes[order],
+                                 np.arange(len(self.names.categories) + 1))
+        self._rows = {name: order[splits[i]:splits[i+1]]
+                      for i, name in enumerate(self.names.categories)}
+
+    def describes(self, epochs):
+        '''
+        True if epochs still holds the rows this index was built from.
+        Much cheaper than building a new index.
+        '''
+        return (len(epochs) == len(self.start) and
+                np.array_equal(epochs['start'].values, self.start,
+                               equal_nan=True) and
+                np.array_equal(epochs['end'].values, self.end,
+                               equal_nan=True) and
+                np.array_equal(epochs['name'].values, self._name_values))
+
+    def unique_names(self):
+        return list(self.names.categories)
+
+    def rows(self, name):
+        '''Row positions (in table order) of all epochs called name.'''
+        return self._rows.get(name, np.empty(0, dtype=int))
+
+    def bounds(self, name):
+        '''(start, end) of all epochs called name, as an Nx2 array.'''
+        rows = self.rows(name)
+        return np.stack([self.start[rows], self.end[rows]], axis=1)
+
+
+# EpochIndex of each live epochs DataFrame, keyed by id(). Signals treat
+# their epochs as immutable (new epochs always produce a new DataFrame), but
+# nothing stops a caller from editing a table in place, so a cached index is
+# checked against the table's contents before it is reused.
+_epoch_indices = {}
+
+
+def _forget_epoch_index(key, ref):
+    entry = _epoch_indices.get(key)
+    if entry is not None and entry[0] is ref:
+        del _epoch_indices[key]
+
+
+def epoch_index(epochs):
+    '''
+    Returns the EpochIndex for an epochs DataFrame, building it on first
+    use and again if the DataFrame was modified in place. It is discarded
+    when the DataFrame is garbage collected.
+    '''
+    key = id(epochs)
+    entry = _epoch_indices.get(key)
+    if entry is not None and entry[0]() is epochs and \
+            entry[1].describes(epochs):
+        return entry[1]
+    index = EpochIndex(epochs)
+    ref = weakref.ref(epochs, lambda r, key=key: _forget_epoch_index(key, r))
+    _epoch_indices[key] = (ref, index)
+    return index
+
+
 def epoch_names_matching(epochs, regex_str):
     '''
     Returns a list of epoch names that regex match the regex_str.
     '''
     r = re.compile(regex_str)
-    names = epochs['name'].tolist()
-    matches = filter(r.match, names)
-
-    # convert to list
-    matches = [name for name in matches]
-    matches = list(set(matches))  # unique values
+    names = epoch_index(epochs).unique_names()
+    matches = [name for name in names if r.match(name)]
     matches.sort()
 
     return matches
@@ -1 +1,2 @@
-from .fitter import dummy_fitter, coordinate_descent, scipy_minimize
+from .fitter import (dummy_fitter, coordinate_descent, scipy_minimize,
+                     block_coordinate_descent, least_squares)
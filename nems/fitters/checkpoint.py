@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from nems.uri import NumpyEncoder, json_numpy_obj_hook
+
+log = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    '''
+    The state of a fit in progress, kept in a JSON file so that a fit that
+    is interrupted can be restarted from where it was rather than from the
+    beginning.
+
+    Each part of the fit stores its own entries with update(): the
+    analysis its position (e.g. the tolerance and module set of
+    fit_iteratively), the cost function the best sigma it has seen (see
+    watch) and the fitter its own state (e.g. the step size of
+    coordinate_descent). The file is written by tick(), called once per
+    cost function evaluation, every `every` evaluations and/or every
+    `interval` seconds, and by save(). If the file exists when a
+    Checkpoint is created, its entries are loaded, and each part of the
+    fit resumes from them, unless the analysis finds with match() that
+    they were saved for a different fit. Once the fit is done, clear()
+    removes the file.
+
+    Example:
+        checkpoint = Checkpoint('/scratch/fit.ckpt', interval=600)
+        fit_iteratively(rec, modelspec, checkpoint=checkpoint)
+    '''
+
+    def __init__(self, path, every=None, interval=None):
+        if every is None and interval is None:
+            interval = 300
+        self.path = path
+        self.every = every
+        self.interval = interval
+        self.state = {}
+        self._evals = 0
+        self._saved_at = time.time()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.state = json.load(f, object_hook=json_numpy_obj_hook)
+            log.info('Resuming fit from checkpoint %s', path)
+
+    def match(self, modelspec, data):
+        '''
+        Ties the checkpoint to a fit: the modules and parameter shapes of
+        modelspec and the shapes of the signals in data. A state loaded
+        from a file that was saved for a different fit (or that does not
+        say which fit it was saved for) is discarded rather than resumed.
+        '''
+        # lists of [name, shape] rather than dicts, which json_numpy_obj_hook
+        # would turn into arrays if a name is e.g. 'mean'
+        fingerprint = {
+            'fn': [m['fn'] for m in modelspec],
+            'phi': [[[k, list(np.shape(v))]
+                     for k, v in sorted(m.get('phi', {}).items())]
+                    for m in modelspec],
+            'data': [[k, list(data[k].shape)] for k in sorted(data.signals)],
+        }
+        if self.state and self.state.get('fingerprint') != fingerprint:
+            log.warning('Checkpoint %s was saved for a different fit, '
+                        'starting from the beginning', self.path)
+            self.state = {}
+        self.state['fingerprint'] = fingerprint
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def update(self, **entries):
+        '''
+        Sets entries of the state, which are written at the next save.
+        An entry set to None is removed.
+        '''
+        for k, v in entries.items():
+            if v is None:
+                self.state.pop(k, None)
+            else:
+                self.state[k] = v
+
+    def tick(self):
+        '''
+        Counts one evaluation of the cost function, and saves if due.
+        '''
+        self._evals += 1
+        if ((self.every is not None and self._evals >= self.every) or
+                (self.interval is not None and
+                 time.time() - self._saved_at >= self.interval)):
+            self.save()
+
+    def save(self):
+        '''
+        Writes the state to the file, replacing it atomically so that an
+        interruption while writing leaves the previous checkpoint intact.
+        '''
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f, cls=NumpyEncoder)
+        os.replace(tmp, self.path)
+        self._evals = 0
+        self._saved_at = time.time()
+        log.debug('Saved checkpoint %s', self.path)
+
+    def clear(self):
+        '''
+        Removes the file and forgets the state, when the fit is done.
+        '''
+        self.state = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def watch(self, cost_fn):
+        '''
+        Wraps cost_fn so that every call is counted by tick(), and the
+        sigma with the lowest error so far is kept in the 'sigma' entry
+        (and its error in 'err'). cost_fn may also be a batch cost
+        function, of a (K, n_parameters) array of sigmas that returns K
+        errors (see nems.analysis.cost_functions.batch_cost).
+        '''
+        def watched(sigma):
+            err = cost_fn(sigma)
+            errors = np.asarray(err, dtype=float)
+            sigmas = np.array(sigma, dtype=float)
+            if errors.ndim:
+                best = np.argmin(errors)
+                errors, sigmas = errors[best], sigmas[best]
+            if errors < self.state.get('err', np.inf):
+                self.update(sigma=sigmas, err=float(errors))
+            self.tick()
+            return err
+
+        return watched
+
+    def resume_sigma(self, sigma):
+        '''
+        Returns the sigma kept by watch if there is one of the same length
+        as sigma, or sigma otherwise.
+        '''
+        kept = self.state.get('sigma')
+        if kept is not None and len(kept) == len(sigma):
+            log.info('Resuming from checkpointed sigma (error %.06f)',
+                     self.state['err'])
+            return np.asarray(kept, dtype=float)
+        return sigma
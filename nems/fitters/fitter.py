@@ -7,7 +7,9 @@ import nems.fitters.termination_conditions as tc
 log = logging.getLogger(__name__)
 
 
-def dummy_fitter(sigma, cost_fn, bounds=None, fixed=None):
+def dummy_fitter(sigma, cost_fn, bounds=None, fixed=None, max_time=None,
+                 max_evals=None, min_improvement=None, window=10,
+                 stepinfo=None):
     '''
     This fitter does not actually take meaningful steps; it merely
     varies the first element of the sigma vector to be equal to the step
@@ -16,9 +18,12 @@ def dummy_fitter(sigma, cost_fn, bounds=None, fixed=None):
     your own fitter.
     '''
     # Define a stepinfo and termination condition function 'stop_fit'
-    stepinfo, update_stepinfo = tc.create_stepinfo()
+    stepinfo, update_stepinfo = tc.create_stepinfo(stepinfo)
+    cost_fn = tc.count_evaluations(cost_fn, stepinfo)
     stop_fit = lambda : (tc.error_non_decreasing(stepinfo, 1e-5) or
-                         tc.max_iterations_reached(stepinfo, 1000))
+                         tc.max_iterations_reached(stepinfo, 1000) or
+                         tc.budget_exhausted(stepinfo, max_time, max_evals,
+                                             min_improvement, window))
 
     while not stop_fit():
         sigma[0] = stepinfo['stepnum']  # Take a fake step
@@ -30,22 +35,75 @@ def dummy_fitter(sigma, cost_fn, bounds=None, fixed=None):
 
 def coordinate_descent(sigma, cost_fn, step_size=0.1, step_change=0.5,
                        step_min=1e-5, tolerance=1e-5, max_iter=100,
-                       bounds=None, **kwargs):
+                       bounds=None, batch_cost_fn=None, checkpoint=None,
+                       max_time=None, max_evals=None, min_improvement=None,
+                       window=10, stepinfo=None, **kwargs):
+    '''
+    Tries a step of step_size up and down in each parameter and keeps the
+    best, shrinking the step when none of them improves the error.
+
+    If batch_cost_fn (a function of a (K, n_parameters) array of sigmas
+    that returns K errors, see nems.analysis.cost_functions.batch_cost) is
+    given, the 2 * n_parameters probes of each iteration are evaluated in
+    one call to it instead of one call to cost_fn each.
+
+    If checkpoint (a nems.fitters.checkpoint.Checkpoint) is given, sigma,
+    the step size and the step count are kept in its 'coordinate_descent'
+    entry after every iteration, and a fit interrupted earlier resumes
+    from them.
+
+    Besides tolerance, max_iter and step_min, the fit stops after max_time
+    seconds, after max_evals evaluations of the cost function, or once the
+    error improves by less than the fraction min_improvement over the
+    last window steps, whichever comes first (see
+    termination_conditions.budget_exhausted). These are checked between
+    iterations. If a stepinfo dict is given, the reason the fit stopped
+    and the number of evaluations are left in its 'stop_reason' and
+    'n_evals'.
+    '''
 
     if bounds is not None:
         bounds = list(zip(*bounds))
 
-    stepinfo, update_stepinfo = tc.create_stepinfo()
+    stepinfo, update_stepinfo = tc.create_stepinfo(stepinfo)
+    cost_fn = tc.count_evaluations(cost_fn, stepinfo)
+    if batch_cost_fn is not None:
+        batch_cost_fn = tc.count_evaluations(batch_cost_fn, stepinfo,
+                                             batch=True)
     stop_fit = lambda : (tc.error_non_decreasing(stepinfo, tolerance)
                          or tc.max_iterations_reached(stepinfo, max_iter)
-                         or tc.less_than_equal(step_size, step_min))
+                         or tc.step_size_below(stepinfo, step_size, step_min)
+                         or tc.budget_exhausted(stepinfo, max_time,
+                                                max_evals, min_improvement,
+                                                window))
 
-    this_sigma = sigma.copy()
     n_parameters = len(sigma)
+    this_steps = 0
+    saved = checkpoint.get('coordinate_descent') if checkpoint else None
+    if saved is not None and len(saved['sigma']) == n_parameters:
+        log.info("CD resuming from step %d", saved['stepnum'])
+        sigma = np.array(saved['sigma'], dtype=float)
+        step_size = saved['step_size']
+        this_steps = saved['this_steps']
+        stepinfo['stepnum'] = saved['stepnum']
+        stepinfo['err'] = saved['err']
+
+    def save_state():
+        if checkpoint is not None:
+            checkpoint.update(coordinate_descent={
+                    'sigma': np.array(sigma, dtype=float),
+                    'step_size': step_size, 'this_steps': this_steps,
+                    'stepnum': stepinfo['stepnum'], 'err': stepinfo['err']})
+
+    this_sigma = sigma.copy()
     step_errors = np.empty([n_parameters, 2])
     log.info("CD intializing: step_size=%.2f, tolerance=%e, max_iter=%d",
              step_size, tolerance, max_iter)
-    this_steps = 0
+    if batch_cost_fn is not None:
+        probes = np.empty([n_parameters, 2, n_parameters])
+    # so that a fit interrupted in its first iteration restarts from the
+    # same sigma, not from the best probe the caller's checkpoint kept
+    save_state()
     while not stop_fit():
         for i in range(0, n_parameters):
             if bounds is None:
@@ -60,12 +118,21 @@ def coordinate_descent(sigma, cost_fn, step_size=0.1, step_change=0.5,
             this_sigma[i] = sigma[i] + step_size
             if this_sigma[i] > upper:
                 this_sigma[i] = upper
-            step_errors[i, 0] = cost_fn(this_sigma)
+            if batch_cost_fn is None:
+                step_errors[i, 0] = cost_fn(this_sigma)
+            else:
+                probes[i, 0] = this_sigma
             this_sigma[i] = sigma[i] - step_size
             if this_sigma[i] < lower:
                 this_sigma[i] = lower
-            step_errors[i, 1] = cost_fn(this_sigma)
+            if batch_cost_fn is None:
+                step_errors[i, 1] = cost_fn(this_sigma)
+            else:
+                probes[i, 1] = this_sigma
             this_sigma[i] = sigma[i]
+        if batch_cost_fn is not None:
+            step_errors[:] = batch_cost_fn(
+                    probes.reshape(-1, n_parameters)).reshape(-1, 2)
         # Get index tuple for the lowest error that resulted,
         # and keep the corresponding sigma vector for the next iteration
         i_param, j_sign = np.unravel_index(
@@ -79,6 +146,7 @@ def coordinate_descent(sigma, cost_fn, step_size=0.1, step_change=0.5,
                      step_size, step_size * step_change)
             step_size *= step_change
             this_steps = 0
+            save_state()
             continue
         else:
             this_steps += 1
@@ -95,26 +163,153 @@ def coordinate_descent(sigma, cost_fn, step_size=0.1, step_change=0.5,
             sigma[i_param] = this_sigma[i_param] = sigma[i_param] + step_size
 
         update_stepinfo(err=err)
+        save_state()
         log.debug("step=%d", stepinfo["stepnum"])
         if stepinfo['stepnum'] % 20 == 0:
             log.debug("sigma is now: %s", sigma)
 
     log.info("Final error: %.06f (step size %.06f)\n",
              stepinfo['err'], step_size)
+    if checkpoint is not None:
+        checkpoint.update(coordinate_descent=None)
+
+    return sigma
+
+
+def block_coordinate_descent(sigma, cost_fn, blocks, step_size=0.1,
+                             step_change=0.5, step_min=1e-5, tolerance=1e-5,
+                             max_iter=100, bounds=None, max_time=None,
+                             max_evals=None, min_improvement=None, window=10,
+                             stepinfo=None, **kwargs):
+    '''
+    Coordinate descent for a cost made of independent blocks, such as the
+    per-unit errors of a population model (see
+    nems.analysis.fit_population).
+
+    cost_fn(sigma) returns one error per block, and blocks[i] is the block
+    that sigma[i] belongs to. The error of a block must depend only on that
+    block's parameters. Each probe then steps one parameter of every block
+    at once, so an iteration costs 2 * (largest block size) evaluations
+    however many blocks there are. Each block keeps its own step size and
+    stops on its own (after max_iter steps, a step that improves its error
+    by less than tolerance, or its step size falling to step_min), as
+    coordinate_descent would for that block alone.
+
+    The budgets max_time, max_evals and min_improvement (see
+    coordinate_descent) apply to the fit as a whole, with the total error
+    of the blocks as its error, and stop every block at once.
+    '''
+    stepinfo, update_stepinfo = tc.create_stepinfo(stepinfo)
+    cost_fn = tc.count_evaluations(cost_fn, stepinfo)
+    blocks = np.asarray(blocks)
+    n_blocks = blocks.max() + 1
+    sigma = np.array(sigma, dtype=float)
+    lower = np.full(len(sigma), -np.inf)
+    upper = np.full(len(sigma), np.inf)
+    if bounds is not None:
+        for limits, b in zip((lower, upper), bounds):
+            b = np.array([np.nan if x is None else x for x in b], dtype=float)
+            limits[np.isfinite(b)] = b[np.isfinite(b)]
+
+    # elements[b, j] is the index in sigma of the j-th parameter of block b
+    counts = np.bincount(blocks, minlength=n_blocks)
+    order = np.argsort(blocks, kind='stable')
+    position = np.empty(len(sigma), dtype=int)
+    position[order] = np.arange(len(sigma)) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+    elements = np.full((n_blocks, counts.max()), -1)
+    elements[blocks, position] = np.arange(len(sigma))
+
+    steps = np.full(n_blocks, float(step_size))
+    err = np.asarray(cost_fn(sigma), dtype=float)
+    active = np.ones(n_blocks, dtype=bool)
+    this_steps = np.zeros(n_blocks, dtype=int)
+    step_errors = np.empty([counts.max(), 2, n_blocks])
+    log.info("Block CD intializing: %d blocks, step_size=%.2f, "
+             "tolerance=%e, max_iter=%d", n_blocks, step_size, tolerance,
+             max_iter)
+    n_steps = np.zeros(n_blocks, dtype=int)
+    while active.any():
+        step_errors[:] = np.inf
+        for j in range(counts.max()):
+            idx = elements[:, j]
+            ok = (idx >= 0) & active
+            idx = idx[ok]
+            for k, sign in enumerate((1, -1)):
+                this_sigma = sigma.copy()
+                this_sigma[idx] = np.clip(sigma[idx] + sign * steps[ok],
+                                          lower[idx], upper[idx])
+                step_errors[j, k, ok] = cost_fn(this_sigma)[ok]
+
+        flat = step_errors.reshape(-1, n_blocks)
+        best = flat.argmin(axis=0)
+        best_err = flat[best, np.arange(n_blocks)]
+        improved = active & (best_err < err)
+
+        # Keep the best probe of each block that improved
+        b = np.flatnonzero(improved)
+        j, k = np.divmod(best[b], 2)
+        idx = elements[b, j]
+        sign = np.where(k == 0, 1, -1)
+        sigma[idx] = np.clip(sigma[idx] + sign * steps[b],
+                             lower[idx], upper[idx])
+        delta = err[b] - best_err[b]
+        err[b] = best_err[b]
+
+        # No improvement: try reducing step size
+        worse = active & ~improved
+        steps[worse] *= step_change
+        this_steps[worse] = 0
+        this_steps[improved] += 1
+        grow = this_steps > 10
+        steps[grow] /= np.sqrt(step_change)
+        this_steps[grow] = 0
+
+        n_steps[b] += 1
+        active[b[delta < tolerance]] = False
+        active[steps <= step_min] = False
+        active[n_steps >= max_iter] = False
+        log.debug("%d blocks still active", active.sum())
+        update_stepinfo(err=err.sum())
+        if tc.budget_exhausted(stepinfo, max_time, max_evals,
+                               min_improvement, window):
+            break
+    else:
+        stepinfo['stop_reason'] = 'blocks_converged'
+
+    log.info("Final error: %.06f (mean of %d blocks)\n", err.mean(),
+             n_blocks)
 
     return sigma
 
 
 def scipy_minimize(sigma, cost_fn, tolerance=None, max_iter=None,
-                   bounds=None, method='L-BFGS-B', options={}):
+                   bounds=None, method='L-BFGS-B', options={},
+                   batch_cost_fn=None, checkpoint=None, max_time=None,
+                   max_evals=None, min_improvement=None, window=10,
+                   stepinfo=None):
     """
     Wrapper for scipy.optimize.minimize to normalize format with
     NEMS fitters.
 
-    TODO: finish this doc
+    The state of the minimizer cannot be checkpointed, so checkpoint is
+    accepted for compatibility with coordinate_descent and ignored: a
+    restarted fit resumes from the best sigma kept by the caller's cost
+    function (see nems.fitters.checkpoint.Checkpoint.watch).
+
+    If batch_cost_fn (see coordinate_descent) is given, the gradient is
+    computed by forward differences with step options['eps'] (default
+    1e-8, as scipy's own), evaluating sigma and all of its n_parameters
+    perturbations in one call, and passed to the minimizer as jac.
 
-    Does not currently use the stepinfo/termination_conditions
-    paradigm.
+    The budgets max_time, max_evals and min_improvement (see
+    coordinate_descent) are checked at every evaluation of the cost
+    function for the first two, and at every iteration of the minimizer
+    for the last, through its callback. A fit stopped by one of them
+    returns the best sigma evaluated so far. Otherwise the message of the
+    minimizer is left as the 'stop_reason' of stepinfo.
+
+    TODO: finish this doc
 
     TODO: Pull in code from scipy.py in docs/planning to
           expose more output during iteration.
@@ -143,11 +338,154 @@ def scipy_minimize(sigma, cost_fn, tolerance=None, max_iter=None,
     log.info("Starting sigma: %s\n", sigma)
 
     # convert to format requried by scipy
+    stepinfo, update_stepinfo = tc.create_stepinfo(stepinfo)
+    if batch_cost_fn is None:
+        fun = tc.count_evaluations(cost_fn, stepinfo)
+        jac = None
+    else:
+        fun = _batch_gradient(
+                tc.count_evaluations(batch_cost_fn, stepinfo, batch=True),
+                options.get('eps', 1e-8), bounds)
+        jac = True
+    best = {'err': np.inf, 'sigma': sigma}
+
+    def budgeted(x):
+        out = fun(x)
+        err = out[0] if jac else out
+        if err < best['err']:
+            best['err'], best['sigma'] = err, np.array(x, dtype=float)
+        if tc.budget_exhausted(stepinfo, max_time, max_evals):
+            raise _BudgetExhausted()
+        return out
+
+    def callback(x):
+        update_stepinfo(err=best['err'])
+        if tc.budget_exhausted(stepinfo, min_improvement=min_improvement,
+                               window=window):
+            raise _BudgetExhausted()
+
     bounds = list(zip(*bounds))
-    result = scp.optimize.minimize(cost_fn, sigma, method=method,
-                                   bounds=bounds, options=options)
-    sigma = result.x
+    try:
+        result = scp.optimize.minimize(budgeted, sigma, method=method,
+                                       jac=jac, bounds=bounds,
+                                       options=options, callback=callback)
+        sigma = result.x
+        stepinfo['stop_reason'] = str(result.message)
+    except _BudgetExhausted:
+        sigma = best['sigma']
     final_err = cost_fn(sigma)
     log.info("Final error: %.06f", final_err)
     log.info("Final sigma: %s\n", sigma)
     return sigma
+
+
+def least_squares(sigma, cost_fn, residual_fn=None, tolerance=None,
+                  max_iter=None, bounds=None, method='trf', options={},
+                  batch_cost_fn=None, checkpoint=None, max_time=None,
+                  max_evals=None, min_improvement=None, window=10,
+                  stepinfo=None):
+    """
+    Wrapper for scipy.optimize.least_squares, for cost functions that are a
+    sum of squared residuals, such as mse and nmse.
+
+    residual_fn is a function of sigma that returns the vector of
+    residuals (see nems.analysis.cost_functions.residual_cost); cost_fn is
+    only used to report the final error. The trust region methods of
+    least_squares estimate the Jacobian of the residuals by finite
+    differences and use it to take far fewer, better steps than a generic
+    minimizer of the summed cost.
+
+    tolerance is passed as ftol and max_iter as max_nfev (which does not
+    count the evaluations for the Jacobian); other options are passed to
+    least_squares as they are. batch_cost_fn and checkpoint are accepted
+    for compatibility with the other fitters and ignored, as for
+    scipy_minimize.
+
+    The budgets max_time and max_evals (see coordinate_descent) are checked
+    at every evaluation of the residuals, and min_improvement at every
+    evaluation that lowers the error, as least_squares has no callback per
+    iteration. A fit stopped by one of them returns the best sigma
+    evaluated so far.
+    """
+    if residual_fn is None:
+        raise ValueError("least_squares needs a residual_fn, e.g. from "
+                         "fit_basic with a residual_metric")
+
+    options = options.copy()
+    if tolerance is not None:
+        options['ftol'] = tolerance
+    elif 'ftol' not in options:
+        options['ftol'] = 1e-7
+    if max_iter is not None:
+        options['max_nfev'] = max_iter
+
+    sigma = np.asarray(sigma, dtype=float)
+    if bounds is None or method == 'lm':
+        lower, upper = -np.inf, np.inf
+    else:
+        lower = np.array([-np.inf if b is None else b for b in bounds[0]],
+                         dtype=float)
+        upper = np.array([np.inf if b is None else b for b in bounds[1]],
+                         dtype=float)
+        # the trust region methods must start inside the bounds
+        sigma = np.clip(sigma, lower, upper)
+
+    log.info("Starting sigma: %s\n", sigma)
+
+    stepinfo, update_stepinfo = tc.create_stepinfo(stepinfo)
+    fun = tc.count_evaluations(residual_fn, stepinfo)
+    best = {'err': np.inf, 'sigma': sigma}
+
+    def budgeted(x):
+        residuals = fun(x)
+        err = np.sum(residuals ** 2)
+        if err < best['err']:
+            best['err'], best['sigma'] = err, np.array(x, dtype=float)
+            update_stepinfo(err=err)
+        if tc.budget_exhausted(stepinfo, max_time, max_evals,
+                               min_improvement, window):
+            raise _BudgetExhausted()
+        return residuals
+
+    try:
+        result = scp.optimize.least_squares(budgeted, sigma, method=method,
+                                            bounds=(lower, upper), **options)
+        sigma = result.x
+        stepinfo['stop_reason'] = str(result.message)
+    except _BudgetExhausted:
+        sigma = best['sigma']
+
+    final_err = cost_fn(sigma)
+    log.info("Final error: %.06f", final_err)
+    log.info("Final sigma: %s\n", sigma)
+
+    return sigma
+
+
+class _BudgetExhausted(Exception):
+    '''Raised to stop scipy.optimize.minimize from inside its callbacks.'''
+
+
+def _batch_gradient(batch_cost_fn, eps, bounds=None):
+    '''
+    Returns a function of sigma that returns (error, gradient), with the
+    gradient from forward differences of step eps evaluated in one call to
+    batch_cost_fn. The step is taken downwards for parameters at their
+    upper bound.
+    '''
+    upper = None
+    if bounds is not None:
+        upper = np.array([np.inf if b is None else b for b in bounds[1]],
+                         dtype=float)
+
+    def fun(sigma):
+        n = len(sigma)
+        h = np.full(n, eps, dtype=float)
+        if upper is not None:
+            h[sigma + h > upper] = -eps
+        probes = np.tile(sigma, (n + 1, 1))
+        probes[1:] += np.diag(h)
+        errors = batch_cost_fn(probes)
+        return errors[0], (errors[1:] - errors[0]) / h
+
+    return fun
@@ -148,3 +148,142 @@ def simple_vector(modelspec, subset=None):
         return lower, upper
 
     return packer, unpacker, bounds
+
+
+class CompiledVector:
+    """
+    The layout of a modelspec's `phi` in the fit vector, computed once so that
+    mappers for the whole modelspec or for any subset of its modules can be
+    made without walking it again.
+
+    The vector is the same as that of `simple_vector`: modules in order, the
+    keys of each module's phi sorted, arrays flattened. The offsets of each
+    (module, key) and the lower and upper bounds of the whole vector are
+    computed when the CompiledVector is made, so the modelspec should not
+    change structure (keys, shapes or bounds) afterwards. Calling it with
+    (modelspec, subset) returns a packer, unpacker and bounds function like
+    `simple_vector`, where the subset picks elements of the full vector by
+    index and bounds are sliced from the precomputed arrays.
+
+    The unpacker assigns the vector into arrays allocated once per module
+    set, which it places in the modelspec, rather than building new arrays
+    on every call. Those arrays are changed in place by the next unpack, so
+    copy the modelspec to keep the parameters of an intermediate step.
+
+    Example
+    -------
+    >>> mapper = CompiledVector(modelspec)
+    >>> for subset in [[0, 1], [2], [0, 1, 2]]:
+    ...     packer, unpacker, bounds = mapper(modelspec, subset=subset)
+    """
+
+    def __init__(self, modelspec):
+        self.n_modules = len(modelspec)
+        # per module, a list of (key, start, stop, shape), shape None for
+        # scalars
+        self.entries = []
+        lower = []
+        upper = []
+        offset = 0
+        for m in modelspec:
+            phi = m.get('phi') or {}
+            module_bounds = m.get('bounds', {})
+            entries = []
+            for name in sorted(phi.keys()):
+                value = phi[name]
+                if np.isscalar(value):
+                    shape, size = None, 1
+                else:
+                    shape = np.shape(value)
+                    size = int(np.prod(shape))
+                entries.append((name, offset, offset + size, shape))
+                offset += size
+
+                b = module_bounds.get(name, (None, None))
+                lower.append(np.ravel(to_bounds_array(b, value, 'lower')))
+                upper.append(np.ravel(to_bounds_array(b, value, 'upper')))
+            self.entries.append(entries)
+        self.size = offset
+        self.lower = np.concatenate(lower) if lower else np.zeros(0)
+        self.upper = np.concatenate(upper) if upper else np.zeros(0)
+
+    def indices(self, subset=None):
+        ''' Indices of the elements of the full vector in subset. '''
+        if subset is None:
+            return np.arange(self.size)
+        return np.concatenate(
+                [np.arange(e[1], e[2]) for i in sorted(set(subset))
+                 for e in self.entries[i]] + [np.zeros(0, dtype=int)])
+
+    def __call__(self, modelspec, subset=None):
+        if len(modelspec) != self.n_modules:
+            raise ValueError('Modelspec has {} modules, mapper was compiled '
+                             'for {}'.format(len(modelspec), self.n_modules))
+        if subset is None:
+            subset = range(self.n_modules)
+        modules = sorted(set(subset))
+        idx = self.indices(modules)
+        # the slices of each module's entries in the subset's vector
+        layout = []
+        phis = []
+        offset = 0
+        for i in modules:
+            entries = []
+            phi = {}
+            for name, start, stop, shape in self.entries[i]:
+                size = stop - start
+                entries.append((name, offset, offset + size, shape))
+                if shape is not None:
+                    phi[name] = np.empty(shape)
+                offset += size
+            layout.append((i, entries))
+            phis.append(phi)
+        lower = self.lower[idx]
+        upper = self.upper[idx]
+
+        def packer(modelspec):
+            ''' Converts a modelspec to a vector. '''
+            vec = np.empty(len(idx))
+            for i, entries in layout:
+                phi = modelspec[i].get('phi') or {}
+                for name, start, stop, shape in entries:
+                    vec[start:stop] = np.ravel(phi[name])
+            return vec
+
+        def unpacker(vec):
+            ''' Converts a vector back into a modelspec. '''
+            vec = np.asarray(vec)
+            for (i, entries), phi in zip(layout, phis):
+                for name, start, stop, shape in entries:
+                    if shape is None:
+                        phi[name] = vec[start]
+                    else:
+                        phi[name].reshape(-1)[:] = vec[start:stop]
+                modelspec[i]['phi'] = phi
+            return modelspec
+
+        def bounds(modelspec):
+            return lower, upper
+
+        return packer, unpacker, bounds
+
+
+def compiled_vector(modelspec, subset=None):
+    """
+    Same as `simple_vector`, built with a `CompiledVector`: packing and
+    unpacking use the offsets computed once by it, and bounds are sliced
+    from its precomputed arrays. Fits that map several module sets of one
+    modelspec should make a CompiledVector once (see `compile_mapper`).
+    """
+    return CompiledVector(modelspec)(modelspec, subset)
+
+
+def compile_mapper(mapper, modelspec):
+    """
+    Returns a mapper for fitting several module sets of modelspec: a
+    CompiledVector if mapper is `compiled_vector`, so that its layout is
+    computed once for all of them, and mapper itself otherwise.
+    """
+    if mapper is compiled_vector:
+        return CompiledVector(modelspec)
+    return mapper
@@ -9,7 +9,7 @@ log = logging.getLogger(__name__)
 # but recommended unless you have an unusual fitting algorithm.
 
 
-def create_stepinfo():
+def create_stepinfo(stepinfo=None):
     '''
     Returns (stepinfo, stepinfo_fn), where
        stepinfo          Default dict used with all termination conditions
@@ -17,6 +17,11 @@ def create_stepinfo():
                          update stepinfo after you take each step. Use of
                          this function is optional but recommended.
 
+    If a stepinfo dict is given, it is reset and used, so that the caller
+    of a fitter can read it afterwards, e.g. for its 'stop_reason' (set by
+    the termination condition that stopped the fit) and 'n_evals' (see
+    count_evaluations).
+
     Example use:
        import termination_conditions as tc
 
@@ -32,17 +37,24 @@ def create_stepinfo():
     The stepinfo data structure is to be used with all the termination
     condition functions defined in this file.
     '''
-    stepinfo = {
+    if stepinfo is None:
+        stepinfo = {}
+    stepinfo.clear()
+    stepinfo.update({
             'stepnum': 0,
             'err': np.inf,
             'err_delta': -np.inf,
-            'start_time': time.time()
-            }
+            'start_time': time.time(),
+            'n_evals': 0,
+            'history': [],
+            'stop_reason': None,
+            })
 
     def update_stepinfo(err, **kwargs):
         stepinfo['stepnum'] += 1
         stepinfo['err_delta'] = err - stepinfo['err']
         stepinfo['err'] = err
+        stepinfo['history'].append(err)
         stepinfo.update(kwargs)
         log.debug("Stepinfo: %s", stepinfo)
 
@@ -57,6 +69,7 @@ def error_non_decreasing(stepinfo, tolerance=1e-5):
     if stepinfo['err_delta'] > -tolerance:
         log.info("Change in error: %.06f was less than tolerance: %.2E",
                  stepinfo['err_delta'], tolerance)
+        stepinfo['stop_reason'] = 'tolerance'
         return True
     else:
         return False
@@ -70,6 +83,7 @@ def fit_time_exceeded(stepinfo, max_time=300):
     # time.time() and stepinfo['start_time'] are in units of seconds
     if (time.time() - stepinfo['start_time']) >= max_time:
         log.info("Maximum fit time exceeded: %.02f", max_time)
+        stepinfo['stop_reason'] = 'max_time'
         return True
     else:
         return False
@@ -82,6 +96,7 @@ def max_iterations_reached(stepinfo, max_iter=10000):
     '''
     if stepinfo['stepnum'] >= max_iter:
         log.info("Maximum iterations reached: %d", max_iter)
+        stepinfo['stop_reason'] = 'max_iter'
         return True
     else:
         return False
@@ -94,10 +109,24 @@ def target_err_reached(stepinfo, target=0.0):
     '''
     if stepinfo['err'] <= target:
         log.info("Target error reached: %.06f", target)
+        stepinfo['stop_reason'] = 'target_err'
         return True
     else:
         return False
 
+def step_size_below(stepinfo, step_size, step_min=1e-5):
+    '''
+    Returns true when step_size has shrunk to step_min or less, for
+    fitters that take steps of an adaptive size.
+    '''
+    if step_size <= step_min:
+        log.info("Step size reached minimum: %.2E", step_min)
+        stepinfo['stop_reason'] = 'step_min'
+        return True
+    else:
+        return False
+
+
 def less_than_equal(a, b):
     '''
     Returns true when a is less than or equal to b.
@@ -111,4 +140,64 @@ def less_than_equal(a, b):
     if a <= b:
         return True
     else:
-        return False
\ No newline at end of file
+        return False
+
+
+def max_evaluations_reached(stepinfo, max_evals=10000):
+    '''
+    Returns true when the cost function has been evaluated at least
+    max_evals times (stepinfo's 'n_evals', see count_evaluations).
+    '''
+    if stepinfo['n_evals'] >= max_evals:
+        log.info("Maximum evaluations reached: %d", max_evals)
+        stepinfo['stop_reason'] = 'max_evals'
+        return True
+    else:
+        return False
+
+
+def improvement_rate_below(stepinfo, min_improvement=1e-4, window=10):
+    '''
+    Returns true when the error has improved by less than the fraction
+    min_improvement of its value over the last window steps. Unlike
+    error_non_decreasing, this stops a fit that still improves at every
+    step, but too slowly to be worth continuing.
+    '''
+    history = stepinfo['history']
+    if len(history) <= window:
+        return False
+    before = history[-window - 1]
+    if before - stepinfo['err'] < min_improvement * abs(before):
+        log.info("Error improved by less than %.2E over %d steps",
+                 min_improvement, window)
+        stepinfo['stop_reason'] = 'improvement_rate'
+        return True
+    else:
+        return False
+
+
+def budget_exhausted(stepinfo, max_time=None, max_evals=None,
+                     min_improvement=None, window=10):
+    '''
+    Returns true when any of the given budgets is used up: a wall clock
+    time of max_time seconds since the fit started, max_evals evaluations
+    of the cost function, or an improvement of less than min_improvement
+    (relative) over window steps. A budget that is None is unlimited.
+    '''
+    return ((max_time is not None and fit_time_exceeded(stepinfo, max_time))
+            or (max_evals is not None and
+                max_evaluations_reached(stepinfo, max_evals))
+            or (min_improvement is not None and
+                improvement_rate_below(stepinfo, min_improvement, window)))
+
+
+def count_evaluations(cost_fn, stepinfo, batch=False):
+    '''
+    Wraps cost_fn so that each call adds to stepinfo's 'n_evals', by one,
+    or, if batch is True, by the number of sigmas evaluated.
+    '''
+    def counted(sigma):
+        stepinfo['n_evals'] += len(sigma) if batch else 1
+        return cost_fn(sigma)
+
+    return counted
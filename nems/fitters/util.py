@@ -1,3 +1,6 @@
+import inspect
+from collections import OrderedDict
+
 import numpy as np
 
 
@@ -154,3 +157,50 @@ def phi_percentile(priors, percentile):
     [{'mu': 0.0}, {'scale': array([ 0.29289322,  0.70710678])}]
     '''
     return [{n: p.percentile(percentile) for n, p in m.items()} for m in priors]
+
+
+def memoize_cost(cost_fn, maxsize=256):
+    '''
+    Wraps cost_fn so that the errors of the last maxsize distinct sigmas it
+    was called with are kept, and an exact repeat (as happens in line
+    searches, in probes clamped to a bound and in the final evaluation of
+    scipy_minimize) returns the kept error without evaluating the model.
+
+    The wrapper counts its cache hits and misses in its hits and misses
+    attributes. cost_fn must be deterministic, i.e. not use a segmentor
+    that picks a new subset of the data from one call to the next.
+    '''
+    cache = OrderedDict()
+
+    def memoized(sigma):
+        key = np.asarray(sigma, dtype=float).tobytes()
+        if key in cache:
+            cache.move_to_end(key)
+            memoized.hits += 1
+            return cache[key]
+        memoized.misses += 1
+        error = cost_fn(sigma)
+        cache[key] = error
+        if len(cache) > maxsize:
+            cache.popitem(last=False)
+        return error
+
+    memoized.hits = 0
+    memoized.misses = 0
+    return memoized
+
+
+def accepts_kwarg(fitter, name):
+    '''
+    Returns True if fitter can be called with the keyword argument name,
+    either because it is one of its parameters or because it takes
+    **kwargs. Analyses only pass optional arguments such as stepinfo or
+    checkpoint to fitters that accept them, so that a fitter of just
+    (sigma, cost_fn, ...) keeps working.
+    '''
+    try:
+        params = inspect.signature(fitter).parameters
+    except (TypeError, ValueError):
+        return False
+    return (name in params or
+            any(p.kind == p.VAR_KEYWORD for p in params.values()))
@@ -1,6 +1,9 @@
 import logging
 
 import copy
+import hashlib
+from collections import OrderedDict
+
 import numpy as np
 
 from nems.registry import KeywordRegistry
@@ -16,7 +19,9 @@ from nems import get_setting
 log = logging.getLogger(__name__)
 default_kws = KeywordRegistry()
 default_kws.register_module(default_keywords)
-default_kws.register_plugins(get_setting('KEYWORD_PLUGINS'))
+# the plugin directories are a setting, so only load the config when the
+# registry is first used
+default_kws.register_plugins_on_use(lambda: get_setting('KEYWORD_PLUGINS'))
 
 
 def from_keywords(keyword_string, registry=None, rec=None, meta={}):
@@ -73,7 +78,8 @@ def from_keywords(keyword_string, registry=None, rec=None, meta={}):
         if registry.kw_head(kw) not in registry:
             raise ValueError("unknown keyword: {}".format(kw))
 
-        d = copy.deepcopy(registry[kw])
+        # The registry caches parsed keywords and returns a fresh copy
+        d = registry[kw]
         d['id'] = kw
         modelspec.append(d)
 
@@ -114,7 +120,7 @@ def from_keywords_as_list(keyword_string, registry=None, meta={}):
 
 def prefit_LN(est, modelspec, analysis_function=fit_basic,
               fitter=scipy_minimize, metric=None,
-              tolerance=10**-5.5, max_iter=700):
+              tolerance=10**-5.5, max_iter=700, ridge=False):
     '''
     Initialize modelspecs in a way that avoids getting stuck in
     local minima.
@@ -126,18 +132,24 @@ def prefit_LN(est, modelspec, analysis_function=fit_basic,
 
     output: a single modelspec
 
+    If ridge is True, the linear wc-fir-lvl stage is initialized in closed
+    form by init_ridge instead of being fit iteratively.
+
     TODO -- make sure this works generally or create alternatives
 
     '''
     fit_kwargs = {'tolerance': tolerance, 'max_iter': max_iter}
 
     # fit without STP module first (if there is one)
-    modelspec = prefit_to_target(est, modelspec, fit_basic,
-                                 target_module='levelshift',
-                                 extra_exclude=['stp'],
-                                 fitter=scipy_minimize,
-                                 metric=metric,
-                                 fit_kwargs=fit_kwargs)
+    if ridge:
+        modelspec = init_ridge(est, modelspec)
+    else:
+        modelspec = prefit_to_target(est, modelspec, fit_basic,
+                                     target_module='levelshift',
+                                     extra_exclude=['stp'],
+                                     fitter=scipy_minimize,
+                                     metric=metric,
+                                     fit_kwargs=fit_kwargs)
 
     # then initialize the STP module (if there is one)
     for i, m in enumerate(modelspec):
@@ -459,3 +471,272 @@ def init_logsig(rec, modelspec):
             }
 
     return modelspec
+
+
+# Lagged moments of recently used input/response pairs, keyed on the
+# content of the arrays, see lagged_moments
+_moments_cache = OrderedDict()
+_MOMENTS_CACHE_SIZE = 4
+
+
+def _content_key(a):
+    '''
+    Identifies an array by its shape, dtype and a digest of its values, so
+    that equal arrays made by separate evaluations share a key and no
+    reference to the array itself has to be kept.
+    '''
+    if a is None:
+        return None
+    a = np.ascontiguousarray(a)
+    return (a.shape, a.dtype.str, hashlib.blake2b(a.tobytes()).digest())
+
+
+def lagged_moments(x, y, n_taps, n_folds=5, mask=None, chunk_size=20000):
+    '''
+    Returns the sums needed to fit a linear filter of n_taps lags from x
+    (n_chans, n_times) to y (n_units, n_times) by least squares, for each
+    of n_folds contiguous blocks of time:
+
+        {'XtX': (n_folds, D, D), 'Xty': (n_folds, D, n_units),
+         'yty': (n_folds, n_units), 'n': (n_folds,)}
+
+    where X is the lagged design matrix, with column c * n_taps + l holding
+    x[c] delayed by l bins, plus a final column of ones (D = n_chans *
+    n_taps + 1). Before the first bin, x is taken to hold its first value,
+    as nems.modules.fir does. Bins where mask is False or any value is not
+    finite are left out.
+
+    The lagged matrix is built chunk_size bins at a time and never held in
+    full. The result is cached for x, y and mask of the same values (not
+    just the same arrays, since x is usually the output of a fresh
+    evaluation of the modules before wc), so initializing several models
+    of one recording computes it only once.
+    '''
+    key = (_content_key(x), _content_key(y), _content_key(mask), n_taps,
+           n_folds)
+    cached = _moments_cache.get(key)
+    if cached is not None:
+        _moments_cache.move_to_end(key)
+        return cached
+
+    n_chans, n_times = x.shape
+    n_units = y.shape[0]
+    D = n_chans * n_taps + 1
+    padded = np.concatenate([np.repeat(x[:, :1], n_taps - 1, axis=1), x],
+                            axis=1)
+    # windows[c, t, j] is x[c, t - (n_taps - 1 - j)]
+    windows = np.lib.stride_tricks.sliding_window_view(padded, n_taps,
+                                                       axis=1)[:, :, ::-1]
+    valid = np.all(np.isfinite(y), axis=0)
+    if mask is not None:
+        valid &= np.asarray(mask, dtype=bool).reshape(-1)[:n_times]
+
+    moments = {'XtX': np.zeros((n_folds, D, D)),
+               'Xty': np.zeros((n_folds, D, n_units)),
+               'yty': np.zeros((n_folds, n_units)),
+               'n': np.zeros(n_folds, dtype=int)}
+    bounds = np.linspace(0, n_times, n_folds + 1).astype(int)
+    for f in range(n_folds):
+        for t0 in range(bounds[f], bounds[f + 1], chunk_size):
+            t1 = min(t0 + chunk_size, bounds[f + 1])
+            X = np.empty((t1 - t0, D))
+            X[:, :-1] = windows[:, t0:t1].transpose(1, 0, 2).reshape(
+                    t1 - t0, -1)
+            X[:, -1] = 1
+            keep = valid[t0:t1] & np.all(np.isfinite(X), axis=1)
+            X = X[keep]
+            yc = y[:, t0:t1][:, keep].T
+            moments['XtX'][f] += X.T @ X
+            moments['Xty'][f] += X.T @ yc
+            moments['yty'][f] += np.sum(yc ** 2, axis=0)
+            moments['n'][f] += len(X)
+
+    _moments_cache[key] = moments
+    if len(_moments_cache) > _MOMENTS_CACHE_SIZE:
+        _moments_cache.popitem(last=False)
+    return moments
+
+
+def _ridge_path(XtX, Xty, penalties):
+    '''
+    Ridge weights (len(penalties), D, n_units) from the sums of a design
+    matrix whose last column is constant, with the constant term
+    unpenalized. The constant is projected out and the centred Gram
+    matrix diagonalized once, so that each penalty only costs a few
+    matrix products.
+    '''
+    n = XtX[-1, -1]
+    sx = XtX[:-1, -1]
+    sy = Xty[-1]
+    gram = XtX[:-1, :-1] - np.outer(sx, sx) / n
+    cross = Xty[:-1] - np.outer(sx, sy) / n
+    eigvals, eigvecs = np.linalg.eigh(gram)
+    projected = eigvecs.T @ cross
+    weights = np.empty((len(penalties),) + Xty.shape)
+    for i, lam in enumerate(penalties):
+        w = eigvecs @ (projected / (eigvals + lam)[:, np.newaxis])
+        weights[i, :-1] = w
+        weights[i, -1] = (sy - sx @ w) / n
+    return weights
+
+
+def ridge_solve(moments, alphas=None):
+    '''
+    Fits the weights of a lagged linear model by ridge regression from the
+    output of lagged_moments. The ridge penalty (which does not apply to
+    the final, constant column) is chosen separately for each unit from
+    alphas, given relative to the mean variance of the columns of X, by
+    cross-validation over the folds.
+
+    Returns (weights (D, n_units), alpha (n_units,)).
+    '''
+    if alphas is None:
+        alphas = np.logspace(-4, 2, 13)
+    alphas = np.asarray(alphas, dtype=float)
+    XtX = moments['XtX'].sum(axis=0)
+    Xty = moments['Xty'].sum(axis=0)
+    n_folds, D, n_units = moments['Xty'].shape
+    if n_folds < 2:
+        raise ValueError('Need at least 2 folds to choose the ridge penalty')
+    n = XtX[-1, -1]
+    centred = np.diag(XtX)[:-1] - XtX[:-1, -1] ** 2 / n
+    penalties = alphas * np.mean(centred)
+
+    sse = np.zeros((len(alphas), n_units))
+    for f in range(n_folds):
+        w = _ridge_path(XtX - moments['XtX'][f], Xty - moments['Xty'][f],
+                        penalties)
+        sse += moments['yty'][f] \
+            - 2 * np.sum(w * moments['Xty'][f], axis=1) \
+            + np.sum(w * (moments['XtX'][f] @ w), axis=1)
+    best = np.argmin(sse, axis=0)
+
+    path = _ridge_path(XtX, Xty, penalties[np.unique(best)])
+    lookup = {b: i for i, b in enumerate(np.unique(best))}
+    weights = np.stack([path[lookup[b], :, r] for r, b in enumerate(best)],
+                       axis=1)
+    return weights, alphas[best]
+
+
+def _low_rank(strf, gram, cross, rank, penalty, n_iter=10):
+    '''
+    Factors strf (n_chans, n_taps) into the rank-limited product w.T @ f of
+    a wc-fir pair. Starting from its singular value decomposition, w and f
+    are refined in turn by ridge regression with the other held fixed,
+    using the centred lagged moments gram (n_chans, n_taps, n_chans,
+    n_taps) and cross (n_chans, n_taps), so that the factored filter is the
+    best one of that rank rather than a truncation of the full one.
+    '''
+    u, s, vt = np.linalg.svd(strf, full_matrices=False)
+    k = min(rank, len(s))
+    w = (u[:, :k] * np.sqrt(s[:k])).T
+    f = vt[:k] * np.sqrt(s[:k])[:, np.newaxis]
+    if k == len(s):
+        return w, f
+    for _ in range(n_iter):
+        A = np.einsum('kc,cldm,jd->kljm', w, gram, w).reshape(
+                f.size, f.size)
+        b = np.einsum('kc,cl->kl', w, cross).ravel()
+        f = np.linalg.solve(A + penalty * np.eye(f.size), b).reshape(f.shape)
+        A = np.einsum('kl,cldm,jm->kcjd', f, gram, f).reshape(
+                w.size, w.size)
+        b = np.einsum('kl,cl->kc', f, cross).ravel()
+        w = np.linalg.solve(A + penalty * np.eye(w.size), b).reshape(w.shape)
+    return w, f
+
+
+def init_ridge(rec, modelspec, alphas=None, n_folds=5):
+    '''
+    Initializes the linear wc-fir(-lvl) stage of modelspec in closed form.
+    The full spectro-temporal filter (STRF) of each response channel is fit
+    by ridge regression (see lagged_moments and ridge_solve) and then
+    split into the rank of the wc-fir pair by singular value
+    decomposition. The constant term goes to the levelshift that follows
+    the fir, if any.
+
+    Modules before wc are evaluated with their current (or prior mean)
+    phi to get its input, and STP modules between wc and fir are ignored.
+    The modules after the linear stage are left as they were, so that
+    e.g. init_dexp can follow.
+
+    Works for weight_channels.basic followed by fir.basic (one response
+    channel) or fir.filter_bank (one bank per response channel); for
+    anything else a warning is logged and modelspec is returned unchanged.
+    '''
+    modelspec = copy.deepcopy(modelspec)
+    wc_i = find_module('weight_channels', modelspec)
+    fir_i = find_module('fir', modelspec)
+    if wc_i is None or fir_i is None or fir_i < wc_i or \
+            modelspec[wc_i]['fn'] == 'nems.modules.weight_channels.gaussian' \
+            or modelspec[fir_i]['fn'] not in ('nems.modules.fir.basic',
+                                              'nems.modules.fir.filter_bank'):
+        log.warning('No wc-fir stage found, skipping ridge initialization')
+        return modelspec
+    for m in modelspec[wc_i+1:fir_i]:
+        if 'stp' not in m['fn']:
+            log.warning('%s between wc and fir, skipping ridge '
+                        'initialization', m['fn'])
+            return modelspec
+
+    for i, m in enumerate(modelspec[:fir_i+2]):
+        if not m.get('phi') and 'prior' in m:
+            modelspec[i] = priors.set_mean_phi([m])[0]
+    wc = modelspec[wc_i]
+    fir = modelspec[fir_i]
+
+    if wc_i > 0:
+        rec = ms.evaluate(rec, modelspec[:wc_i])
+    x = rec[wc['fn_kwargs']['i']].as_continuous()
+    y = rec['resp'].as_continuous()
+    mask = rec['mask'].as_continuous() if 'mask' in rec.signals else None
+
+    coefficients = np.zeros_like(np.asarray(fir['phi']['coefficients'],
+                                            dtype=float))
+    n_filters, n_taps = coefficients.shape
+    bank_count = fir['fn_kwargs'].get('bank_count', 1)
+    rank = n_filters // bank_count
+    if bank_count != y.shape[0] or \
+            np.shape(wc['phi']['coefficients']) != (n_filters, x.shape[0]):
+        log.warning('wc-fir stage does not map %d inputs to %d response '
+                    'channels, skipping ridge initialization',
+                    x.shape[0], y.shape[0])
+        return modelspec
+
+    moments = lagged_moments(x, y, n_taps, n_folds, mask)
+    weights, alpha = ridge_solve(moments, alphas)
+    log.info('Ridge initialization, penalty per unit: %s', alpha)
+
+    XtX = moments['XtX'].sum(axis=0)
+    Xty = moments['Xty'].sum(axis=0)
+    n = XtX[-1, -1]
+    sx = XtX[:-1, -1]
+    gram = (XtX[:-1, :-1] - np.outer(sx, sx) / n).reshape(
+            x.shape[0], n_taps, x.shape[0], n_taps)
+    penalty = alpha * np.mean(np.diag(XtX)[:-1] - sx ** 2 / n)
+    wc_coefs = np.zeros((n_filters, x.shape[0]))
+    bias = np.empty(bank_count)
+    for r in range(bank_count):
+        strf = weights[:-1, r].reshape(x.shape[0], n_taps)
+        cross = (Xty[:-1, r] - sx * Xty[-1, r] / n).reshape(strf.shape)
+        w, f = _low_rank(strf, gram, cross, rank, penalty[r])
+        rows = slice(r * rank, r * rank + len(w))
+        wc_coefs[rows] = w
+        coefficients[rows] = f
+        bias[r] = (Xty[-1, r] - sx @ (w.T @ f).ravel()) / n
+    if wc['fn_kwargs'].get('normalize_coefs'):
+        # the module divides each row by its sum, so move that to the fir
+        sc = np.sum(np.abs(wc_coefs), axis=1, keepdims=True)
+        sc[sc == 0] = 1
+        wc_coefs /= sc
+        coefficients *= sc
+
+    wc['phi']['coefficients'] = wc_coefs
+    if 'offset' in wc['phi']:
+        wc['phi']['offset'] = np.zeros_like(wc['phi']['offset'])
+    fir['phi']['coefficients'] = coefficients
+    if fir_i + 1 < len(modelspec) and \
+            'levelshift' in modelspec[fir_i + 1]['fn']:
+        level = np.asarray(modelspec[fir_i + 1]['phi']['level'], dtype=float)
+        modelspec[fir_i + 1]['phi']['level'] = np.reshape(bias, level.shape)
+
+    return modelspec
@@ -64,6 +64,95 @@ def nmse(result, pred_name='pred', resp_name='resp'):
     return mse / respstd
 
 
+# Residual of a sample whose prediction is not finite, in standard
+# deviations of the response. It has to be large and finite: a residual of
+# 0 would make a diverging model look perfect, and least_squares refuses to
+# start from a point with non-finite residuals.
+NONFINITE_RESIDUAL = 1e3
+
+
+def _residuals(result, pred_name, resp_name):
+    '''
+    Returns pred - resp over every sample, with 0 where the response is not
+    finite (so that the length only depends on the response) and a large
+    penalty where the prediction is not, and the finite response samples.
+    '''
+    pred = result[pred_name].as_continuous()
+    resp = result[resp_name].as_continuous()
+    keepidx = np.isfinite(resp)
+    kept = resp[keepidx]
+    with np.errstate(invalid='ignore', over='ignore'):
+        residuals = np.where(keepidx, pred - resp, 0).ravel()
+    diverged = ~np.isfinite(residuals)
+    if diverged.any():
+        scale = np.std(kept) if kept.size else 0
+        residuals[diverged] = NONFINITE_RESIDUAL * (scale if scale > 0 else 1)
+    return residuals, kept
+
+
+def mse_residuals(result, pred_name='pred', resp_name='resp'):
+    '''
+    Residual vector of mse, for least-squares fitters (see
+    nems.fitters.api.least_squares): one element per sample of the
+    response, such that the sum of their squares is the mse over the
+    finite samples of the response. Samples where the response is not
+    finite contribute 0, and samples where only the prediction is not
+    finite contribute NONFINITE_RESIDUAL response standard deviations.
+    '''
+    residuals, resp = _residuals(result, pred_name, resp_name)
+    return residuals / np.sqrt(max(resp.size, 1))
+
+
+def nmse_residuals(result, pred_name='pred', resp_name='resp'):
+    '''
+    Residual vector of nmse (see mse_residuals): where the prediction is
+    finite, the sum of the squares of its elements is nmse squared, so
+    that both have the same minimum.
+    '''
+    residuals, resp = _residuals(result, pred_name, resp_name)
+    respstd = np.std(resp) if resp.size else 0
+    if not respstd > 0:
+        return residuals / np.sqrt(max(resp.size, 1))
+    return residuals / (np.sqrt(resp.size) * respstd)
+
+
+def mse_batch(pred, resp):
+    '''
+    Same as mse, for a batch of predictions such as those returned by
+    nems.modelspec.evaluate_batch.
+
+    Parameters
+    ----------
+    pred : array (K, n_chans, n_times)
+        K predictions of the same response.
+    resp : array (n_chans, n_times)
+
+    Returns
+    -------
+    mse : array (K,)
+    '''
+    squared_errors = (pred-resp)**2
+    return np.nanmean(squared_errors, axis=(-2, -1))
+
+
+def nmse_batch(pred, resp):
+    '''
+    Same as nmse, for a batch of predictions (see mse_batch). Returns an
+    array of K values.
+    '''
+    keepidx = np.isfinite(pred) & np.isfinite(resp)
+    n = keepidx.sum(axis=(-2, -1))
+    safe_n = np.maximum(n, 1)
+    r = np.where(keepidx, resp, 0)
+    mean_r = r.sum(axis=(-2, -1)) / safe_n
+    dr = np.where(keepidx, resp - mean_r[:, np.newaxis, np.newaxis], 0)
+    respstd = np.sqrt((dr * dr).sum(axis=(-2, -1)) / safe_n)
+    squared_errors = np.where(keepidx, (pred-resp)**2, 0)
+    mse = np.sqrt(squared_errors.sum(axis=(-2, -1)) / safe_n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, mse / respstd, 1)
+
+
 def j_nmse(result, pred_name='pred', resp_name='resp', njacks=20):
     '''
     Jackknifed estimate of mean and SE on normalized MSE
@@ -2,9 +2,11 @@ import re
 import os
 import copy
 import json
+import time
 import importlib
 import numpy as np
 import scipy.stats as st
+import nems.profiling
 import nems.utils
 import nems.uri
 
@@ -144,6 +146,160 @@ def load_modelspecs(directory, basename, regex=None):
 lookup_table = {}  # TODO: Replace with real memoization/joblib later
 
 
+def compile_modelspec(modelspec, fs):
+    '''
+    Translates a fitted modelspec into the flat module graph used by
+    nems.serving: a list of {'op', 'i', 'o', 'arrays', 'attrs'} dicts with
+    every parameter resolved to the arrays the runtime needs (e.g. FIR
+    coefficients rather than the pole-zero parameters that generate them).
+
+    fs is the sampling rate of the input, needed by STP and pole-zero
+    filters. Raises ValueError for modules the runtime does not support or
+    whose normalization is still being recalculated.
+    '''
+    from nems.modules import fir, stp, weight_channels
+
+    graph = []
+    for m in modelspec:
+        fn = m['fn']
+        kw = {**m.get('fn_kwargs', {}), **m['phi']}
+        i = kw.pop('i', 'pred')
+        o = kw.pop('o', 'pred')
+        name = fn.rsplit('.', 1)[-1]
+        arrays = {}
+        attrs = {}
+
+        if fn in ('nems.modules.weight_channels.basic',
+                  'nems.modules.weight_channels.basic_with_offset'):
+            op = 'weight'
+            c = np.array(kw['coefficients'], dtype=float)
+            if kw.get('normalize_coefs'):
+                sc = np.sum(np.abs(c), axis=1, keepdims=True)
+                sc[sc == 0] = 1
+                c /= sc
+            arrays['coefficients'] = c
+            if 'offset' in kw:
+                arrays['offset'] = np.asarray(kw['offset'], dtype=float)
+        elif fn == 'nems.modules.weight_channels.gaussian':
+            op = 'weight'
+            arrays['coefficients'] = weight_channels.gaussian_coefficients(
+                    kw['mean'], kw['sd'], kw['n_chan_in'])
+        elif fn in _FIR_FNS:
+            op = 'fir'
+            if name == 'pole_zero':
+                c = fir.pz_coefficients(kw['poles'], kw['zeros'],
+                                        kw['delays'], kw['gains'],
+                                        kw.get('n_coefs', 10), fs=fs)
+            elif name == 'fir_dexp':
+                c = fir.fir_dexp_coefficients(kw['phi'],
+                                              kw.get('n_coefs', 10))
+            else:
+                c = kw['coefficients']
+                attrs['bank_count'] = int(kw.get('bank_count', 1))
+            arrays['coefficients'] = np.asarray(c, dtype=float)
+        elif fn == 'nems.modules.stp.short_term_plasticity':
+            if kw.get('crosstalk'):
+                raise ValueError('crosstalk not yet supported')
+            op = 'stp'
+            arrays['u'], arrays['tau'] = stp._stp_limits(kw['u'], kw['tau'],
+                                                         fs)
+        elif fn == 'nems.modules.levelshift.levelshift':
+            op = 'add'
+            arrays['level'] = np.asarray(kw['level'], dtype=float)
+        elif fn.startswith('nems.modules.nonlinearity.'):
+            op = 'nonlinearity'
+            attrs['kind'] = name
+            arrays.update({k: np.asarray(v, dtype=float)
+                           for k, v in kw.items()})
+        elif fn == 'nems.modules.sum.sum_channels':
+            op = 'sum'
+        elif fn == 'nems.modules.state.state_dc_gain':
+            op = 'state_gain'
+            arrays['g'] = np.asarray(kw['g'], dtype=float)
+            arrays['d'] = np.asarray(kw['d'], dtype=float)
+            attrs['s'] = kw['s']
+        elif fn == 'nems.modules.signal_mod.replicate_channels':
+            op = 'replicate'
+            attrs['repcount'] = int(kw.get('repcount', 2))
+        elif fn == 'nems.modules.signal_mod.merge_channels':
+            op = 'merge'
+            attrs['s'] = kw.get('s', 'state')
+        else:
+            raise ValueError('Module {} cannot be exported'.format(fn))
+        graph.append({'op': op, 'i': i, 'o': o, 'arrays': arrays,
+                      'attrs': attrs})
+
+        if 'norm' in m:
+            if m['norm'].get('recalc'):
+                raise ValueError('Module {} recalculates its normalization; '
+                                 'call fit_mode_off first'.format(fn))
+            graph.append({'op': 'norm', 'i': o, 'o': o, 'attrs': {},
+                          'arrays': {'d': np.asarray(m['norm']['d']),
+                                     'g': np.asarray(m['norm']['g'])}})
+    return graph
+
+
+def export_modelspec(modelspec, filepath, fs, output_name='pred'):
+    '''
+    Compiles a fitted modelspec (see compile_modelspec) and writes it to
+    filepath as a single-file artefact that nems.serving.load_model can
+    evaluate without the rest of NEMS. The scalar and string entries of the
+    modelspec metadata (modelname, cellid, ...) are kept with it.
+    '''
+    import nems.serving
+
+    meta = {}
+    for k, v in get_modelspec_metadata(modelspec).items():
+        if isinstance(v, np.generic):
+            v = v.item()
+        if isinstance(v, (str, int, float, bool)):
+            meta[k] = v
+    return nems.serving.save_model(filepath, compile_modelspec(modelspec, fs),
+                                   fs=fs, meta=meta, output=output_name)
+
+
+def evaluate_batch(rec, modelspecs, output_name='pred'):
+    '''
+    Evaluates K modelspecs that differ only in their parameter values (e.g.
+    the probes of a fitter, or samples from a posterior) on the same
+    recording in one vectorised pass, and returns their predictions
+    stacked as an array of shape (K, n_chans, n_times).
+
+    Each modelspec is compiled (see compile_modelspec) as soon as it is
+    produced, so modelspecs may be a generator that keeps unpacking new
+    parameters into the same modelspec, as a fitter's unpacker does. The
+    compiled graphs are stacked with nems.serving.stack_modules, so
+    parameters that are the same in all K modelspecs are applied once and
+    the rest as batched array operations. Raises ValueError if a module
+    cannot be compiled or the modelspecs differ in structure.
+    '''
+    from nems.serving import CompiledModel, stack_modules
+
+    fs = rec['stim'].fs
+    graphs = []
+    for modelspec in modelspecs:
+        graph = compile_modelspec(modelspec, fs)
+        # copy, since the phi arrays may be changed in place by the caller
+        for m in graph:
+            m['arrays'] = {k: np.array(v) for k, v in m['arrays'].items()}
+        graphs.append(graph)
+    if not graphs:
+        raise ValueError('No modelspecs to evaluate')
+    modules = stack_modules(graphs)
+
+    produced = set()
+    signals = {}
+    for m in modules:
+        for name in (m['i'], m['attrs'].get('s')):
+            if name is not None and name not in produced:
+                signals[name] = rec[name].as_continuous()
+        produced.add(m['o'])
+    stim = signals.pop('stim', rec['stim'].as_continuous())
+    model = CompiledModel(modules, fs=fs, output=output_name)
+    pred = model.predict(stim, **signals)
+    return np.broadcast_to(pred, (len(graphs),) + pred.shape[-2:])
+
+
 def _lookup_fn_at(fn_path):
     '''
     Private function that returns a function handle found at a
@@ -186,7 +342,7 @@ def fit_mode_off(modelspec):
             m['norm']['recalc'] = 0
 
 
-def evaluate(rec, modelspec, start=None, stop=None):
+def evaluate(rec, modelspec, start=None, stop=None, state=None):
     '''
     Given a recording object and a modelspec, return a prediction.
     Does not alter its arguments in any way.
@@ -194,13 +350,25 @@ def evaluate(rec, modelspec, start=None, stop=None):
     Note that a value of None for start will include the beginning
     of the list, and a value of None for stop will include the end
     of the list (whereas a value of -1 for stop will not).
+
+    If `state` is a dict, modules that remember past inputs (FIR filters
+    and STP) continue from the state left in state[i] by the previous call
+    for module i, and leave their final state there. Evaluating
+    consecutive blocks of time with the same dict gives the same
+    prediction as evaluating the whole recording at once.
     '''
     # d = copy.deepcopy(rec)  # Paranoid, but 100% safe
     d = copy.copy(rec)  # About 10x faster & fine if Signals are immutable
-    for m in modelspec[start:stop]:
+    profile = nems.profiling.enabled()
+    indices = range(len(modelspec))[start:stop]
+    for i, m in zip(indices, modelspec[start:stop]):
+        if profile:
+            t0 = time.perf_counter()
         fn = _lookup_fn_at(m['fn'])
         fn_kwargs = m.get('fn_kwargs', {})
         kwargs = {**fn_kwargs, **m['phi']}  # Merges both dicts
+        if state is not None and m['fn'] in _STATEFUL_FNS:
+            kwargs['state'] = state.setdefault(i, {})
         new_signals = fn(rec=d, **kwargs)
         if type(new_signals) is not list:
             raise ValueError('Fn did not return list of signals: {}'.format(m))
@@ -229,9 +397,245 @@ def evaluate(rec, modelspec, start=None, stop=None):
 
         for s in new_signals:
             d.add_signal(s)
+
+        if profile:
+            nems.profiling.record('evaluate:%d--%s' % (i, m['fn']),
+                                  time.perf_counter() - t0)
     return d
 
 
+# Modules that act on each time bin independently of the others.
+_POINTWISE_FNS = {
+    'nems.modules.weight_channels.basic',
+    'nems.modules.weight_channels.basic_with_offset',
+    'nems.modules.weight_channels.gaussian',
+    'nems.modules.levelshift.levelshift',
+    'nems.modules.sum.sum_channels',
+    'nems.modules.nonlinearity.logistic_sigmoid',
+    'nems.modules.nonlinearity.tanh',
+    'nems.modules.nonlinearity.quick_sigmoid',
+    'nems.modules.nonlinearity.double_exponential',
+    'nems.modules.nonlinearity.dlog',
+}
+
+# Finite impulse response modules, whose output depends on the last
+# n_coefs bins of their input.
+_FIR_FNS = {
+    'nems.modules.fir.basic',
+    'nems.modules.fir.filter_bank',
+    'nems.modules.fir.pole_zero',
+    'nems.modules.fir.fir_dexp',
+}
+
+# Modules whose output depends on their whole input history, and that
+# accept a `state` dict to carry it from one call to the next.
+_STATEFUL_FNS = _FIR_FNS | {'nems.modules.stp.short_term_plasticity'}
+
+
+def _module_memory(m):
+    '''
+    Returns the number of past time bins the output of module m depends on,
+    or None if the module is not a causal, time-invariant function of its
+    input alone (eg. it reads a state signal or has unbounded memory).
+    '''
+    fn = m['fn']
+    if fn in _POINTWISE_FNS:
+        return 0
+    if fn in _FIR_FNS:
+        kwargs = {**m.get('fn_kwargs', {}), **m.get('phi', {})}
+        if 'coefficients' in kwargs:
+            return np.asarray(kwargs['coefficients']).shape[-1] - 1
+        if 'n_coefs' in kwargs:
+            return kwargs['n_coefs'] - 1
+    return None
+
+
+def stimulus_prefix(modelspec, input_name='stim'):
+    '''
+    Returns (n, memory): the number of leading modules of modelspec that
+    are driven only by the signal input_name (directly or through earlier
+    modules of the prefix) and are causal with finite memory, and the total
+    number of past bins their combined output depends on.
+    '''
+    produced = {input_name}
+    memory = 0
+    for n, m in enumerate(modelspec):
+        mem = _module_memory(m)
+        i = m.get('fn_kwargs', {}).get('i')
+        if mem is None or 'norm' in m or i not in produced:
+            return n, memory
+        memory += mem
+        produced.add(m['fn_kwargs'].get('o', i))
+    return len(modelspec), memory
+
+
+def _unique_stim_plan(sig, epoch_regex, pad):
+    '''
+    Splits sig into the epochs matching epoch_regex plus the gaps between
+    them, and groups together segments whose data (including `pad` bins of
+    preceding history) are identical.
+
+    Returns (compact, gather), where compact is the concatenation of one
+    padded copy of each unique segment, and gather maps every time bin of
+    sig onto the compact bin that has the same output. Returns None if
+    no segment repeats. Plans are cached on the signal, since fits call
+    this with the same data over and over.
+    '''
+    cache = getattr(sig, '_unique_stim_plans', None)
+    if cache is None:
+        cache = sig._unique_stim_plans = {}
+    key = (epoch_regex, pad)
+    if key in cache:
+        return cache[key]
+
+    import nems.epoch as ep
+    data = sig.as_continuous()
+    n_times = data.shape[1]
+    bounds = [sig.get_epoch_indices(name)
+              for name in ep.epoch_names_matching(sig.epochs, epoch_regex)]
+    bounds = np.concatenate(bounds) if bounds else np.empty((0, 2), int)
+    bounds = bounds[np.argsort(bounds[:, 0], kind='stable')]
+
+    # Keep non-overlapping epochs and fill the gaps between them
+    segments = []
+    t = 0
+    for lb, ub in bounds:
+        if lb < t or ub <= lb:
+            continue
+        if lb > t:
+            segments.append((t, lb))
+        segments.append((lb, ub))
+        t = ub
+    if t < n_times:
+        segments.append((t, n_times))
+
+    unique = {}
+    chunks = []
+    gather = np.empty(n_times, dtype=int)
+    c_len = 0
+    for lb, ub in segments:
+        plb = max(lb - pad, 0)
+        x = data[:, plb:ub]
+        # Segments at the very start have no history to compare, and must
+        # also come first in the compact data so that filters start up in
+        # the same way as on the full signal.
+        seg_key = (plb == 0 and lb < pad, x.shape, x.tobytes())
+        if seg_key not in unique:
+            unique[seg_key] = c_len + (lb - plb)
+            chunks.append(x)
+            c_len += x.shape[1]
+        gather[lb:ub] = np.arange(ub - lb) + unique[seg_key]
+
+    if c_len >= n_times:
+        plan = None
+    else:
+        plan = (np.concatenate(chunks, axis=1), gather)
+    cache[key] = plan
+    return plan
+
+
+def evaluate_unique_stim(rec, modelspec, start=None, stop=None,
+                         epoch_regex='^STIM_', input_name='stim'):
+    '''
+    Same as evaluate(), but the stimulus-driven prefix of the modelspec
+    (see stimulus_prefix) is only evaluated once per unique stimulus
+    epoch. Each unique epoch is evaluated with enough pre-stimulus padding
+    to cover the memory of its FIR filters, and the output is then
+    scattered back to every occurrence of the epoch before the rest of the
+    modelspec is evaluated as usual. The result is the same as evaluate()
+    whenever repeated epochs have identical input, which is checked rather
+    than assumed.
+
+    Falls back to evaluate() when start is given, the prefix is empty or
+    no epoch repeats.
+    '''
+    n, pad = stimulus_prefix(modelspec, input_name)
+    end = len(modelspec[:stop])
+    n = min(n, end)
+    sig = rec.signals.get(input_name)
+    plan = None
+    if start is None and n > 0 and hasattr(sig, 'as_continuous'):
+        plan = _unique_stim_plan(sig, epoch_regex, pad)
+    if plan is None:
+        return evaluate(rec, modelspec, start=start, stop=stop)
+
+    compact, gather = plan
+    d = rec.copy()
+    d.add_signal(sig._modified_copy(compact, epochs=None))
+    d = evaluate(d, modelspec, stop=n)
+
+    d_full = rec.copy()
+    outputs = {m['fn_kwargs'].get('o', m['fn_kwargs']['i'])
+               for m in modelspec[:n]}
+    for o in outputs:
+        s = d[o]
+        d_full.add_signal(sig._modified_copy(s.as_continuous()[:, gather],
+                                             name=o, chans=s.chans))
+    if n == end:
+        return d_full
+    return evaluate(d_full, modelspec, start=n, stop=end)
+
+
+def _resample_taps(coefficients, q, n_taps=None):
+    '''
+    Maps FIR coefficients (taps on the last axis) to a sampling rate q
+    times lower: taps are summed in blocks of q, or, for q < 1, each tap is
+    spread evenly over 1/q taps. The result is cut or zero-padded to n_taps.
+    '''
+    c = np.asarray(coefficients, dtype=float)
+    if q >= 1:
+        q = int(round(q))
+        n = -(-c.shape[-1] // q)
+        pad = [(0, 0)] * (c.ndim - 1) + [(0, n * q - c.shape[-1])]
+        c = np.pad(c, pad, mode='constant').reshape(c.shape[:-1] + (n, q))
+        c = c.sum(axis=-1)
+    else:
+        r = int(round(1 / q))
+        c = np.repeat(c, r, axis=-1) / r
+    if n_taps is not None:
+        pad = [(0, 0)] * (c.ndim - 1) + [(0, max(n_taps - c.shape[-1], 0))]
+        c = np.pad(c[..., :n_taps], pad, mode='constant')
+    return c
+
+
+def resample_modelspec(modelspec, q, like=None):
+    '''
+    Returns a copy of modelspec with its parameters mapped to data sampled
+    q times more coarsely (q > 1), or 1/q times more finely (q < 1), such
+    that it predicts about the same response from the resampled stimulus
+    (see Recording.resample).
+
+    FIR filters (fir.basic and fir.filter_bank) keep their duration in
+    seconds: their taps are summed in blocks of q, or spread over 1/q taps.
+    If like is given, every filter is cut or zero-padded to the number of
+    taps of the matching module of like, e.g. to return to the exact shape
+    of a modelspec that was coarsened before. The STP depletion per bin, u,
+    is scaled by q, while tau is in seconds and is kept. All other modules
+    do not depend on the sampling rate and are copied as they are.
+
+    Raises ValueError for parametric filters (pole_zero and fir_dexp),
+    whose number of taps is set in their fn_kwargs.
+    '''
+    q = float(q)
+    if not (np.isclose(q, round(q)) or np.isclose(1 / q, round(1 / q))):
+        raise ValueError('Can only resample by a whole factor, not {}'
+                         .format(q))
+    modelspec = copy.deepcopy(modelspec)
+    for i, m in enumerate(modelspec):
+        fn = m['fn']
+        if fn in ('nems.modules.fir.basic', 'nems.modules.fir.filter_bank'):
+            n_taps = None
+            if like is not None:
+                n_taps = np.shape(like[i]['phi']['coefficients'])[-1]
+            m['phi']['coefficients'] = _resample_taps(
+                    m['phi']['coefficients'], q, n_taps)
+        elif fn in _FIR_FNS:
+            raise ValueError('Cannot resample the taps of {}'.format(fn))
+        elif fn == 'nems.modules.stp.short_term_plasticity':
+            m['phi']['u'] = np.asarray(m['phi']['u'], dtype=float) * q
+    return modelspec
+
+
 def summary_stats(modelspecs, mod_key='fn', meta_include=[]):
     '''
     Generates summary statistics for a list of modelspecs.
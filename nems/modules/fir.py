@@ -15,7 +15,7 @@ def get_zi(b, x):
     return scipy.signal.lfilter(b, [1], null_data, zi=zi)[1]
 
 
-def per_channel(x, coefficients, bank_count=1):
+def per_channel(x, coefficients, bank_count=1, state=None):
     '''Private function used by fir_filter().
 
     Parameters
@@ -33,6 +33,11 @@ def per_channel(x, coefficients, bank_count=1):
         ``coefficients[filter_i * n_banks + bank_i]``.
     bank_count : int
         Number of filters in each bank.
+    state : dict, optional
+        If given, the filters start from the final conditions left in
+        ``state['zf']`` by the previous call (when present) instead of the
+        steady state for ``x[:, 0]``, and their final conditions are stored
+        there afterwards. This lets a long signal be filtered in blocks.
 
     Returns
     -------
@@ -65,6 +70,8 @@ def per_channel(x, coefficients, bank_count=1):
 
     c_iter = iter(coefficients)
     out = np.zeros((bank_count, x.shape[1]))
+    zi_iter = iter(state['zf']) if state and 'zf' in state else None
+    final = []
     for i_out in range(bank_count):
         for i_bank in range(n_banks):
             x_ = next(all_x)
@@ -72,13 +79,16 @@ def per_channel(x, coefficients, bank_count=1):
             # It is slightly more "correct" to use lfilter than convolve at
             # edges, but but also about 25% slower (Measured on Intel Python
             # Dist, using i5-4300M)
-            zi = get_zi(c, x_)
+            zi = get_zi(c, x_) if zi_iter is None else next(zi_iter)
             r, zf = scipy.signal.lfilter(c, [1], x_, zi=zi)
             out[i_out] += r
+            final.append(zf)
+    if state is not None:
+        state['zf'] = final
     return out
 
 
-def basic(rec, i='pred', o='pred', coefficients=[]):
+def basic(rec, i='pred', o='pred', coefficients=[], state=None):
     """
     apply fir filters of the same size in parallel. convolve in time, then
     sum across channels
@@ -92,9 +102,12 @@ def basic(rec, i='pred', o='pred', coefficients=[]):
         of coefficients matrix.
     output :
         nems signal in 'o' will be 1 x time singal (single channel)
+    state :
+        optional dict carrying the filter state between calls, see
+        per_channel()
     """
 
-    fn = lambda x: per_channel(x, coefficients)
+    fn = lambda x: per_channel(x, coefficients, state=state)
     return [rec[i].transform(fn, o)]
 
 
@@ -120,7 +133,7 @@ def pz_coefficients(poles=None, zeros=None, delays=None,
 
 
 def pole_zero(rec, i='pred', o='pred', poles=None, zeros=None, delays=None,
-              gains=None, n_coefs=10):
+              gains=None, n_coefs=10, state=None):
     """
     apply pole_zero -defined filter
     generate impulse response and then call as if basic fir filter
@@ -135,7 +148,7 @@ def pole_zero(rec, i='pred', o='pred', poles=None, zeros=None, delays=None,
     coefficients = pz_coefficients(poles=poles, zeros=zeros, delays=delays,
                                    gains=gains, n_coefs=n_coefs, fs=rec[i].fs)
 
-    fn = lambda x: per_channel(x, coefficients)
+    fn = lambda x: per_channel(x, coefficients, state=state)
     return [rec[i].transform(fn, o)]
 
 def fir_dexp_coefficients(phi=None, n_coefs=20):
@@ -166,7 +179,7 @@ def fir_dexp_coefficients(phi=None, n_coefs=20):
     return coefs
 
 
-def fir_dexp(rec, i='pred', o='pred', phi=None, n_coefs=10):
+def fir_dexp(rec, i='pred', o='pred', phi=None, n_coefs=10, state=None):
     """
     apply pole_zero -defined filter
     generate impulse response and then call as if basic fir filter
@@ -180,11 +193,12 @@ def fir_dexp(rec, i='pred', o='pred', phi=None, n_coefs=10):
 
     coefficients = fir_dexp_coefficients(phi, n_coefs)
 
-    fn = lambda x: per_channel(x, coefficients)
+    fn = lambda x: per_channel(x, coefficients, state=state)
     return [rec[i].transform(fn, o)]
 
 
-def filter_bank(rec, i='pred', o='pred', coefficients=[], bank_count=1):
+def filter_bank(rec, i='pred', o='pred', coefficients=[], bank_count=1,
+                state=None):
     """
     apply multiple basic fir filters of the same size in parallel, producing
     one output channel per filter.
@@ -206,5 +220,5 @@ def filter_bank(rec, i='pred', o='pred', coefficients=[], bank_count=1):
     TODO: test, optimize. maybe structure coefficients more logically?
     """
 
-    fn = lambda x: per_channel(x, coefficients, bank_count)
+    fn = lambda x: per_channel(x, coefficients, bank_count, state=state)
     return [rec[i].transform(fn, o)]
@@ -8,4 +8,4 @@ def levelshift(rec, i, o, level):
     level : a scalar to add to every element of the input signal.
     '''
     fn = lambda x: x + level
-    return [rec[i].transform(fn, o)]
+    return [rec[i].transform(fn, o, pointwise=True)]
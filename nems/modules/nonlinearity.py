@@ -1,4 +1,3 @@
-import cProfile
 import numpy as np
 from numpy import exp
 
@@ -11,7 +10,7 @@ def _logistic_sigmoid(x, base, amplitude, shift, kappa):
 def logistic_sigmoid(rec, i, o, base, amplitude, shift, kappa):
 
     fn = lambda x: _logistic_sigmoid(x, base, amplitude, shift, kappa)
-    return [rec[i].transform(fn, o)]
+    return [rec[i].transform(fn, o, pointwise=True)]
 
 
 def _tanh(x, base, amplitude, shift, kappa):
@@ -20,7 +19,7 @@ def _tanh(x, base, amplitude, shift, kappa):
 
 def tanh(rec, i, o, base, amplitude, shift, kappa):
     fn = lambda x : _tanh(x, base, amplitude, shift, kappa)
-    return [rec[i].transform(fn, o)]
+    return [rec[i].transform(fn, o, pointwise=True)]
 
 
 def _quick_sigmoid(x, base, amplitude, shift, kappa):
@@ -30,7 +29,7 @@ def _quick_sigmoid(x, base, amplitude, shift, kappa):
 
 def quick_sigmoid(rec, i, o, base, amplitude, shift, kappa):
     fn = lambda x : _quick_sigmoid(x, base, amplitude, shift, kappa)
-    return [rec[i].transform(fn, o)]
+    return [rec[i].transform(fn, o, pointwise=True)]
 
 
 def _double_exponential(x, base, amplitude, shift, kappa):
@@ -57,38 +56,31 @@ def double_exponential(rec, i, o, base, amplitude, shift, kappa):
     # fn = lambda x : _quick_sigmoid(x, base, amplitude, shift, kappa)
     # fn = lambda x : _tanh(x, base, amplitude, shift, kappa)
     # fn = lambda x : _logistic_sigmoid(x, base, amplitude, shift, kappa)
-    return [rec[i].transform(fn, o)]
+    return [rec[i].transform(fn, o, pointwise=True)]
 
 
 def _dlog(x, offset):
-
-    # soften effects of more extreme offsets
+    # soften effects of more extreme offsets, elementwise so that a batch
+    # of offsets can be applied at once (see nems.serving)
     inflect = 2
-    if offset > inflect:
-        adjoffset = inflect + (offset-inflect) / 50
-    elif offset < -inflect:
-        adjoffset = -inflect + (offset + inflect) / 50
-    else:
-        adjoffset = offset
-
+    offset = np.asarray(offset)
+    adjoffset = np.where(offset > inflect, inflect + (offset-inflect) / 50,
+                         np.where(offset < -inflect,
+                                  -inflect + (offset + inflect) / 50, offset))
     d = 10.0**adjoffset
-    zeroer = 0
-    zbt = 0
     y = x.copy()
 
     # avoid nan-related warning
-    out = ~np.isnan(y)
-    out[out] = y[out] < zbt
-
-    y[out] = zbt
-    y = y - zbt
+    below = ~np.isnan(y)
+    below[below] = y[below] < 0
+    y[below] = 0
 
-    return np.log((y + d) / d) + zeroer
+    return np.log((y + d) / d)
 
 
 def dlog(rec, i, o, offset):
 
     fn = lambda x : _dlog(x, offset)
 
-    return [rec[i].transform(fn, o)]
+    return [rec[i].transform(fn, o, pointwise=True)]
 
@@ -5,8 +5,6 @@ functions for modifying signals (merging, averaging, subsampling)
 """
 
 import numpy as np
-import nems.signal as signal
-import nems.preprocessing as preproc
 
 
 #def make_state_signal(rec, signals_in=['pupil'], signals_permute=[], o='state'):
@@ -29,6 +27,7 @@ import nems.preprocessing as preproc
 
 
 def average_sig(rec, i='resp', o='resp'):
+    import nems.preprocessing as preproc
 
     return [preproc.generate_average_sig(rec[i], new_signalname=o,
             epoch_regex='^STIM_')]
@@ -46,14 +45,13 @@ def replicate_channels(rec, i='pred', o='pred', repcount=2):
 def _merge_states(x, state):
     """
     inputs
-       x - N x T matrix,
+       x - N x T matrix, or (..., N, T) for a batch of them
        s - 1 X T matrix with integer values 0 ... N-1
     """
-    res = np.zeros_like(x[:1, :])
-    res.fill(np.nan)
-    # print(state.shape)
-    for i in range(x.shape[0]):
-        res[state[-1:, :] == i] = x[i, state[-1, :] == i]
+    res = np.full_like(x[..., :1, :], np.nan)
+    for i in range(x.shape[-2]):
+        match = state[-1, :] == i
+        res[..., 0, match] = x[..., i, match]
     return res
 
 
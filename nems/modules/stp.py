@@ -1,23 +1,32 @@
 import numpy as np
 from numpy import exp
 
-def short_term_plasticity(rec, i, o, u, tau, crosstalk=0):
+def short_term_plasticity(rec, i, o, u, tau, crosstalk=0, state=None):
     '''
     STP applied to each input channel.
     parameterized by Markram-Todyks model:
         u (release probability)
         tau (recovery time constant)
+    state, if given, carries the depression between calls (see _stp)
     '''
-    fn = lambda x : _stp(x, u, tau, crosstalk, rec[i].fs)
+    fn = lambda x : _stp(x, u, tau, crosstalk, rec[i].fs, state=state)
 
     return [rec[i].transform(fn, o)]
 
 
-def _stp(X, u, tau, crosstalk=0, fs=1):
+def _stp(X, u, tau, crosstalk=0, fs=1, state=None):
     """
     STP core function
+
+    If state is a dict, each channel continues from the depression left in
+    it by the previous call rather than starting fully recovered, and the
+    final depression is stored back into it. Consecutive blocks of a long
+    input then give the same result as processing it in one go.
     """
-    s = X.shape
+    # TODO : enable crosstalk
+    if crosstalk:
+        raise ValueError('crosstalk not yet supported')
+
     tstim = X.copy()
     tstim[np.isnan(tstim)] = 0
     tstim[tstim < 0] = 0
@@ -26,63 +35,116 @@ def _stp(X, u, tau, crosstalk=0, fs=1):
     #       need to know something about magnitude of inputs???
 
     # TODO: move bounds to fitter? slow
+    ui, taui = _stp_limits(np.ravel(u), np.ravel(tau), fs)
 
-    # limits, assumes input (X) range is approximately -1 to +1
-    ui = u.copy()
+    # TODO : allow >1 STP channel per input?
+    carried = state is not None and 'td' in state
+    stim_out, td, ustim = _stp_depression(
+            tstim, ui, taui, state['td'] if carried else None,
+            state['ustim'] if carried else None)
+
+    if state is not None and td is not None:
+        state['td'] = td
+        state['ustim'] = ustim
 
-    #ui[ui > 1] = 1
-    #ui[ui < -0.4] = -0.4
+    stim_out[np.isnan(X)] = np.nan
+    return stim_out
+
+
+def _stp_limits(u, tau, fs=1):
+    """
+    Returns the release probability and the time constant, converted from
+    seconds to bins, that the STP recurrence actually uses for u and tau.
+    Also used by nems.modelspec.compile_modelspec, so that exported models
+    store the same values.
+    """
+    # limits, assumes input (X) range is approximately -1 to +1
+    ui = np.array(u, dtype=float)
 
     # convert tau units from sec to bins
-    taui = np.absolute(tau.copy()) * fs
+    taui = np.absolute(np.array(tau, dtype=float)) * fs
     taui[taui < 2] = 2
 
     # avoid ringing if combination of strong depression and
     # rapid recovery is too large
     rat = ui**2 / taui
-    ui[rat>0.1] = np.sqrt(0.1 * taui[rat>0.1])
-    #taui[rat>0.08] = (ui[rat>0.08]**2) / 0.08
+    ui[rat > 0.1] = np.sqrt(0.1 * taui[rat > 0.1])
+    return ui, taui
 
-    #print("rat: %s" % (ui**2 / taui))
 
-    # TODO : enable crosstalk
-    if crosstalk:
-        raise ValueError('crosstalk not yet supported')
+def _stp_depression(stim, u, taui, td=None, ustim=None):
+    """
+    The STP recurrence on a non-negative stim (n_chans, n_times), with u
+    and taui as returned by _stp_limits. Returns (out, td, ustim): stim
+    scaled by the depression of each bin, and the depression and input
+    term of the last bin, from which a following block of input continues
+    when they are passed back as td and ustim. With td None, every channel
+    starts fully recovered and its first bin is left as it is.
 
-    # TODO : allow >1 STP channel per input?
+    Parameters with leading batch axes (see nems.serving.stack_modules)
+    are broadcast against stim, and out gets the batch axes too. This is
+    shared with nems.serving, which carries td and ustim between pushes.
+    """
+    if stim.shape[-1] == 0:
+        return stim.copy(), td, ustim
+    if stim.ndim == 2 and np.ndim(u) == 1:
+        return _stp_channels(stim, u, taui, td, ustim)
+    return _stp_batch(stim, u, taui, td, ustim)
 
-    # go through each stimulus channel
-    stim_out = tstim  # allocate scaling term
-    for i in range(0, s[0]):
-        td = 1  # initialize, dep state of previous time bin
-        a = 1/taui[i]
-        ustim = 1.0/taui[i] + ui[i] * tstim[i, :]
-        # ustim = ui[i] * tstim[i, :]
-        if ui[i] == 0:
-            # passthru, no STP, preserve stim_out = tstim
-            pass
-        elif ui[i] > 0:
-            # depression
-            for tt in range(1, s[1]):
-                # td = di[i, tt - 1]  # previous time bin depression
-                # delta = (1 - td) / taui[i] - ui[i] * td * tstim[i, tt - 1]
-                # delta = 1/taui[i] - td * (1/taui[i] - ui[i] * tstim[i, tt - 1])
-                # then a=1/taui[i] and ustim=1/taui[i] - ui[i] * tstim[i,:]
-                delta = a - td * ustim[tt - 1]
-                if td + delta > 0:
-                    td = td + delta
-                else:
-                    td = 0
-                # td = np.max([td, 0])
-                stim_out[i, tt] *= td
-        else:
-            # facilitation
-            for tt in range(1, s[1]):
-                delta = a - td * ustim[tt - 1]
-                td = td + delta
-                # td = np.min([td, 1])
-                stim_out[i, tt] *= td
-    # print("(u,tau)=({0},{1})".format(ui,taui))
 
-    stim_out[np.isnan(X)] = np.nan
-    return stim_out
+def _stp_channels(stim, u, taui, td, ustim):
+    """
+    _stp_depression for one model: scalar loop over time for each channel,
+    fastest for few channels.
+    """
+    n_chans, n = stim.shape
+    out = stim.copy()
+    started = td is not None
+    td = np.ones(n_chans) if td is None else np.array(td, dtype=float)
+    ustim = np.zeros(n_chans) if ustim is None else np.array(ustim,
+                                                            dtype=float)
+    for i in range(n_chans):
+        a = 1 / taui[i]
+        x = a + u[i] * stim[i]
+        if u[i] != 0:
+            d = td[i]
+            # x[tt] is the input term of the bin before tt
+            x = np.concatenate([[ustim[i]], x])
+            row = out[i]
+            for tt in range(0 if started else 1, n):
+                d = d + (a - d * x[tt])
+                if u[i] > 0 and d < 0:
+                    # depression
+                    d = 0
+                row[tt] *= d
+            td[i] = d
+            x = x[1:]
+        ustim[i] = x[-1]
+    return out, td, ustim
+
+
+def _stp_batch(stim, u, taui, td, ustim):
+    """
+    _stp_depression for batched parameters or inputs: loop over time,
+    vectorised over the batch and channels. A channel with u == 0 keeps
+    td == 1 exactly.
+    """
+    n = stim.shape[-1]
+    batch = np.broadcast_shapes(stim.shape[:-1], np.shape(u))
+    out = np.array(np.broadcast_to(stim, batch + (n,)))
+    a = np.broadcast_to(1 / taui, batch)
+    x = a[..., np.newaxis] + u[..., np.newaxis] * stim
+    x = np.broadcast_to(x, batch + (n,))
+    clip = np.broadcast_to(u > 0, batch)
+    if td is None:
+        td = np.ones(batch)
+        first = 1
+    else:
+        td = np.array(np.broadcast_to(td, batch))
+        first = 0
+    for tt in range(first, n):
+        previous = x[..., tt - 1] if tt else ustim
+        td = td + (a - td * previous)
+        td[clip & (td < 0)] = 0
+        out[..., tt] *= td
+    return out, td, x[..., -1].copy()
@@ -48,7 +48,7 @@ def basic(rec, i, o, coefficients, normalize_coefs=False):
     else:
         fn = lambda x: coefficients @ x
 
-    return [rec[i].transform(fn, o)]
+    return [rec[i].transform(fn, o, pointwise=True)]
 
 
 def basic_with_offset(rec, i, o, coefficients, offset, normalize_coefs=False):
@@ -72,7 +72,7 @@ def basic_with_offset(rec, i, o, coefficients, offset, normalize_coefs=False):
         c = coefficients
 
     fn = lambda x: c @ x + offset
-    return [rec[i].transform(fn, o)]
+    return [rec[i].transform(fn, o, pointwise=True)]
 
 
 def gaussian(rec, i, o, n_chan_in, mean, sd, **kw_args):
@@ -92,4 +92,4 @@ def gaussian(rec, i, o, n_chan_in, mean, sd, **kw_args):
     '''
     coefficients = gaussian_coefficients(mean, sd, n_chan_in)
     fn = lambda x: coefficients @ x
-    return [rec[i].transform(fn, o)]
+    return [rec[i].transform(fn, o, pointwise=True)]
@@ -29,8 +29,6 @@ from functools import wraps
 import pandas as pd
 
 import matplotlib
-matplotlib.use("Qt5Agg")
-import matplotlib.pyplot as plt
 import numpy as np
 
 import PyQt5.QtCore as qc
@@ -43,8 +41,6 @@ from matplotlib.figure import Figure
 
 #import nems_db.db as nd
 #import nems_db.xform_wrappers as nw
-import nems.xforms as xforms
-import nems.plots.api as nplt
 from nems.recording import Recording
 import nems.signal
 from nems.plots.utils import ax_remove_box
@@ -561,6 +557,9 @@ def pandas_table_test():
 
 def browse_recording(rec, signals=['stim', 'resp'], cellid=None,
                      modelname=None):
+    # Only switch pyplot to the Qt backend once a browser window is actually
+    # opened, rather than as a side effect of importing this module.
+    matplotlib.use("Qt5Agg")
     aw = ApplicationWindow(recording=rec, signals=signals,
                            cellid=cellid, modelname=modelname)
     _window_startup(aw)
@@ -105,8 +105,25 @@ def basic(fitkey):
     Options
     -------
     cd : Use coordinate_descent for fitting (default is scipy_minimize)
+    ls : Use least_squares for fitting, on the residuals of the metric
+         (see nems.fitters.api.least_squares).
     miN : Set maximum iterations to N, where N is any positive integer.
     tN : Set tolerance to 10**-N, where N is any positive integer.
+    prof : Record per-module timing during the fit (see nems.profiling).
+    us : Evaluate the stimulus-driven modules once per unique stimulus
+         (see nems.modelspec.evaluate_unique_stim).
+    batch : Evaluate the fitter's probes in vectorised batches
+            (see nems.modelspec.evaluate_batch).
+    c2fN,M : Fit coarse to fine, first at 1/N, then 1/M, ... of the
+             sampling rate and finally at full resolution
+             (see nems.analysis.fit_coarse_to_fine). c2f alone is c2f4,2.
+    psN : Fit to 1/N of the stimulus epochs first, doubling the fraction
+          until all data are used (see
+          nems.analysis.fit_progressive_subsets). ps alone is ps8.
+    secN : Stop each fit after N seconds.
+    evN : Stop each fit after N evaluations of the cost function.
+    irN : Stop each fit once the error improves by less than 10**-N
+          (relative) over 10 steps.
 
     '''
 
@@ -117,6 +134,24 @@ def basic(fitkey):
     xfspec = [['nems.xforms.fit_basic',
                {'max_iter': max_iter,
                 'fitter': fitter, 'tolerance': tolerance}]]
+    if 'prof' in options:
+        xfspec[0][1]['profile'] = True
+    if 'us' in options:
+        xfspec[0][1]['unique_stim'] = True
+    if 'batch' in options:
+        xfspec[0][1]['batch'] = True
+    for op in options:
+        if op.startswith('c2f'):
+            factors = [int(f) for f in op[3:].split(',') if f] or [4, 2]
+            xfspec[0][1]['coarse_to_fine'] = factors + [1]
+        elif op.startswith('ps'):
+            xfspec[0][1]['start_fraction'] = 1 / int(op[2:] or 8)
+        elif op.startswith('sec'):
+            xfspec[0][1]['max_time'] = float(op[3:])
+        elif op.startswith('ev'):
+            xfspec[0][1]['max_evals'] = int(op[2:])
+        elif op.startswith('ir'):
+            xfspec[0][1]['min_improvement'] = 10**(-float(op[2:]))
 
     return xfspec
 
@@ -150,6 +185,9 @@ def iter(fitkey):
     tiN : Perform N per-tolerance-level iterations, where N is any
           positive integer.
     fiN : Perform N per-fit iterations, where N is any positive integer.
+    prof : Record per-module timing during the fit (see nems.profiling).
+    us : Evaluate the stimulus-driven modules once per unique stimulus
+         (see nems.modelspec.evaluate_unique_stim).
 
     '''
 
@@ -162,10 +200,40 @@ def iter(fitkey):
                {'module_sets': module_sets, 'fitter': fitter,
                 'tolerances': tolerances, 'tol_iter': tol_iter,
                 'fit_iter': fit_iter}]]
+    if 'prof' in options:
+        xfspec[0][1]['profile'] = True
+    if 'us' in options:
+        xfspec[0][1]['unique_stim'] = True
 
     return xfspec
 
 
+def pop(fitkey):
+    '''
+    Perform a fit_population analysis on a model, fitting every response
+    channel at once with independent parameters per channel.
+
+    Parameters
+    ----------
+    fitkey : str
+        Expected format: pop.<misc>
+        Example: pop.mi500.t6
+        Example translation:
+            Use fit_population with 500 maximum steps per unit and a
+            tolerance of 10**-6.
+
+    Options
+    -------
+    miN : Set maximum iterations to N, where N is any positive integer.
+    tN : Set tolerance to 10**-N, where N is any positive integer.
+
+    '''
+    options = _extract_options(fitkey)
+    max_iter, tolerance, _ = _parse_basic(options)
+    return [['nems.xforms.fit_population',
+             {'max_iter': max_iter, 'tolerance': tolerance}]]
+
+
 def _extract_options(fitkey):
     if fitkey == 'basic' or fitkey == 'iter':
         # empty options (i.e. just use defualts)
@@ -193,6 +261,8 @@ def _parse_basic(options):
             tolerance = 10**tolpower
         elif op == 'cd':
             fitter = 'coordinate_descent'
+        elif op == 'ls':
+            fitter = 'least_squares'
 
     return max_iter, tolerance, fitter
 
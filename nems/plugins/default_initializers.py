@@ -9,11 +9,14 @@ log = logging.getLogger(__name__)
 def init(kw):
     ops = escaped_split(kw, '.')[1:]
     st = False
+    ridge = False
     tolerance = 10**-5.5
 
     for op in ops:
         if op == 'st':
             st = True
+        elif op == 'ridge':
+            ridge = True
         elif op.startswith('t'):
             # Should use \ to escape going forward, but keep d-sub in
             # for backwards compatibility.
@@ -24,7 +27,10 @@ def init(kw):
     if st:
         return [['nems.xforms.fit_state_init', {'tolerance': tolerance}]]
     else:
-        return [['nems.xforms.fit_basic_init', {'tolerance': tolerance}]]
+        xfspec = [['nems.xforms.fit_basic_init', {'tolerance': tolerance}]]
+        if ridge:
+            xfspec[0][1]['ridge'] = True
+        return xfspec
 
 
 # TOOD: Maybe these should go in fitters instead?
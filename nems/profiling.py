@@ -0,0 +1,125 @@
+'''
+Lightweight, opt-in instrumentation for model evaluation and fitting.
+
+When enabled, modelspec.evaluate() accumulates the wall time and call count
+of every module it evaluates, and basic_cost() does the same for the
+segmentor, evaluator and metric. The fit_basic and fit_iteratively analyses
+enable it when called with profile=True, and store the resulting table in
+the modelspec metadata under the 'profile' key.
+
+Typical use outside of an analysis:
+
+    import nems.profiling
+    nems.profiling.enable()
+    pred = ms.evaluate(rec, modelspec)
+    print(nems.profiling.format_table(nems.profiling.get_stats()))
+    nems.profiling.disable()
+
+Profiling is off by default, in which case the only cost is a single
+boolean check per module evaluation.
+'''
+
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+_enabled = False
+_stats = OrderedDict()
+
+
+def enable(reset_stats=True):
+    '''Turn on profiling, clearing any previous stats by default.'''
+    global _enabled
+    if reset_stats:
+        reset()
+    _enabled = True
+
+
+def disable():
+    '''Turn off profiling. Accumulated stats are kept until reset().'''
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    '''Returns True if profiling is currently turned on.'''
+    return _enabled
+
+
+def reset():
+    '''Discard all accumulated stats.'''
+    _stats.clear()
+
+
+def record(key, elapsed, calls=1):
+    '''
+    Adds `elapsed` seconds and `calls` calls to the entry named `key`.
+    Entries are kept in the order they were first recorded.
+    '''
+    entry = _stats.get(key)
+    if entry is None:
+        _stats[key] = [calls, elapsed]
+    else:
+        entry[0] += calls
+        entry[1] += elapsed
+
+
+@contextmanager
+def timer(key):
+    '''
+    Context manager that records the time spent inside the block under
+    `key` if profiling is enabled, and does nothing otherwise.
+    '''
+    if not _enabled:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(key, time.perf_counter() - t0)
+
+
+def get_stats():
+    '''
+    Returns a JSON-friendly copy of the accumulated stats:
+        {key: {'calls': N, 'total': seconds, 'mean': seconds_per_call}}
+    '''
+    return OrderedDict(
+            (k, {'calls': n, 'total': t, 'mean': t / n if n else 0.0})
+            for k, (n, t) in _stats.items()
+            )
+
+
+def format_table(stats):
+    '''
+    Formats the output of get_stats() (or a modelspec's 'profile' metadata)
+    as a fixed-width text table suitable for logging.
+    '''
+    if not stats:
+        return '(no profiling data)'
+    width = max(len('section'), max(len(k) for k in stats))
+    lines = ['{:<{w}} {:>10} {:>12} {:>12}'.format(
+            'section', 'calls', 'total (s)', 'mean (ms)', w=width)]
+    for k, v in stats.items():
+        lines.append('{:<{w}} {:>10d} {:>12.4f} {:>12.4f}'.format(
+                k, v['calls'], v['total'], v['mean'] * 1000, w=width))
+    return '\n'.join(lines)
+
+
+def finish_fit(fit_time):
+    '''
+    Called by analyses at the end of a profiled fit. Adds the fitter
+    overhead (fit time not spent inside the cost function), logs the
+    table, turns profiling off again and returns the stats so they can be
+    stored in the modelspec metadata.
+    '''
+    cost_time = _stats['cost_function'][1] if 'cost_function' in _stats else 0
+    record('fitter_overhead', max(fit_time - cost_time, 0.0), calls=0)
+    stats = get_stats()
+    log.info('Profile of fit:\n%s', format_table(stats))
+    disable()
+    return stats
@@ -4,7 +4,6 @@ import gzip
 import time
 import tarfile
 import logging
-import requests
 import pandas as pd
 import numpy as np
 import copy
@@ -14,7 +13,9 @@ import shutil
 from nems.uri import local_uri, http_uri, targz_uri
 import nems.epoch as ep
 from nems.signal import SignalBase, RasterizedSignal, merge_selections, \
-                        list_signals, load_signal, load_signal_from_streams
+                        list_signals, load_signal, load_signal_from_streams, \
+                        jackknife_occurrences, jackknife_epoch_mask, \
+                        bins_in_epochs
 
 log = logging.getLogger(__name__)
 
@@ -36,6 +37,36 @@ class Recording:
 
         self.name = recordings[0]
         self.uri = None  # This will be lost on copying
+        self._share_epochs()
+
+    def _share_epochs(self):
+        '''
+        Makes signals whose epochs are equal reference a single DataFrame,
+        so that the recording holds one epoch table (and one EpochIndex,
+        see nems.epoch.epoch_index) rather than a copy per signal. Signals
+        that already share a table are left alone, which is the usual case
+        since derived signals share their parent's epochs. Other signals
+        are replaced by shallow copies in this recording, so the signals
+        (and dict) the caller passed in are never modified.
+        '''
+        tables = []
+        shared = {}
+        for name, s in self.signals.items():
+            if s.epochs is None:
+                continue
+            for t in tables:
+                if s.epochs is t:
+                    break
+                if s.epochs.shape == t.shape and s.epochs.equals(t):
+                    s = copy.copy(s)
+                    s.epochs = t
+                    shared[name] = s
+                    break
+            else:
+                tables.append(s.epochs)
+        if shared:
+            self.signals = self.signals.copy()
+            self.signals.update(shared)
 
     def copy(self):
         '''
@@ -54,17 +85,33 @@ class Recording:
         '''
         The epochs of a recording is the superset of all signal epochs.
         '''
+        # The merged table only changes when a signal's epochs do, so it is
+        # cached against the (usually single, shared) signal epoch tables
+        # and their EpochIndex, which is rebuilt if a table is edited in
+        # place.
+        epoch_set = [s.epochs for s in self.signals.values()]
+        distinct = []
+        for e in epoch_set:
+            if not any(e is d for d in distinct):
+                distinct.append(e)
+        indices = [None if d is None else ep.epoch_index(d) for d in distinct]
+        cached = getattr(self, '_epochs_cache', None)
+        if cached is not None and len(cached[0]) == len(distinct) and \
+                all(a is b for a, b in zip(cached[0], distinct)) and \
+                all(a is b for a, b in zip(cached[1], indices)):
+            return cached[2].copy()
+
         # Merge the epochs. Be sure to ignore index since it's just a standard
         # sequential index for each signal's epoch (e.g., index 1 in signal1 has
         # no special meaning compared to index 1 in signal2). Drop all
         # duplicates since we sometimes replicate epochs across signals and
         # return the sorted values.
-        epoch_set = [s.epochs for s in self.signals.values()]
-        df = pd.concat(epoch_set, ignore_index=True)
+        df = pd.concat(distinct, ignore_index=True)
         df.drop_duplicates(inplace=True)
         df.sort_values('start', inplace=True)
         df.index = np.arange(len(df))
-        return df
+        self._epochs_cache = (distinct, indices, df)
+        return df.copy()
 
     # Defining __getitem__ and __setitem__ make recording objects behave
     # like dictionaries when subscripted. e.g. recording['signal_name']
@@ -115,15 +162,16 @@ class Recording:
         return rec
 
     @staticmethod
-    def load_dir(directory_or_targz):
+    def load_dir(directory_or_targz, mmap=False):
         '''
         Loads all the signals (CSV/JSON pairs) found in DIRECTORY or
         .tar.gz file, and returns a Recording object containing all of them.
+        With mmap=True, signals saved with fmt='npy' are memory-mapped.
         '''
         if os.path.isdir(directory_or_targz):
             files = list_signals(directory_or_targz)
             basepaths = [os.path.join(directory_or_targz, f) for f in files]
-            signals = [load_signal(f) for f in basepaths]
+            signals = [load_signal(f, mmap=mmap) for f in basepaths]
             signals_dict = {s.name: s for s in signals}
             return Recording(signals=signals_dict)
         else:
@@ -144,6 +192,7 @@ class Recording:
         '''
         Loads the recording object from a URL. File must be tar.gz format.
         '''
+        import requests
         r = requests.get(url, stream=True)
         if not (r.status_code == 200 and
                 (r.headers['content-type'] == 'application/gzip' or
@@ -319,10 +368,12 @@ class Recording:
         else:
             raise ValueError('Invalid URI: {}'.format(uri))
 
-    def save_dir(self, directory):
+    def save_dir(self, directory, fmt='%.18e'):
         '''
         Saves all the signals (CSV/JSON pairs) in this recording into
         DIRECTORY in a new directory named the same as this recording.
+        fmt is passed on to each signal's save(); use fmt='npy' to write
+        rasterized data in binary so they can be memory-mapped by load_dir.
         '''
         if os.path.isdir(directory):
             directory = os.path.join(directory, self.name)
@@ -334,7 +385,7 @@ class Recording:
         if not os.path.isdir(directory):
             os.makedirs(directory, exist_ok=True)
         for s in self.signals.values():
-            s.save(directory)
+            s.save(directory, fmt=fmt)
         return directory
 
     def save_targz(self, uri):
@@ -396,6 +447,7 @@ class Recording:
         if not rec.save_url(url):
              rec.save('/tmp/')   # Save to /tmp as a fallback
         '''
+        import requests
         r = requests.put(uri, data=self.as_targz())
         if r.status_code == 200:
             return uri
@@ -576,45 +628,21 @@ class Recording:
         else:
             rec = self.copy()
 
-        # initialize mask to be all True
-        m_data = rec['mask'].as_continuous().copy()
+        m_data = rec['mask'].as_continuous()
 
         # find all matching epochs
         epochs = self.get_epoch_indices(epoch_name)
-        occurrences = epochs.shape[0]
-
-        if occurrences == 0:
-            m = 'No epochs found matching epoch_name. Unable to jackknife.'
-            raise ValueError(m)
-
-        if occurrences < njacks:
-            raise ValueError("Can't divide {0} occurrences into {1} jackknifes"
-                             .format(occurrences, njacks))
-
-        if jack_idx < 0 or njacks < 0:
-            raise ValueError("Neither jack_idx nor njacks may be negative")
-
-        nrows = np.int(np.ceil(occurrences / njacks))
-        idx_data = np.arange(nrows * njacks)
-
-        if tiled:
-            idx_data = idx_data.reshape(nrows, njacks)
-            idx_data = np.swapaxes(idx_data, 0, 1)
-        else:
-            idx_data = idx_data.reshape(njacks, nrows)
+        left_out = jackknife_occurrences(epochs.shape[0], njacks, jack_idx,
+                                         tiled)
 
         # jmask = bins that should be excluded, on top of whatever is already
-        # False in m_data
-        jmask = np.zeros_like(m_data, dtype=np.bool)
-        for idx in idx_data[jack_idx].tolist():
-            if idx < occurrences:
-                lb, ub = epochs[idx]
-                jmask[:, lb:ub] = True
-
+        # False in m_data. Built over time only and broadcast across the
+        # mask's channel(s).
+        jmask = bins_in_epochs(epochs[left_out], m_data.shape[-1])
         if invert:
             jmask = ~jmask
 
-        m_data[jmask] = False
+        m_data = np.where(jmask, False, m_data)
 
         rec['mask'] = rec['mask']._modified_copy(m_data)
 
@@ -632,14 +660,27 @@ class Recording:
         if excise and only_signals:
             raise Exception('Excising only some signals makes signals ragged!')
         new_sigs = {}
+        # The jackknife mask only depends on the epochs and the length of a
+        # signal, so it is computed once and applied to every signal that
+        # shares them (usually all of them).
+        masks = {}
         for sn in self.signals.keys():
             if (not only_signals or sn in set(only_signals)):
                 s = self.signals[sn]
                 log.debug("JK: {0} {1}/{2} {3}".format(s.name,jack_idx,
                           njacks,epoch_name))
-                new_sigs[sn] = s.jackknife_by_epoch(njacks, jack_idx,
-                                                    epoch_name=epoch_name,
-                                                    invert=invert, tiled=tiled)
+                if type(s) is not RasterizedSignal:
+                    new_sigs[sn] = s.jackknife_by_epoch(
+                            njacks, jack_idx, epoch_name=epoch_name,
+                            invert=invert, tiled=tiled)
+                    continue
+                key = (id(s.epochs), s.fs, s.ntimes)
+                if key not in masks:
+                    masks[key] = jackknife_epoch_mask(
+                            s, njacks, jack_idx, epoch_name, tiled=tiled,
+                            invert=invert)
+                data = np.where(masks[key], s.as_continuous(), np.nan)
+                new_sigs[sn] = s._modified_copy(data)
         return Recording(signals=new_sigs)
 
         # if signal_names is not None:
@@ -727,6 +768,20 @@ class Recording:
 
         return Recording(newsigs)
 
+    def resample(self, fs, method='filter'):
+        '''
+        Returns a copy of this recording with every signal at sampling rate
+        fs, a whole fraction of the current rate, decimated as described
+        in RasterizedSignal.resample. Point process and tiled signals are
+        rasterized at their own rate first, so that they are averaged over
+        the coarse bins like the others (rather than, e.g., summing spikes
+        into them).
+        '''
+        rec = self.copy()
+        for name, sig in self.signals.items():
+            rec[name] = sig.rasterize().resample(fs, method)
+        return rec
+
     def nan_times(self, times, padding=0):
 
         if padding != 0:
@@ -871,13 +926,18 @@ class Recording:
             # mask is all true, passthrough
             return rec
 
-        m = rec['mask']._data[0, :].copy()
-        z = np.array([0])
-        m = np.concatenate((z, m, z))
-        s, = np.nonzero(np.diff(m) > 0)
-        e, = np.nonzero(np.diff(m) < 0)
-
-        times = (np.vstack((s, e))/sig.fs).T
+        # The runs of True in the mask are found once per mask signal, and
+        # select_times builds a single gather index that every signal uses.
+        times = getattr(sig, '_mask_times', None)
+        if times is None:
+            m = rec['mask']._data[0, :].copy()
+            z = np.array([0])
+            m = np.concatenate((z, m, z))
+            s, = np.nonzero(np.diff(m) > 0)
+            e, = np.nonzero(np.diff(m) < 0)
+
+            times = (np.vstack((s, e))/sig.fs).T
+            sig._mask_times = times
         # if times[-1,1]==times[-1,0]:
         #    times = times[:-1,:]
         # log.info('masking')
@@ -994,15 +1054,16 @@ def load_recording(uri):
 
     return rec
 
-def load_recording_from_dir(directory_or_targz):
+def load_recording_from_dir(directory_or_targz, mmap=False):
     '''
     Loads all the signals (CSV/JSON pairs) found in DIRECTORY or
     .tar.gz file, and returns a Recording object containing all of them.
+    With mmap=True, signals saved with fmt='npy' are memory-mapped.
     '''
     if os.path.isdir(directory_or_targz):
         files = list_signals(directory_or_targz)
         basepaths = [os.path.join(directory_or_targz, f) for f in files]
-        signals = [load_signal(f) for f in basepaths]
+        signals = [load_signal(f, mmap=mmap) for f in basepaths]
         signals_dict = {s.name: s for s in signals}
         return Recording(signals=signals_dict)
     else:
@@ -1013,6 +1074,7 @@ def load_recording_from_url(url):
     '''
     Loads the recording object from a URL. File must be tar.gz format.
     '''
+    import requests
     r = requests.get(url, stream=True)
     if not (r.status_code == 200 and
             (r.headers['content-type'] == 'application/gzip' or
@@ -1234,6 +1296,7 @@ def get_demo_recordings(directory=None, name=None, unpack=False):
                           .format(local))
             else:
                 log.info("Saving file at {} to {}".format(uri, local))
+                import requests
                 r = requests.get(uri, stream=True)
                 # TODO: clean this up, copied from recordings code.
                 #       All of these content-types have showed up *so far*
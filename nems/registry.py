@@ -1,11 +1,19 @@
 import re
 import os
 import sys
+import copy
 import inspect
 import importlib as imp
 import logging
+
+import numpy as np
+
 log = logging.getLogger(__name__)
 
+# Types that can be shared between copies of a parsed keyword as-is.
+_IMMUTABLE_TYPES = (str, bytes, int, float, complex, bool, type(None),
+                    np.generic)
+
 
 class KeywordRegistry():
     '''
@@ -30,22 +38,46 @@ class KeywordRegistry():
 
     See register_plugin and register_modules for how to easily add entire
     directories or modules of keyword definitions.
+
+    The result of parsing each keyword string is cached, and every lookup
+    returns a fresh copy of the cached result, so callers are free to modify
+    what they get back. Parsers must therefore be deterministic functions of
+    the keyword string (and the registry kwargs). The cache is cleared
+    whenever keywords are (re-)registered; call clear_cache() after changing
+    self.kwargs.
     '''
 
     def __init__(self, **kwargs):
         self.keywords = {}
         self.kwargs = kwargs
+        self._cache = {}
+        self._pending_plugins = []
 
     def __getitem__(self, kw_string):
-        kw = self.lookup(kw_string)
-        accepted_args = inspect.getargspec(kw.parse)[0]
-        kwargs = {k: v for k, v in self.kwargs.items() if k in accepted_args}
-        return kw.parse(kw_string, **kwargs)
+        if kw_string not in self._cache:
+            self._register_pending()
+            kw = self.lookup(kw_string)
+            kwargs = {k: v for k, v in self.kwargs.items()
+                      if k in kw.accepted_args}
+            # freeze a private copy; the parser may return arrays it
+            # still holds on to (e.g. module-level defaults)
+            parsed = kw.parse(kw_string, **kwargs)
+            self._cache[kw_string] = _freeze(_copy_parsed(parsed))
+        return _copy_parsed(self._cache[kw_string])
 
     def __setitem__(self, kw_head, parse):
         # TODO: Warning either here or in register_module / register_plugins
         #       to notify if keyword being overwritten?
         self.keywords[kw_head] = Keyword(kw_head, parse)
+        self.clear_cache()
+
+    def __contains__(self, kw_head):
+        self._register_pending()
+        return kw_head in self.keywords
+
+    def clear_cache(self):
+        '''Forget all previously parsed keyword strings.'''
+        self._cache = {}
 
     def kw_head(self, kw_string):
         # if the full kw_string is in the registry as-is, then it's a
@@ -64,6 +96,7 @@ class KeywordRegistry():
         return kw_head
 
     def lookup(self, kw_string):
+        self._register_pending()
         kw_head = self.kw_head(kw_string)
         return self.keywords[kw_head]
 
@@ -98,6 +131,19 @@ class KeywordRegistry():
         '''Invokes self.register_plugin for each package listed in pkgs.'''
         [self.register_plugin(p) for p in pkgs]
 
+    def register_plugins_on_use(self, get_pkgs):
+        '''
+        As register_plugins, for the packages returned by get_pkgs(), but
+        only called the first time the registry is used. This lets a
+        registry made at import time (e.g. from a setting in the NEMS
+        config) avoid loading the config until a keyword is looked up.
+        '''
+        self._pending_plugins.append(get_pkgs)
+
+    def _register_pending(self):
+        while self._pending_plugins:
+            self.register_plugins(self._pending_plugins.pop(0)())
+
     def register_module(self, module):
         '''
         As register_plugin, but module should be a single module object
@@ -109,6 +155,7 @@ class KeywordRegistry():
         for a in dir(module):
             if self._validate(module, a):
                 self.keywords[a] = Keyword(a, getattr(module, a))
+        self.clear_cache()
 
     def register_modules(self, modules):
         '''Invokes self.register_module for each module listed in modules.'''
@@ -130,12 +177,14 @@ class KeywordRegistry():
     def __iter__(self):
         # Pass through keywords dictionary's iteration to allow
         # `for k in registry: do x`
+        self._register_pending()
         return self.keywords.__iter__()
 
     def __next__(self):
         return self.keywords.__next__()
 
     def to_json(self):
+        self._register_pending()
         d = {k: v.file_string() for k, v in self.keywords.items()}
         d['_KWR_ARGS'] = self.kwargs
         return d
@@ -161,6 +210,53 @@ class Keyword():
     def __init__(self, kw_head, parse):
         self.key = kw_head
         self.parse = parse
+        self._accepted_args = None
+
+    @property
+    def accepted_args(self):
+        '''Names of the arguments accepted by parse, looked up once.'''
+        if self._accepted_args is None:
+            spec = inspect.getfullargspec(self.parse)
+            self._accepted_args = set(spec.args + spec.kwonlyargs)
+        return self._accepted_args
 
     def file_string(self):
         return inspect.getmodule(self.parse).__file__
+
+
+def _freeze(parsed):
+    '''
+    Marks any arrays in a parsed keyword as read-only so that the cached
+    copy can't be modified by accident. Only call this on a copy owned by
+    the cache, never on the parser's return value itself.
+    '''
+    if isinstance(parsed, np.ndarray):
+        parsed.setflags(write=False)
+    elif isinstance(parsed, dict):
+        for v in parsed.values():
+            _freeze(v)
+    elif isinstance(parsed, (list, tuple)):
+        for v in parsed:
+            _freeze(v)
+    return parsed
+
+
+def _copy_parsed(parsed):
+    '''
+    Copies the output of a keyword parser. Much faster than copy.deepcopy
+    for the nested dicts, lists, tuples and arrays that make up modelspec
+    fragments and xfspecs; anything else falls back on deepcopy.
+    '''
+    t = type(parsed)
+    if t is dict:
+        return {k: _copy_parsed(v) for k, v in parsed.items()}
+    elif t is list:
+        return [_copy_parsed(v) for v in parsed]
+    elif t is tuple:
+        return tuple(_copy_parsed(v) for v in parsed)
+    elif t is np.ndarray:
+        return parsed.copy()
+    elif isinstance(parsed, _IMMUTABLE_TYPES) or callable(parsed):
+        return parsed
+    else:
+        return copy.deepcopy(parsed)
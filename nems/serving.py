@@ -0,0 +1,390 @@
+'''
+Minimal runtime for fitted models exported with
+nems.modelspec.export_modelspec().
+
+An exported model is a single binary file: an 8-byte magic string, the
+length of a JSON header as a little-endian uint64, the header itself, and
+then every parameter array of the model as one flat block of float64
+values. The header describes the module graph:
+
+    {'format': 'nems-compiled', 'version': 1, 'fs': 100, 'meta': {...},
+     'output': 'pred',
+     'modules': [{'op': 'weight', 'i': 'stim', 'o': 'pred', 'attrs': {},
+                  'arrays': {'coefficients': [offset, shape]}}, ...]}
+
+where offset is the position of each array in the block. All parameters
+are resolved at export time, so e.g. FIR coefficients are stored rather
+than the pole-zero or dexp parameters they were generated from. Loading a
+model is a single read, with no per-array parsing.
+
+This module deliberately imports nothing but NumPy and the NumPy-only
+modules of nems.modules whose kernels it shares, so that served
+predictions follow any change to them. A serving process can then load
+and evaluate large numbers of models without pandas, matplotlib or the
+JSON modelspec machinery:
+
+    model = load_model('/models/cell_1.nems')
+    pred = model.predict(stim)          # (n_chans, n_times) in, pred out
+
+CompiledModel.push() evaluates input that arrives a few samples at a time,
+carrying FIR and STP state between calls (see nems.streaming).
+'''
+
+import json
+import struct
+
+import numpy as np
+
+# the array-level kernels of the modules, which import nothing but NumPy
+from nems.modules import nonlinearity
+from nems.modules.signal_mod import _merge_states
+from nems.modules.stp import _stp_depression
+
+MAGIC = b'NEMSMDL\0'
+FORMAT = 'nems-compiled'
+VERSION = 1
+
+
+def save_model(filepath, modules, fs=None, meta=None, output='pred'):
+    '''
+    Writes a compiled module graph (see nems.modelspec.compile_modelspec)
+    to filepath.
+    '''
+    blocks = []
+    offset = 0
+    graph = []
+    for m in modules:
+        layout = {}
+        for k, v in m.get('arrays', {}).items():
+            v = np.asarray(v, dtype='<f8')
+            layout[k] = [offset, list(v.shape)]
+            blocks.append(v.ravel())
+            offset += v.size
+        graph.append({'op': m['op'], 'i': m['i'], 'o': m['o'],
+                      'arrays': layout, 'attrs': m.get('attrs', {})})
+    header = {'format': FORMAT, 'version': VERSION, 'fs': fs,
+              'meta': meta or {}, 'output': output, 'modules': graph}
+    header = json.dumps(header).encode('utf-8')
+    # pad so that the parameter block starts 8-byte aligned
+    header += b' ' * (-(len(MAGIC) + 8 + len(header)) % 8)
+    with open(filepath, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        if blocks:
+            f.write(np.concatenate(blocks).tobytes())
+    return filepath
+
+
+def load_model(filepath):
+    '''Reads a model written by save_model() and returns a CompiledModel.'''
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    if raw[:len(MAGIC)] != MAGIC:
+        raise ValueError('{} is not an exported NEMS model'.format(filepath))
+    start = len(MAGIC) + 8
+    n, = struct.unpack('<Q', raw[len(MAGIC):start])
+    header = json.loads(raw[start:start+n].decode('utf-8'))
+    if header['version'] > VERSION:
+        raise ValueError('{} has format version {}, this runtime reads up '
+                         'to {}'.format(filepath, header['version'], VERSION))
+    params = np.frombuffer(raw, dtype='<f8', offset=start+n)
+    modules = []
+    for m in header['modules']:
+        m = dict(m)
+        m['arrays'] = {k: params[o:o+int(np.prod(shape))].reshape(shape)
+                       for k, (o, shape) in m['arrays'].items()}
+        modules.append(m)
+    return CompiledModel(modules, fs=header['fs'], meta=header['meta'],
+                         output=header['output'])
+
+
+class CompiledModel:
+    '''
+    A model compiled into steps that work directly on arrays.
+
+    Each step keeps whatever state it needs between calls to push(). FIR
+    filters keep the previous n_taps-1 input samples in a preallocated
+    buffer, and STP keeps its depression. Buffers are allocated by the first
+    push and only reallocated if a longer chunk arrives later.
+    '''
+
+    def __init__(self, modules, fs=None, meta=None, output='pred'):
+        self.modules = modules
+        self.fs = fs
+        self.meta = meta or {}
+        self.output_name = output
+        self._steps = []
+        for m in modules:
+            if m['op'] not in _OPS:
+                raise ValueError('Unknown op: {}'.format(m['op']))
+            step = _OPS[m['op']](**m.get('arrays', {}), **m.get('attrs', {}))
+            step.i = m['i']
+            step.o = m['o']
+            self._steps.append(step)
+
+    def save(self, filepath):
+        '''Writes this model to filepath, see save_model().'''
+        return save_model(filepath, self.modules, self.fs, self.meta,
+                          self.output_name)
+
+    def reset(self):
+        '''
+        Forgets all module state, so the next push starts as a fresh call
+        to nems.modelspec.evaluate would.
+        '''
+        for step in self._steps:
+            step.reset()
+
+    def push(self, stim, out=None, **signals):
+        '''
+        Advances the model by the samples in stim (n_chans, n_samples) and
+        returns the corresponding samples of the output signal. Other
+        input signals the model uses (e.g. state=...) are passed as
+        keyword arguments with the same number of samples. If out is given
+        the prediction is written into it instead of a new array.
+        '''
+        values = signals
+        values['stim'] = np.asarray(stim, dtype=float)
+        for step in self._steps:
+            values[step.o] = step(values[step.i], values)
+        result = values[self.output_name]
+        if out is None:
+            return np.array(result)
+        out[...] = result
+        return out
+
+    def predict(self, stim, **signals):
+        '''
+        Returns the prediction for a whole stimulus, starting from the
+        same initial state as nems.modelspec.evaluate.
+        '''
+        self.reset()
+        pred = self.push(stim, **signals)
+        self.reset()
+        return pred
+
+
+class _Step:
+    '''
+    Base class of the ops: out = step(x, values).
+
+    Inputs have shape (..., n_chans, n_times) and parameters may carry the
+    same leading batch axes (see stack_modules), in which case the output
+    has them too.
+    '''
+
+    def __call__(self, x, values):
+        raise NotImplementedError
+
+    def reset(self):
+        pass
+
+
+class _Weight(_Step):
+    def __init__(self, coefficients, offset=None):
+        self.coefficients = coefficients
+        self.offset = offset
+
+    def __call__(self, x, values):
+        y = self.coefficients @ x
+        if self.offset is not None:
+            y = y + self.offset
+        return y
+
+
+class _FIR(_Step):
+    '''
+    FIR filter bank (as nems.modules.fir.per_channel) evaluated as a
+    convolution over a buffer holding the previous n_taps-1 input samples.
+    The buffer starts filled with the first input sample, which is the
+    same initial condition as nems.modules.fir.get_zi().
+    '''
+
+    def __init__(self, coefficients, bank_count=1):
+        self.taps = np.asarray(coefficients, dtype=float)[..., ::-1]
+        self.bank_count = bank_count
+        self.reset()
+
+    def reset(self):
+        self._buffer = None
+
+    def __call__(self, x, values):
+        n_filters, n_taps = self.taps.shape[-2:]
+        n_in, n = x.shape[-2:]
+        lag = n_taps - 1
+        batch = np.broadcast_shapes(x.shape[:-2], self.taps.shape[:-2])
+        if n == 0:
+            return np.zeros(batch + (self.bank_count, 0))
+        if self._buffer is None or self._buffer.shape[-1] < lag + n:
+            if n_filters == n_in:
+                self._inputs = None
+            elif n_filters == n_in * self.bank_count:
+                self._inputs = np.arange(n_filters) % n_in
+            else:
+                raise ValueError('Dimension mismatch. {} channels provided '
+                                 'for {} FIR filters'.format(n_in, n_filters))
+            buffer = np.empty(x.shape[:-1] + (lag + n,))
+            if self._buffer is None:
+                buffer[..., :lag] = x[..., :1]
+            else:
+                buffer[..., :lag] = self._buffer[..., :lag]
+            self._buffer = buffer
+            self._out = np.empty(batch + (n_filters, n))
+
+        buffer = self._buffer
+        buffer[..., lag:lag+n] = x
+        windows = np.lib.stride_tricks.sliding_window_view(
+                buffer[..., :lag+n], n_taps, axis=-1)
+        if self._inputs is not None:
+            windows = windows[..., self._inputs, :, :]
+        y = self._out[..., :n]
+        np.einsum('...knl,...kl->...kn', windows, self.taps, out=y)
+        buffer[..., :lag] = buffer[..., n:n+lag].copy()
+        n_banks = n_filters // self.bank_count
+        return y.reshape(batch + (self.bank_count, n_banks, n)).sum(axis=-2)
+
+
+class _STP(_Step):
+    '''
+    Short-term plasticity as nems.modules.stp._stp, with u and tau already
+    limited and tau converted to bins at export time. The depression of
+    the last sample is carried to the next push.
+    '''
+
+    def __init__(self, u, tau):
+        self.u = u
+        self.tau = tau
+        self.reset()
+
+    def reset(self):
+        self._td = None
+        self._ustim = None
+
+    def __call__(self, x, values):
+        stim = np.nan_to_num(x, nan=0.0)
+        stim[stim < 0] = 0
+        out, self._td, self._ustim = _stp_depression(
+                stim, self.u, self.tau, self._td, self._ustim)
+        out[np.broadcast_to(np.isnan(x), out.shape)] = np.nan
+        return out
+
+
+class _Add(_Step):
+    def __init__(self, level):
+        self.level = level
+
+    def __call__(self, x, values):
+        return x + self.level
+
+
+class _Norm(_Step):
+    def __init__(self, d, g):
+        self.d = d
+        self.g = g
+
+    def __call__(self, x, values):
+        return (x - self.d) / self.g
+
+
+class _Nonlinearity(_Step):
+    '''The static nonlinearities of nems.modules.nonlinearity.'''
+
+    def __init__(self, kind, **params):
+        if kind not in _NONLINEARITIES:
+            raise ValueError('Unknown nonlinearity: {}'.format(kind))
+        self.fn = _NONLINEARITIES[kind]
+        self.params = params
+
+    def __call__(self, x, values):
+        return self.fn(x, **self.params)
+
+
+_NONLINEARITIES = {
+    'logistic_sigmoid': nonlinearity._logistic_sigmoid,
+    'tanh': nonlinearity._tanh,
+    'quick_sigmoid': nonlinearity._quick_sigmoid,
+    'double_exponential': nonlinearity._double_exponential,
+    'dlog': nonlinearity._dlog,
+}
+
+
+class _Sum(_Step):
+    def __call__(self, x, values):
+        return np.nansum(x, axis=-2, keepdims=True)
+
+
+class _StateGain(_Step):
+    def __init__(self, g, d, s='state'):
+        self.g = g
+        self.d = d
+        self.s = s
+
+    def __call__(self, x, values):
+        state = values[self.s]
+        return np.matmul(self.g, state) * x + np.matmul(self.d, state)
+
+
+class _Replicate(_Step):
+    def __init__(self, repcount=2):
+        self.repcount = repcount
+
+    def __call__(self, x, values):
+        return np.tile(x, (self.repcount, 1))
+
+
+class _Merge(_Step):
+    def __init__(self, s='state'):
+        self.s = s
+
+    def __call__(self, x, values):
+        return _merge_states(x, values[self.s])
+
+
+_OPS = {
+    'weight': _Weight,
+    'fir': _FIR,
+    'stp': _STP,
+    'add': _Add,
+    'norm': _Norm,
+    'nonlinearity': _Nonlinearity,
+    'sum': _Sum,
+    'state_gain': _StateGain,
+    'replicate': _Replicate,
+    'merge': _Merge,
+}
+
+# Ops whose parameters act elementwise on (n_chans, n_times). When batched,
+# these are first given at least two dimensions so that the batch axis
+# lines up with the leading axis of the input.
+_ELEMENTWISE = {'add', 'norm', 'nonlinearity', 'weight'}
+
+
+def stack_modules(graphs):
+    '''
+    Combines K compiled module graphs that differ only in their parameter
+    values into one graph whose differing arrays gain a leading batch axis
+    of length K. Parameters that are the same in every graph are kept
+    as they are, so the modules before the first differing one are
+    evaluated only once. CompiledModel(stack_modules(graphs)).predict()
+    then returns all K predictions as one (K, n_chans, n_times) array
+    (or (n_chans, n_times) if nothing differs).
+    '''
+    stacked = []
+    for n, m in enumerate(graphs[0]):
+        for g in graphs[1:]:
+            if (g[n]['op'], g[n]['i'], g[n]['o'], g[n].get('attrs', {})) != \
+                    (m['op'], m['i'], m['o'], m.get('attrs', {})):
+                raise ValueError('Module {} differs between graphs'.format(n))
+        arrays = {}
+        for k, v in m.get('arrays', {}).items():
+            values = [np.asarray(g[n]['arrays'][k]) for g in graphs]
+            if all(np.array_equal(values[0], w) for w in values[1:]):
+                arrays[k] = values[0]
+                continue
+            if m['op'] in _ELEMENTWISE and k != 'coefficients':
+                values = [w.reshape((1,) * (2 - w.ndim) + w.shape)
+                          for w in values]
+            arrays[k] = np.stack(values)
+        stacked.append(dict(m, arrays=arrays))
+    return stacked
@@ -7,13 +7,16 @@ import math
 import copy
 import tempfile
 import warnings
+from collections import OrderedDict
+from collections.abc import Mapping
 
 import pandas as pd
 import numpy as np
 import h5py
 
 from nems.epoch import (remove_overlap, merge_epoch, epoch_contained,
-                        epoch_intersection, epoch_names_matching)
+                        epoch_intersection, epoch_names_matching,
+                        epoch_index)
 
 log = logging.getLogger(__name__)
 
@@ -139,6 +142,124 @@ class LabelSignalIndexer(BaseSignalIndexer):
             raise IndexError('Slice not understood')
 
 
+################################################################################
+# Event time storage
+################################################################################
+class EventTimes(Mapping):
+    '''
+    Compressed sparse row (CSR) storage for the event times of many
+    channels: a single 1-D array of times, sorted by channel, plus an array
+    of offsets such that the times of channel i are
+    times[offsets[i]:offsets[i+1]].
+
+    Behaves like a read-only dict of {channel name: 1-D array of times}, so
+    code written against the old dict-of-arrays PointProcess data keeps
+    working, but memory and load time scale with the number of events
+    rather than the number of channels. Channels are kept in sorted order.
+    '''
+
+    def __init__(self, times, offsets, keys):
+        self.times = np.asarray(times, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self._keys = list(keys)
+        self._index = {k: i for i, k in enumerate(self._keys)}
+        self.times.flags.writeable = False
+        if len(self.offsets) != len(self._keys) + 1:
+            raise ValueError('Need one more offset than keys')
+
+    @classmethod
+    def from_dict(cls, data):
+        '''Builds an EventTimes from a dict of 1-D arrays of event times.'''
+        keys = sorted(data)
+        arrays = [np.asarray(data[k], dtype=float).ravel() for k in keys]
+        counts = [len(a) for a in arrays]
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        times = np.concatenate(arrays) if sum(counts) else np.zeros(0)
+        return cls(times, offsets, keys)
+
+    def __getitem__(self, key):
+        i = self._index[key]
+        return self.times[self.offsets[i]:self.offsets[i+1]]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __eq__(self, other):
+        if isinstance(other, EventTimes):
+            return (self._keys == other._keys and
+                    np.array_equal(self.offsets, other.offsets) and
+                    np.array_equal(self.times, other.times))
+        if isinstance(other, Mapping):
+            # Mapping.__eq__ would compare the arrays element-wise
+            return (set(self._keys) == set(other.keys()) and
+                    all(np.array_equal(self[k], other[k])
+                        for k in self._keys))
+        return NotImplemented
+
+    def channel_index(self):
+        '''Returns the channel number of each entry in self.times.'''
+        return np.repeat(np.arange(len(self._keys)), np.diff(self.offsets))
+
+    def max_time(self):
+        return self.times.max() if self.times.size else 0
+
+    def subset(self, keys):
+        '''Returns a new EventTimes containing only the channels in keys.'''
+        keys = sorted(keys)
+        idx = [self._index[k] for k in keys]
+        starts = self.offsets[idx]
+        counts = self.offsets[np.array(idx, dtype=int) + 1] - starts
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        # gather all the selected runs in one go
+        gather = np.repeat(starts - offsets[:-1], counts) + \
+            np.arange(offsets[-1])
+        return EventTimes(self.times[gather], offsets, keys)
+
+    @staticmethod
+    def concatenate(parts, shifts):
+        '''
+        Concatenates the events in each channel of the EventTimes in parts,
+        adding shifts[i] to the times of parts[i]. All parts must have the
+        same channels.
+        '''
+        keys = parts[0]._keys
+        if any(p._keys != keys for p in parts[1:]):
+            raise ValueError('Cannot concatenate event times with '
+                             'different channels')
+        times = np.concatenate([p.times + shift
+                                for p, shift in zip(parts, shifts)])
+        chan_idx = np.concatenate([p.channel_index() for p in parts])
+        # stable sort keeps the parts (and the events within them) in order
+        order = np.argsort(chan_idx, kind='stable')
+        counts = np.bincount(chan_idx, minlength=len(keys))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return EventTimes(times[order], offsets, keys)
+
+    def save_h5(self, f):
+        '''Writes this object into the open h5py File f.'''
+        f.attrs['format'] = 'csr'
+        f.attrs['keys'] = json.dumps(self._keys)
+        f.create_dataset('times', data=self.times, compression='gzip')
+        f.create_dataset('offsets', data=self.offsets, compression='gzip')
+
+    @classmethod
+    def load_h5(cls, f):
+        '''
+        Reads an EventTimes from the open h5py File f, which may also be in
+        the older format of one dataset of event times per channel.
+        '''
+        if f.attrs.get('format') == 'csr':
+            return cls(f['times'][:], f['offsets'][:],
+                       json.loads(f.attrs['keys']))
+        return cls.from_dict({k: d[:] for k, d in f.items()})
+
+
 ################################################################################
 # Signals
 ################################################################################
@@ -191,7 +312,7 @@ class SignalBase:
             max_epoch_time = self.epochs["end"].max()
         else:
             max_epoch_time = 0
-        if isinstance(data, dict):
+        if isinstance(data, Mapping):
             # max_event_times = [max(et) for et in self._data.values()]
             max_event_times = [0]
         else:
@@ -339,9 +460,8 @@ class SignalBase:
             if self.epochs is None:
                 m = "Signal does not have any epochs defined"
                 raise ValueError(m)
-            mask = self.epochs['name'] == epoch
-            bounds = self.epochs.loc[mask, ['start', 'end']].values
-            bounds = np.round(bounds.astype(float) * self.fs) / self.fs
+            bounds = epoch_index(self.epochs).bounds(epoch)
+            bounds = np.round(bounds * self.fs) / self.fs
         else:
             bounds = epoch
 
@@ -411,6 +531,18 @@ class SignalBase:
         bounds = self.get_epoch_bounds(epoch, boundary_mode, fix_overlap,
                                        overlapping_epoch)
 
+        if len(self.segments) == 1 and len(bounds):
+            # Vectorized version of the loop below for the usual case of a
+            # single segment: keep epochs up to the first one that does not
+            # start inside it.
+            s_lb, s_ub = self.segments[0]
+            starts = bounds[:, 0]
+            inside = (s_lb <= starts) & (starts < s_ub)
+            n = len(bounds) if inside.all() else np.argmin(inside)
+            if n == 0:
+                return np.asarray([], dtype='i')
+            return np.round((bounds[:n] - s_lb) * self.fs).astype('i')
+
         # Indices of segments and epochs
         s = 0
         e = 0
@@ -590,7 +722,14 @@ class SignalBase:
 
     def generate_epoch_mask(self, epoch=True):
 
-        if epoch == True:
+        if type(epoch) is np.ndarray:
+            # checked first, as comparing an array to True is ambiguous
+            mask = np.zeros([1, self.ntimes], dtype=np.bool)
+
+            for (lb, ub) in epoch:
+                mask[:, lb:ub] = True
+
+        elif epoch == True:
             mask = np.ones([1, self.ntimes], dtype=np.bool)
 
         elif epoch == False:
@@ -604,12 +743,6 @@ class SignalBase:
             for lb, ub in indices:
                 mask[:, lb:ub] = True
 
-        elif type(epoch) is np.ndarray:
-            mask = np.zeros([1, self.ntimes], dtype=np.bool)
-
-            for (lb, ub) in epoch:
-                mask[:, lb:ub] = True
-
         return mask
 
     def epoch_to_signal(self, epoch, boundary_mode='exclude',
@@ -852,12 +985,22 @@ class RasterizedSignal(SignalBase):
         Save this signal to a CSV file + JSON sidecar. If desired,
         you may use optional parameter fmt (for example, fmt='%1.3e')
         to alter the precision of the floating point matrices.
+
+        With fmt='npy' the data are written in binary to a .npy file
+        instead, which is exact, much faster to read and can be loaded
+        memory-mapped (see load_signal).
         '''
 
         jsonfilepath,epochfilepath=self._save_metadata_to_dirpath(dirpath)
 
         filebase = self.recording + '.' + self.name
         basepath = os.path.join(dirpath, filebase)
+
+        if fmt == 'npy':
+            npyfilepath = basepath + '.npy'
+            np.save(npyfilepath, self.as_continuous())
+            return (npyfilepath, jsonfilepath, epochfilepath)
+
         csvfilepath = basepath + '.csv'
 
         mat = self.as_continuous()
@@ -935,10 +1078,35 @@ class RasterizedSignal(SignalBase):
     def _modified_copy(self, data, **kwargs):
         '''
         For internal use when making various immutable copies of this signal.
+
+        Rather than going through __init__, the new signal shares epochs,
+        segments, meta and chans with this one by reference and only the
+        data-dependent attributes are set, so deriving a signal (as every
+        module does via transform) takes constant time regardless of the
+        number of epochs. The result is the same as
+        RasterizedSignal(data=data, safety_checks=False, **attributes).
         '''
         attributes = self._get_attributes()
         attributes.update(kwargs)
-        return RasterizedSignal(data=data, safety_checks=False, **attributes)
+        if attributes['epochs'] is None:
+            # __init__ adds a SIGNAL epoch spanning the new data
+            return RasterizedSignal(data=data, safety_checks=False,
+                                    **attributes)
+
+        sig = RasterizedSignal.__new__(RasterizedSignal)
+        for name in ('name', 'chans', 'fs', 'meta', 'recording', 'epochs',
+                     'segments', 'normalization'):
+            setattr(sig, name, attributes[name])
+        # Not passed through by __init__, so reset as it would
+        sig.norm_baseline = np.array([[0]])
+        sig.norm_gain = np.array([[1]])
+        sig.signal_type = str(RasterizedSignal)
+        sig._data = data
+        data.flags.writeable = False
+        sig.nchans, sig.ntimes = data.shape
+        sig.iloc = SimpleSignalIndexer(sig)
+        sig.loc = LabelSignalIndexer(sig)
+        return sig
 
     def extract_epoch(self, epoch, boundary_mode='exclude',
                       fix_overlap='first', allow_empty=False,
@@ -1139,52 +1307,13 @@ class RasterizedSignal(SignalBase):
         or when there are fewer occurrences than njacks.
         '''
 
-        epochs = self.get_epoch_indices(epoch_name)
-        occurrences, _ = epochs.shape
-
         if excise:
             raise ValueError('Excise not supported for jackknife_by_epoch')
-        if len(epochs) == 0:
-            m = 'No epochs found matching epoch_name. Unable to jackknife.'
-            raise ValueError(m)
-
-        if occurrences < njacks:
-            raise ValueError("Can't divide {0} occurrences into {1} jackknifes"
-                             .format(occurrences, njacks))
-
-        if jack_idx < 0 or njacks < 0:
-            raise ValueError("Neither jack_idx nor njacks may be negative")
-
-        nrows = math.ceil(occurrences / njacks)
-        idx_data = np.arange(nrows * njacks)
-
-        if tiled:
-            idx_data = idx_data.reshape(nrows, njacks)
-            idx_data = np.swapaxes(idx_data, 0, 1)
-        else:
-            idx_data = idx_data.reshape(njacks, nrows)
-
-        data = self.as_continuous().copy()
-#        sig_valid_start = np.sum(np.isfinite(data[0,:]))
-
-        mask = np.zeros_like(data, dtype=np.bool)
-        mask2 = np.zeros_like(data, dtype=np.bool)
-
-        for ep in epochs:
-            lb, ub = ep
-            mask2[:,lb:ub]=1
-
-        for idx in idx_data[jack_idx].tolist():
-            if idx < occurrences:
-                lb, ub = epochs[idx]
-                mask[:, lb:ub] = 1
-
-        if invert:
-            mask = ~mask
-
-        data[mask] = np.nan
-        data[~mask2] = np.nan
+        keep = jackknife_epoch_mask(self, njacks, jack_idx, epoch_name,
+                                    tiled=tiled, invert=invert)
 
+        # A single pass over the data, driven by a mask over time only
+        data = np.where(keep, self._data, np.nan)
         return self._modified_copy(data)
 
     def jackknifes_by_epoch(self, njacks, epoch_name, tiled=True):
@@ -1219,22 +1348,22 @@ class RasterizedSignal(SignalBase):
             split_end = self.ntimes
         else:
             split_end = (jack_idx + 1) * splitsize
-        m = self.as_continuous().copy()
+        m = self._data
         if excise:
             if invert:
-                o = np.empty((self.nchans, split_end - split_start))
+                # A view of this signal's (read-only) data
                 o = m[:, split_start:split_end]
             else:
                 o = np.delete(m, slice(split_start, split_end), axis=-1)
             return self._modified_copy(o.reshape(self.nchans, -1))
         else:
             if not invert:
-                m[..., split_start:split_end] = np.nan
+                o = m.astype(float)
+                o[:, split_start:split_end] = np.nan
             else:
-                mask = np.ones_like(m, dtype=np.bool)
-                mask[:, split_start:split_end] = 0
-                m[mask] = np.nan
-            return self._modified_copy(m.reshape(self.nchans, -1))
+                o = np.full(m.shape, np.nan)
+                o[:, split_start:split_end] = m[:, split_start:split_end]
+            return self._modified_copy(o.reshape(self.nchans, -1))
 
     def jackknifes_by_time(self, njacks):
         '''
@@ -1490,7 +1619,7 @@ class RasterizedSignal(SignalBase):
             'name': 'trial'
         })
 
-    def transform(self, fn, newname=None):
+    def transform(self, fn, newname=None, pointwise=False):
         '''
         Applies this signal's 2d .as_continuous() matrix representation to
         function fn, which must be a pure (curried) function of one argument.
@@ -1499,6 +1628,8 @@ class RasterizedSignal(SignalBase):
         identical to this one but with different data.
 
         Optional argument newname allows a new signal name to be returned.
+        pointwise is a hint that fn treats every time bin independently,
+        which lets TiledSignal skip rasterizing; it is ignored here.
         '''
         # x = self.as_continuous()   # Always Safe but makes a copy
         x = self._data  # Much faster; TODO: Test if throws warnings
@@ -1579,8 +1710,12 @@ class RasterizedSignal(SignalBase):
         indices = np.round(times*self.fs).astype('i')
         data = self.as_continuous()
 
-        subsets = [data[..., lb:ub] for lb, ub in indices]
-        data = np.concatenate(subsets, axis=-1)
+        if len(indices) == 1:
+            # A single block is returned as a view of the (read-only) data
+            lb, ub = np.clip(indices[0], 0, data.shape[-1])
+            data = data[..., lb:ub]
+        else:
+            data = data[..., time_gather_index(indices, data.shape[-1])]
         return self._modified_copy(data, segments=times)
 
     def nan_times(self, times, padding=0):
@@ -1596,6 +1731,74 @@ class RasterizedSignal(SignalBase):
 
         return self._modified_copy(data)
 
+    def _segment_bounds(self):
+        '''
+        Returns the [start, stop) bins of the continuous pieces this
+        signal's data were cut from by select_times, or None if the
+        segments (in seconds) do not account for every bin of the data.
+        '''
+        segments = np.asarray(self.segments, dtype=float).reshape(-1, 2)
+        lengths = np.round((segments[:, 1] - segments[:, 0]) * self.fs)
+        if lengths.sum() != self.ntimes:
+            return None
+        stops = np.cumsum(lengths).astype(int)
+        return np.stack([stops - lengths.astype(int), stops], axis=1)
+
+    def resample(self, fs, method='filter'):
+        '''
+        Returns this signal at the lower sampling rate fs, which must divide
+        the current rate by a whole factor q. Epochs, in seconds, are kept.
+
+        Each continuous segment left by select_times (e.g. by
+        Recording.apply_mask) is decimated separately, so that the
+        anti-aliasing filter does not smear across the joins. With
+        method='filter' the data are low-pass filtered and decimated by
+        scipy.signal.resample_poly; with method='mean' each new bin is the
+        mean of the q bins it covers. Either way the scale of the data is
+        kept, so a rate stays a rate. A new bin is NaN if any bin it covers
+        is, and a boolean signal (a mask) is True only where every bin it
+        covers is.
+        '''
+        q = self.fs / fs
+        if q < 1 or not np.isclose(q, np.round(q)):
+            raise ValueError('Can only resample from {} Hz to a whole '
+                             'fraction of it, not {} Hz'.format(self.fs, fs))
+        q = int(np.round(q))
+        if method not in ('filter', 'mean'):
+            raise ValueError('Unknown resampling method: {}'.format(method))
+        if q == 1:
+            return self
+
+        import scipy.signal
+
+        bounds = self._segment_bounds()
+        pieces = []
+        for lb, ub in (bounds if bounds is not None else [(0, self.ntimes)]):
+            x = self._data[:, lb:ub]
+            n = -(-(ub - lb) // q)
+            pad = ((0, 0), (0, n * q - (ub - lb)))
+            if x.dtype == bool:
+                blocks = np.pad(x, pad, mode='edge').reshape(-1, n, q)
+                pieces.append(blocks.all(axis=-1))
+                continue
+            missing = ~np.isfinite(x)
+            x = np.where(missing, 0, x)
+            if method == 'filter':
+                y = scipy.signal.resample_poly(x, 1, q, axis=1,
+                                               padtype='line')
+            else:
+                y = np.pad(x, pad, mode='edge').reshape(-1, n, q).mean(axis=-1)
+            missing = np.pad(missing, pad, mode='edge').reshape(-1, n, q)
+            y[missing.any(axis=-1)] = np.nan
+            pieces.append(y)
+
+        data = np.concatenate(pieces, axis=1)
+        if bounds is not None:
+            segments = self.segments
+        else:
+            segments = np.array([[0, data.shape[1]]])
+        return self._modified_copy(data, fs=fs, segments=segments)
+
     def rasterize(self, fs=None):
         """
         basically a pass-through. we don't need to rasterize, since the
@@ -1615,6 +1818,8 @@ class PointProcess(SignalBase):
     '''
     Expects data to be a dictionary of the form:
         {<string>: <ndarray of spike times, one dimensional>}
+    or an EventTimes object. Dictionaries are converted to EventTimes, which
+    stores all the spike times in one array but still behaves like the dict.
     '''
 #    @property
 #    def _data(self):
@@ -1640,11 +1845,17 @@ class PointProcess(SignalBase):
             data.keys should match self.chans
             others?
         '''
+        if not isinstance(data, EventTimes):
+            data = EventTimes.from_dict(data)
         super().__init__(fs, data, name, recording, chans, epochs, segments,
                          meta, safety_checks, normalization)
 
         # number of channels specified by number of entries in data dictionary
-        self.nchans = len(list(data.keys()))
+        self.nchans = len(data)
+
+        # rasters already computed from this (immutable) signal,
+        # keyed by (fs, number of bins)
+        self._raster_cache = {}
 
         if safety_checks:
             if 'none' != normalization:
@@ -1667,6 +1878,10 @@ class PointProcess(SignalBase):
 
         by default, fs=self.fs, which can be preset to match other signals in a
         recording
+
+        The raster for each fs is computed once and cached on this signal, so
+        repeated calls (eg, from as_continuous or transform) are cheap. The
+        cached array is read-only since it is shared by every signal returned.
         """
         if not fs:
             fs=self.fs
@@ -1677,35 +1892,34 @@ class PointProcess(SignalBase):
             max_epoch_time = 0
 
         if max_epoch_time==0:
-            max_event_times = [max(et) for et in self._data.values()]
-            max_time = max(max_epoch_time, *max_event_times)
+            max_time = max(max_epoch_time, self._data.max_time())
         else:
             max_time=max_epoch_time
 
-        max_bin = np.int(np.ceil(fs*max_time))
-        unit_count = len(self._data.keys())
-        raster = np.zeros([unit_count, max_bin])
+        max_bin = int(np.ceil(fs*max_time))
+
+        # EventTimes keeps its channels in sorted order
+        cellids = list(self._data)
+        key = (fs, max_bin)
+        raster = self._raster_cache.get(key)
+        if raster is None:
+            raster = _bin_event_times(self._data, fs, max_bin)
+            raster.setflags(write=False)
+            self._raster_cache[key] = raster
 
         # _data dictionary has one entry per cell.
         # The output raster should be cell X time
-        cellids = sorted(self._data)
-        for i, key in enumerate(cellids):
-            for t in self._data[key]:
-                b = int(np.floor(t*fs))
-                if b < max_bin:
-                    raster[i, b] += 1
-
-        return RasterizedSignal(fs=self.fs, data=raster, name=self.name,
+        return RasterizedSignal(fs=fs, data=raster, name=self.name,
                                 recording=self.recording, chans=cellids,
                                 epochs=self.epochs, meta=self.meta)
 
     def as_continuous(self):
         return self.rasterize()._data
 
-    def transform(self, fn, newname=None):
+    def transform(self, fn, newname=None, pointwise=False):
         '''
         Rasterize this signal then apply fn and return the result as
-        a new signal.
+        a new signal. pointwise is ignored (see RasterizedSignal.transform).
         '''
         x = self.rasterize()
         y = fn(x._data)
@@ -1724,6 +1938,22 @@ class PointProcess(SignalBase):
 
         return (hdf5filepath, jsonfilepath, epochfilepath)
 
+    def _save_data_to_h5(self, dirpath):
+        '''
+        Saves the spike times as a single CSR-style pair of datasets
+        (see EventTimes) rather than one dataset per channel.
+        '''
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath, mode=0o0777)
+
+        filebase = self.recording + '.' + self.name
+        hdf5filepath = os.path.join(dirpath, filebase) + '.h5'
+
+        with h5py.File(hdf5filepath, 'w') as f:
+            self._data.save_h5(f)
+
+        return hdf5filepath
+
     def as_file_streams(self, fmt='%.18e'):
         '''
         Returns 3 filestreams for this signal: the csv, json, and epoch.
@@ -1814,18 +2044,10 @@ class PointProcess(SignalBase):
         # Now, concatenate data along time axis, adding an offset
         # to each successive signal to account for the duration of
         # the preceeding signals
-        offset = 0
-        for signal in signals:
-            if offset==0:
-                data=signal._data
-            else:
-                cellids = sorted(signal._data)
-                for i, key in enumerate(cellids):
-                    # append new data to list, after adding offset
-                    data[key]=np.concatenate((data[key],(signal._data[key]+offset)))
-
-            # increment offset by duration (sec) of current signal
-            offset += signal.ntimes / signal.fs
+        durations = [signal.ntimes / signal.fs for signal in signals]
+        shifts = np.concatenate([[0], np.cumsum(durations)[:-1]])
+        data = EventTimes.concatenate([signal._data for signal in signals],
+                                      shifts)
 
 
         # basically do the same thing for epochs, using the Base routine
@@ -1860,13 +2082,9 @@ class PointProcess(SignalBase):
         # Now, concatenate data along time axis, adding an offset
         # to each successive signal to account for the duration of
         # the preceeding signals
-        new_data=copy.deepcopy(self._data)
-        cellids = sorted(self._data)
         offset = self.ntimes / self.fs
-
-        for key in cellids:
-            # append new data to list, after adding offset
-            new_data[key]=np.concatenate((new_data[key],(new_signal._data[key]+offset)))
+        new_data = EventTimes.concatenate([self._data, new_signal._data],
+                                          [0, offset])
 
         # basically do the same thing for epochs, using the Base routine
         epochs = _merge_epochs([self,new_signal])
@@ -1888,8 +2106,7 @@ class PointProcess(SignalBase):
         Returns a new signal object containing only the specified
         channel indices.
         '''
-        # s is shorthand for slice. Return a 2D array.
-        s = {c: self._data[c] for c in chans}
+        s = self._data.subset(chans)
 
         return self._modified_copy(s, chans=chans)
 
@@ -1898,16 +2115,25 @@ class TiledSignal(SignalBase):
     '''
     Expects data to be a dictionary of the form:
         {<string>: <ndarray of stim data, two dimensional>}
+
+    Each array is inserted into every occurrence of the epoch of the same
+    name when the signal is rasterized, and time bins outside of those
+    epochs are set to `fill`. The rasterized form is computed once and
+    cached, and transforms flagged as pointwise are applied to the
+    per-epoch arrays directly, returning another TiledSignal.
     '''
     def __init__(self, fs, data, name, recording, chans=None, epochs=None,
                  segments=None, meta=None, safety_checks=True,
-                 normalization='none', **other_attributes):
+                 normalization='none', fill=None, **other_attributes):
         '''
         Parameters
         ----------
         data : dictionary of event times in each channel
         epochs : {None, DataFrame}
            same as BaseSignal
+        fill : {None, array (n_channels, 1)}
+           value of time bins not covered by any epoch in data, and of
+           NaNs in data. None means zero.
 
         TODO : Safety checks:
             data.keys should match self.chans
@@ -1925,45 +2151,106 @@ class TiledSignal(SignalBase):
             chancount = this_chancount
 
         self.nchans = chancount
+        self.fill = fill
+
+        # rasterized data and the index used to build it, computed on first
+        # use (the signal is immutable)
+        self._raster = None
+        self._tile_gather = None
 
         if safety_checks:
             if 'none' != normalization:
                 raise ValueError('normalization not supported for TiledSignal')
 
+    def _get_tile_gather(self):
+        '''
+        Returns an index array mapping each time bin of the rasterized
+        signal onto a column of the arrays in data concatenated along time
+        (in key order), followed by one column for the fill value. Shared
+        with the signals returned by pointwise transforms, which have the
+        same keys, tile lengths and epochs.
+        '''
+        if self._tile_gather is None:
+            maxtime = np.max(self.epochs["end"])
+            maxbin = self.shape[1]
+            if self.fs*maxtime > maxbin:
+                maxbin = int(np.ceil(self.fs*maxtime))
+
+            lengths = [v.shape[1] for v in self._data.values()]
+            gather = np.full(maxbin, sum(lengths), dtype=int)
+            offset = 0
+            for k, n in zip(self._data, lengths):
+                for lb, ub in self.get_epoch_indices(k):
+                    ub = min(ub, lb + n)
+                    gather[lb:ub] = np.arange(offset, offset + ub - lb)
+                offset += n
+            self._tile_gather = gather
+        return self._tile_gather
+
+    def _fill_value(self):
+        if self.fill is None:
+            return np.zeros((self.nchans, 1))
+        return self.fill
+
     def rasterize(self, fs=None):
         '''
         Create a rasterized version of the signal and return it
 
         fs is not used but in parameters for compatibility with PointProcess
-        '''
-        maxtime = np.max(self.epochs["end"])
-        maxbin = self.shape[1]
-        if self.fs*maxtime > maxbin:
-            maxbin = self.fs*maxtime
-        tags = list(self._data.keys())
-        chancount = self._data[tags[0]].shape[0]
 
-        z = np.zeros([chancount, maxbin])
-        zsig = RasterizedSignal(fs=self.fs, data=z, name=self.name,
+        The raster is computed once and cached on this signal; the cached
+        array is read-only since it is shared by every signal returned.
+        '''
+        if self._raster is None:
+            # Same result as replace_epochs on a signal of zeros, followed by
+            # replacing nans with the fill value (zero by default). Assume
+            # that the signal was valid but zero.
+            fill = self._fill_value()
+            tiles = np.concatenate(list(self._data.values()) + [fill], axis=1)
+            raster = tiles[:, self._get_tile_gather()]
+            if np.isnan(raster).any():
+                raster = np.where(np.isnan(raster), fill, raster)
+            raster.setflags(write=False)
+            self._raster = raster
+
+        return RasterizedSignal(fs=self.fs, data=self._raster, name=self.name,
                                 recording=self.recording, chans=self.chans,
-                                epochs=self.epochs, meta=self.meta)
-        signal = zsig.replace_epochs(self._data)
-
-        # replace nans with zeros. Assume that the signal was valid but zero
-        s = signal._data.copy()
-        s[np.isnan(signal._data)] = 0
-        signal = signal._modified_copy(s)
-
-        return signal
+                                epochs=self.epochs, meta=self.meta,
+                                safety_checks=False)
 
     def as_continuous(self):
         return self.rasterize()._data
 
-    def transform(self, fn, newname=None):
+    def transform(self, fn, newname=None, pointwise=False):
         '''
         Rasterize this signal then apply fn and return the result as
         a new signal.
+
+        If pointwise is True, fn must treat every time bin independently of
+        the others (eg. a channel weighting or static nonlinearity). It is
+        then applied to the per-epoch arrays and the fill value instead,
+        and the result is returned as a TiledSignal, which is much cheaper
+        when the epochs repeat many times.
         '''
+        if pointwise:
+            fill = self._fill_value()
+            data = {}
+            for k, v in self._data.items():
+                if np.isnan(v).any():
+                    v = np.where(np.isnan(v), fill, v)
+                data[k] = fn(v)
+            fill = fn(fill)
+            # the channel names only carry over if fn keeps the channels
+            chans = self.chans if fill.shape[0] == self.nchans else None
+            newsig = TiledSignal(fs=self.fs, data=data,
+                                 name=newname or self.name,
+                                 recording=self.recording, chans=chans,
+                                 epochs=self.epochs, segments=self.segments,
+                                 meta=self.meta, safety_checks=False,
+                                 fill=fill)
+            newsig._tile_gather = self._get_tile_gather()
+            return newsig
+
         x = self.rasterize()
         y = fn(x._data)
         newsig = x._modified_copy(y)
@@ -2148,12 +2435,17 @@ def _list_json_files(files):
     jsons = [just_fileroot(f) for f in files if f.endswith('.json')]
     return list(jsons)
 
-def load_signal(basepath):
+def load_signal(basepath, mmap=False):
     '''
     Generic signal loader. Load JSON file, figure out signal type and
     call appropriate loader
+
+    If mmap is True, rasterized data saved with fmt='npy' are memory-mapped
+    read-only rather than read into memory, so that only the parts of the
+    signal that are actually used get loaded.
     '''
     csvfilepath = basepath + '.csv'
+    npyfilepath = basepath + '.npy'
     h5filepath = basepath + '.h5'
     epochfilepath = basepath + '.epoch.csv'
     jsonfilepath = basepath + '.json'
@@ -2171,9 +2463,12 @@ def load_signal(basepath):
         signal_type="nems.signal.RasterizedSignal"
 
     if 'RasterizedSignal' in signal_type:
-        mat = pd.read_csv(csvfilepath, header=None).values
-        mat = mat.astype('float')
-        mat = np.swapaxes(mat, 0, 1)
+        if os.path.isfile(npyfilepath):
+            mat = np.load(npyfilepath, mmap_mode='r' if mmap else None)
+        else:
+            mat = pd.read_csv(csvfilepath, header=None).values
+            mat = mat.astype('float')
+            mat = np.swapaxes(mat, 0, 1)
 
         s = RasterizedSignal(name=js['name'],
                     chans=js.get('chans', None),
@@ -2185,9 +2480,7 @@ def load_signal(basepath):
 
     elif 'PointProcess' in signal_type:
         with h5py.File(h5filepath, 'r') as f:
-            data = {}
-            for key, dataset in f.items():
-                data[key] = np.array(dataset[:])
+            data = EventTimes.load_h5(f)
 
         s = PointProcess(name=js['name'],
                     chans=js.get('chans', None),
@@ -2249,9 +2542,7 @@ def load_signal_from_streams(data_stream, json_stream, epoch_stream=None):
 
     elif 'PointProcess' in signal_type:
         with h5py.File(data_stream, 'r') as f:
-            data = {}
-            for key, dataset in f.items():
-                data[key] = np.array(dataset[:])
+            data = EventTimes.load_h5(f)
 
         if not data:
             warnings.warn("Tried to load data stream {0} but data object"
@@ -2468,6 +2759,123 @@ def _split_epochs(epochs,split_time):
 
     return lepochs, repochs
 
+def _bin_event_times(event_times, fs, max_bin):
+    '''
+    Counts the events in each of max_bin bins of width 1/fs for every
+    channel of the EventTimes object event_times. Returns a channel x time
+    float array. All channels are binned in a single np.bincount call;
+    events outside [0, max_bin/fs) are dropped.
+    '''
+    n_chans = len(event_times)
+    bins = np.floor(event_times.times * fs).astype(np.int64)
+    chan_idx = event_times.channel_index()
+    keep = (bins >= 0) & (bins < max_bin)
+    flat = chan_idx[keep] * max_bin + bins[keep]
+    raster = np.bincount(flat, minlength=n_chans * max_bin)
+    return raster.astype(float).reshape(n_chans, max_bin)
+
+
+# Recently used gather indices, shared by every signal that selects the same
+# times (eg. all signals of a recording in Recording.apply_mask).
+_gather_cache = OrderedDict()
+_GATHER_CACHE_SIZE = 8
+
+
+def time_gather_index(indices, ntimes):
+    '''
+    Returns an index array that selects the time bins [lb, ub) of each row
+    of indices, in order, from a signal ntimes bins long (bounds are
+    clipped to [0, ntimes], so a negative bound means the start of the
+    signal rather than counting back from its end). The result is cached,
+    so selecting the same times from several signals builds it only once.
+    '''
+    indices = np.clip(np.asarray(indices, dtype=int).reshape(-1, 2),
+                      0, ntimes)
+    key = (ntimes, indices.tobytes())
+    gather = _gather_cache.get(key)
+    if gather is not None:
+        _gather_cache.move_to_end(key)
+        return gather
+
+    lb = indices[:, 0]
+    ub = np.maximum(indices[:, 1], lb)
+    lengths = ub - lb
+    # each output bin is its block's lb plus its position within the block
+    offsets = np.repeat(lb - (np.cumsum(lengths) - lengths), lengths)
+    gather = offsets + np.arange(lengths.sum())
+    gather.setflags(write=False)
+
+    _gather_cache[key] = gather
+    if len(_gather_cache) > _GATHER_CACHE_SIZE:
+        _gather_cache.popitem(last=False)
+    return gather
+
+
+def jackknife_occurrences(occurrences, njacks, jack_idx, tiled=True):
+    '''
+    Returns the indices of the epoch occurrences left out of jackknife
+    jack_idx of njacks (see RasterizedSignal.jackknife_by_epoch for the
+    tiled and sequential layouts).
+    '''
+    if occurrences == 0:
+        m = 'No epochs found matching epoch_name. Unable to jackknife.'
+        raise ValueError(m)
+
+    if occurrences < njacks:
+        raise ValueError("Can't divide {0} occurrences into {1} jackknifes"
+                         .format(occurrences, njacks))
+
+    if jack_idx < 0 or njacks < 0:
+        raise ValueError("Neither jack_idx nor njacks may be negative")
+
+    nrows = math.ceil(occurrences / njacks)
+    idx_data = np.arange(nrows * njacks)
+
+    if tiled:
+        idx_data = idx_data.reshape(nrows, njacks)
+        idx_data = np.swapaxes(idx_data, 0, 1)
+    else:
+        idx_data = idx_data.reshape(njacks, nrows)
+
+    idx = idx_data[jack_idx]
+    return idx[idx < occurrences]
+
+
+def bins_in_epochs(bounds, ntimes):
+    '''
+    Boolean array over ntimes bins, True inside any of the Nx2 [lb, ub)
+    index bounds (eg. from get_epoch_indices). Costs O(len(bounds) + ntimes) with no per-epoch Python loop.
+    '''
+    bounds = np.clip(np.asarray(bounds, dtype=int).reshape(-1, 2), 0, ntimes)
+    edges = np.zeros(ntimes + 1, dtype=int)
+    np.add.at(edges, bounds[:, 0], 1)
+    np.add.at(edges, bounds[:, 1], -1)
+    return np.cumsum(edges[:-1]) > 0
+
+
+def jackknife_epoch_mask(signal, njacks, jack_idx, epoch_name, tiled=True,
+                         invert=False, epochs=None):
+    '''
+    Returns a boolean array over the time bins of signal that is True for
+    the bins kept in jackknife jack_idx of njacks: bins inside an
+    occurrence of epoch_name that is not left out (or, if invert, only
+    those left out). The mask depends only on the epochs and the number of
+    time bins, so one mask can be applied to every signal of a recording.
+
+    epochs, if given, are the index bounds to use instead of those of
+    epoch_name in signal.
+    '''
+    if epochs is None:
+        epochs = signal.get_epoch_indices(epoch_name)
+    epochs = np.asarray(epochs).reshape(-1, 2)
+    left_out = jackknife_occurrences(len(epochs), njacks, jack_idx, tiled)
+
+    in_fold = bins_in_epochs(epochs[left_out], signal.ntimes)
+    if invert:
+        in_fold = ~in_fold
+    return bins_in_epochs(epochs, signal.ntimes) & ~in_fold
+
+
 def _merge_epochs(signals):
     # Merge the epoch tables. For all signals after the first signal,
     # we need to offset the start and end indices to ensure that they
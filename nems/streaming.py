@@ -0,0 +1,257 @@
+'''
+Evaluation of recordings that are too long to hold in memory.
+
+evaluate_chunked() streams a recording through a modelspec in consecutive
+blocks of time. The state of FIR and STP modules is carried from one block
+to the next (see nems.modelspec.evaluate), so the prediction is the same
+as evaluating the whole recording at once. Prediction accuracy is
+accumulated block by block with StreamingStats, and the prediction itself
+is only kept if an output array (e.g. a numpy.lib.format.open_memmap) is
+passed in.
+
+Together with signals saved in binary and loaded memory-mapped, this keeps
+only one block of each signal in memory at a time:
+
+    rec.save_dir('/data/chronic', fmt='npy')
+    ...
+    rec = Recording.load_dir('/data/chronic/my_recording', mmap=True)
+    stats = evaluate_chunked(rec, modelspec, chunk_size=100000)
+    print(stats.corrcoef(), stats.nmse())
+
+OnlinePredictor does the same for input that arrives as it is recorded,
+using the array-only runtime of nems.serving.
+'''
+
+import logging
+
+import numpy as np
+
+import nems.modelspec as ms
+from nems.recording import Recording
+from nems.serving import CompiledModel
+from nems.signal import RasterizedSignal
+
+log = logging.getLogger(__name__)
+
+# Modules that can be evaluated one block of time at a time: those that act
+# on each time bin independently, plus those that carry their history in a
+# state dict between calls.
+_CHUNKABLE_FNS = ms._POINTWISE_FNS | ms._STATEFUL_FNS | {
+    'nems.modules.state.state_dc_gain',
+    'nems.modules.signal_mod.replicate_channels',
+    'nems.modules.signal_mod.merge_channels',
+}
+
+
+def check_chunkable(modelspec):
+    '''
+    Raises ValueError if the modelspec contains a module that cannot be
+    evaluated in blocks of time, i.e. one that needs its whole input at
+    once (including normalization that is still being recalculated).
+    '''
+    for i, m in enumerate(modelspec):
+        if m['fn'] not in _CHUNKABLE_FNS:
+            raise ValueError('Module {} ({}) cannot be evaluated in chunks'
+                             .format(i, m['fn']))
+        if m.get('norm', {}).get('recalc'):
+            raise ValueError('Module {} ({}) recalculates its normalization, '
+                             'which needs the whole signal; call '
+                             'nems.modelspec.fit_mode_off first'
+                             .format(i, m['fn']))
+
+
+def time_chunks(ntimes, chunk_size):
+    '''Yields (start, stop) bin indices of consecutive blocks of time.'''
+    for t0 in range(0, ntimes, chunk_size):
+        yield t0, min(t0 + chunk_size, ntimes)
+
+
+def chunk_recording(rec, start, stop, signals=None):
+    '''
+    Returns a recording holding bins start through stop-1 of the named
+    signals (default: all of them). The data are copied into memory, so
+    only this block is read from a memory-mapped signal. Epochs still refer
+    to the full recording.
+    '''
+    if signals is None:
+        signals = list(rec.signals.keys())
+    chunk = {}
+    for name in signals:
+        sig = rec[name]
+        if not isinstance(sig, RasterizedSignal):
+            raise ValueError('Only rasterized signals can be chunked, '
+                             'rasterize {} first'.format(name))
+        data = np.array(sig._data[:, start:stop], dtype=float)
+        chunk[name] = sig._modified_copy(
+                data, segments=np.array([[0, stop - start]]))
+    return Recording(chunk)
+
+
+def iter_evaluate_chunks(rec, modelspec, chunk_size=100000, signals=None):
+    '''
+    Evaluates modelspec on consecutive blocks of chunk_size bins of rec,
+    carrying module state across blocks. Yields (start, stop, result) for
+    each block, where result is the evaluated chunk recording.
+
+    Parameters
+    ----------
+    rec : Recording
+        All signals used must be RasterizedSignals of the same length.
+        They may be memory-mapped (see Recording.load_dir).
+    modelspec : list
+        Must pass check_chunkable().
+    chunk_size : int
+        Number of time bins per block.
+    signals : list of str, optional
+        Signals to pass through the model (default: all of them). Leaving
+        out signals the modelspec does not use saves reading them.
+    '''
+    check_chunkable(modelspec)
+    if signals is None:
+        signals = list(rec.signals.keys())
+    lengths = {rec[name].ntimes for name in signals}
+    if len(lengths) != 1:
+        raise ValueError('Signals must all have the same number of bins')
+    ntimes = lengths.pop()
+
+    state = {}
+    for start, stop in time_chunks(ntimes, chunk_size):
+        log.debug('Evaluating bins %d to %d of %d', start, stop, ntimes)
+        chunk = chunk_recording(rec, start, stop, signals)
+        yield start, stop, ms.evaluate(chunk, modelspec, state=state)
+
+
+def evaluate_chunked(rec, modelspec, chunk_size=100000, pred_name='pred',
+                     resp_name='resp', out=None, signals=None):
+    '''
+    Evaluates modelspec on rec one block of time at a time and scores the
+    prediction against the response as it goes.
+
+    Parameters
+    ----------
+    rec, modelspec, chunk_size, signals
+        As for iter_evaluate_chunks().
+    pred_name, resp_name : str
+        Signals to score. If resp_name is None or not in rec, nothing is
+        scored.
+    out : array (n_chans, n_times), optional
+        If given, the prediction is written into it, e.g. into a .npy file
+        opened with numpy.lib.format.open_memmap(..., mode='w+').
+
+    Returns
+    -------
+    stats : StreamingStats or None
+        The accumulated statistics of pred_name against resp_name.
+    '''
+    stats = StreamingStats() if resp_name in rec.signals else None
+    for start, stop, result in iter_evaluate_chunks(rec, modelspec,
+                                                    chunk_size, signals):
+        pred = result[pred_name].as_continuous()
+        if out is not None:
+            out[:, start:stop] = pred
+        if stats is not None:
+            stats.update(pred, result[resp_name].as_continuous())
+    return stats
+
+
+class StreamingStats:
+    '''
+    Per-channel statistics of a prediction against a response, accumulated
+    one block of time at a time so that neither has to be held in memory.
+
+    Bins where either value is not finite are ignored, as in
+    nems.metrics. Each block's means and sums of squared deviations are
+    merged into the running totals with the pairwise update of Chan et
+    al. Unlike raw sums of squares, this stays accurate over very long
+    recordings.
+    '''
+
+    def __init__(self):
+        self.n = 0
+        self.mean_pred = 0
+        self.mean_resp = 0
+        self.m2_pred = 0
+        self.m2_resp = 0
+        self.cross = 0
+        self.sse = 0
+
+    def update(self, pred, resp):
+        '''Adds a block of pred and resp, each (n_chans, n_times).'''
+        pred = np.asarray(pred, dtype=float)
+        resp = np.asarray(resp, dtype=float)
+        ff = np.isfinite(pred) & np.isfinite(resp)
+        n_b = ff.sum(axis=-1)
+        p = np.where(ff, pred, 0)
+        r = np.where(ff, resp, 0)
+        safe_b = np.maximum(n_b, 1)
+        mp_b = p.sum(axis=-1) / safe_b
+        mr_b = r.sum(axis=-1) / safe_b
+        dp = np.where(ff, pred - mp_b[:, np.newaxis], 0)
+        dr = np.where(ff, resp - mr_b[:, np.newaxis], 0)
+
+        n = self.n + n_b
+        safe = np.maximum(n, 1)
+        delta_p = mp_b - self.mean_pred
+        delta_r = mr_b - self.mean_resp
+        weight = self.n * n_b / safe
+        self.m2_pred = self.m2_pred + (dp * dp).sum(axis=-1) \
+            + delta_p * delta_p * weight
+        self.m2_resp = self.m2_resp + (dr * dr).sum(axis=-1) \
+            + delta_r * delta_r * weight
+        self.cross = self.cross + (dp * dr).sum(axis=-1) \
+            + delta_p * delta_r * weight
+        self.mean_pred = self.mean_pred + delta_p * n_b / safe
+        self.mean_resp = self.mean_resp + delta_r * n_b / safe
+        self.sse = self.sse + ((p - r) ** 2).sum(axis=-1)
+        self.n = n
+
+    def mse(self):
+        '''Mean squared error of each channel.'''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sse / self.n
+
+    def nmse(self):
+        '''Root mean squared error of each channel over the std of resp.'''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.mse()) / np.sqrt(self.m2_resp / self.n)
+
+    def corrcoef(self):
+        '''
+        Correlation coefficient of each channel, or 0 where either signal
+        is constant (as nems.metrics.corrcoef).
+        '''
+        denom = np.sqrt(self.m2_pred * self.m2_resp)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(denom > 0, self.cross / denom, 0)
+
+
+class OnlinePredictor(CompiledModel):
+    '''
+    Predicts the response to a stimulus that arrives a few samples at a
+    time, e.g. in a closed-loop experiment.
+
+    The fitted modelspec is compiled (see nems.modelspec.compile_modelspec)
+    into steps that work directly on arrays, bypassing Recording and
+    Signal, and that keep their FIR history and STP depression between
+    calls to push(). Pushing a stimulus in pieces gives the same
+    prediction as evaluating it in one go with nems.modelspec.evaluate.
+
+        predictor = OnlinePredictor(modelspec, fs=100)
+        for frames in stimulus_source:   # (n_chans, n_samples) arrays
+            pred = predictor.push(frames)
+
+    Parameters
+    ----------
+    modelspec : list
+        A fitted modelspec. Must pass check_chunkable().
+    fs : float
+        Sampling rate of the input, needed by STP and pole-zero filters.
+    output_name : str
+        Signal to return from push().
+    '''
+
+    def __init__(self, modelspec, fs, output_name='pred'):
+        check_chunkable(modelspec)
+        super().__init__(ms.compile_modelspec(modelspec, fs), fs=fs,
+                         meta=ms.get_modelspec_metadata(modelspec),
+                         output=output_name)
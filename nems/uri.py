@@ -3,11 +3,9 @@ import io
 import os
 import json as jsonlib
 import logging
-import requests
 import numpy as np
 import base64
 
-from requests.exceptions import ConnectionError
 from nems.distributions.distribution import Distribution
 from nems.registry import KeywordRegistry
 
@@ -146,6 +144,7 @@ def save_resource(uri, data=None, json=None):
             # Serialize and unserialize to make numpy arrays safe
             s = jsonlib.dumps(json, cls=NumpyEncoder)
             js = jsonlib.loads(s)
+            import requests
             try:
                 r = requests.put(uri, json=js)
                 if r.status_code != 200:
@@ -155,7 +154,7 @@ def save_resource(uri, data=None, json=None):
                 err = 'Unable to connect; is the host ok and URI correct?'
             if err:
                 log.warn(err)
-                raise ConnectionError(err)
+                raise requests.exceptions.ConnectionError(err)
         elif local_uri(uri):
             filepath = local_uri(uri)
             # Create any necessary directories
@@ -170,6 +169,7 @@ def save_resource(uri, data=None, json=None):
             raise ValueError('URI type unknown')
     elif data:
         if http_uri(uri):
+            import requests
             try:
                 r = requests.put(uri, data=data)
                 if r.status_code != 200:
@@ -179,7 +179,7 @@ def save_resource(uri, data=None, json=None):
                 err = 'Unable to connect; is the host ok and URI correct?'
             if err:
                 log.warn(err)
-                raise ConnectionError(err)
+                raise requests.exceptions.ConnectionError(err)
         elif local_uri(uri):
             filepath = local_uri(uri)
             dirpath = os.path.dirname(filepath)
@@ -206,11 +206,12 @@ def load_resource(uri):
     Loads and returns the resource (probably a JSON) found at URI.
     '''
     if http_uri(uri):
+        import requests
         r = requests.get(uri)
         if r.status_code != 200:
             err = 'HTTP GET failed. Got {}: {}'.format(r.status_code,
                                                        r.text)
-            raise ConnectionError(err)
+            raise requests.exceptions.ConnectionError(err)
         if hasattr(r, 'data'):
             return r.data
         else:
@@ -256,6 +257,7 @@ def list_targz_in_nginx_dir(uri):
     that manages 'batches'. Ideally, such a database would return a JSON
     containing a list of URIs.
     '''
+    import requests
     r = requests.get(uri)
 
     if r.status_code != 200:
@@ -2,6 +2,7 @@ import logging
 import importlib as imp
 
 import nems.xforms as xforms
+import nems.initializers as init
 from nems import get_setting
 from nems.utils import escaped_split
 from nems.registry import KeywordRegistry
@@ -56,9 +57,14 @@ def generate_xforms_spec(recording_uri, modelname, meta={}, xforms_kwargs={},
                                  default_initializers])
     xforms_lib.register_plugins(get_setting('XFORMS_PLUGINS'))
 
-    keyword_lib = KeywordRegistry(**kw_kwargs)
-    keyword_lib.register_module(default_keywords)
-    keyword_lib.register_plugins(get_setting('KEYWORD_PLUGINS'))
+    if kw_kwargs:
+        keyword_lib = KeywordRegistry(**kw_kwargs)
+        keyword_lib.register_module(default_keywords)
+        keyword_lib.register_plugins(get_setting('KEYWORD_PLUGINS'))
+    else:
+        # Share the default registry (and its cache of parsed keywords)
+        # across calls, since it is configured identically.
+        keyword_lib = init.default_kws
 
     # Generate the xfspec, which defines the sequence of events
     # to run through (like a packaged-up script)
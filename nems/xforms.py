@@ -3,8 +3,8 @@ import os
 import copy
 import socket
 import logging
+from functools import partial
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 import nems.analysis.api
@@ -13,7 +13,6 @@ import nems.metrics.api as metrics
 import nems.modelspec as ms
 from nems.modelspec import set_modelspec_metadata, get_modelspec_metadata,\
                            get_modelspec_shortname
-import nems.plots.api as nplt
 import nems.preprocessing as preproc
 import nems.priors as priors
 from nems.uri import save_resource, load_resource
@@ -458,7 +457,7 @@ def jack_subset(est, val, modelspecs=None, IsReload=False,
 
 
 def fit_basic_init(modelspecs, est, IsReload=False, metric='nmse',
-                   tolerance=10**-5.5, **context):
+                   tolerance=10**-5.5, ridge=False, **context):
     '''
     Initialize modelspecs in a way that avoids getting stuck in
     local minima.
@@ -466,6 +465,9 @@ def fit_basic_init(modelspecs, est, IsReload=False, metric='nmse',
     written/optimized to work for (dlog)-wc-(stp)-fir-(dexp) architectures
     optional modules in (parens)
 
+    If ridge is True, the linear stage is initialized by ridge regression
+    (see nems.initializers.init_ridge) instead of an iterative fit.
+
     '''
     # only run if fitting
     if not IsReload:
@@ -474,7 +476,7 @@ def fit_basic_init(modelspecs, est, IsReload=False, metric='nmse',
                 est, modelspecs[0],
                 analysis_function=nems.analysis.api.fit_basic,
                 fitter=scipy_minimize, metric=metric_fn,
-                tolerance=tolerance, max_iter=700)]
+                tolerance=tolerance, max_iter=700, ridge=ridge)]
 
     return {'modelspecs': modelspecs}
 
@@ -560,22 +562,64 @@ def fit_state_init(modelspecs, est, IsReload=False, metric='nmse', **context):
 def fit_basic(modelspecs, est, max_iter=1000, tolerance=1e-7,
               metric='nmse', IsReload=False, fitter='scipy_minimize',
               jackknifed_fit=False, random_sample_fit=False,
-              n_random_samples=0, random_fit_subset=None, **context):
-    ''' A basic fit that optimizes every input modelspec. '''
+              n_random_samples=0, random_fit_subset=None, profile=False,
+              unique_stim=False, batch=False, coarse_to_fine=None,
+              start_fraction=None, checkpoint=None, max_time=None,
+              max_evals=None, min_improvement=None, **context):
+    '''
+    A basic fit that optimizes every input modelspec. If profile is True,
+    per-module timing is logged and saved in each modelspec's metadata.
+    If unique_stim is True, the stimulus-driven modules are only evaluated
+    once per unique stimulus (see ms.evaluate_unique_stim). If batch is
+    True, the fitter evaluates its probes in batches (see
+    ms.evaluate_batch) with the <metric>_batch version of the metric.
+    If coarse_to_fine is a list of decimation factors, such as [4, 2, 1],
+    each modelspec is first fit to est resampled by each factor in turn
+    (see nems.analysis.fit_coarse_to_fine). If start_fraction is given,
+    the fit starts on that fraction of the stimulus epochs of est and
+    doubles it until all of est is used (see
+    nems.analysis.fit_progressive_subsets). If checkpoint is a path, the
+    state of each fit is kept there (with the index of the modelspec
+    appended if there are several) so that an interrupted fit can resume
+    (see nems.fitters.checkpoint). max_time (seconds), max_evals and
+    min_improvement bound each fit (see
+    nems.fitters.api.coordinate_descent). The least_squares fitter is given
+    the residuals of the <metric>_residuals version of the metric.
+    '''
     if not IsReload:
         metric_fn = lambda d: getattr(metrics, metric)(d, 'pred', 'resp')
         fitter_fn = getattr(nems.fitters.api, fitter)
         fit_kwargs = {'tolerance': tolerance, 'max_iter': max_iter}
+        budgets = {'max_time': max_time, 'max_evals': max_evals,
+                   'min_improvement': min_improvement}
+        fit_kwargs.update({k: v for k, v in budgets.items() if v is not None})
+        evaluator = ms.evaluate_unique_stim if unique_stim else ms.evaluate
+        batch_metric = None
+        if batch:
+            batch_metric = getattr(metrics, metric + '_batch', None)
+            if batch_metric is None:
+                log.warning('No batch version of metric %s, evaluating '
+                            'probes one at a time', metric)
+        residual_metric = None
+        if fitter == 'least_squares':
+            residual_fn = getattr(metrics, metric + '_residuals', None)
+            if residual_fn is None:
+                raise ValueError('No residual version of metric {}, which '
+                                 'least_squares needs'.format(metric))
+            residual_metric = lambda d: residual_fn(d, 'pred', 'resp')
 
         if jackknifed_fit:
             return fit_nfold(modelspecs, est, tolerance=tolerance,
-                             metric=metric, fitter=fitter,
-                             fit_kwargs=fit_kwargs, analysis='fit_basic',
-                             **context)
+                             max_iter=max_iter, metric=metric, fitter=fitter,
+                             analysis='fit_basic', max_time=max_time,
+                             max_evals=max_evals,
+                             min_improvement=min_improvement,
+                             residual_metric=residual_metric, **context)
 
         elif random_sample_fit:
             basic_kwargs = {'metric': metric_fn, 'fitter': fitter_fn,
-                            'fit_kwargs': fit_kwargs}
+                            'fit_kwargs': fit_kwargs,
+                            'residual_metric': residual_metric}
             return fit_n_times_from_random_starts(
                         modelspecs, est, ntimes=n_random_samples,
                         subset=random_fit_subset,
@@ -584,25 +628,64 @@ def fit_basic(modelspecs, est, max_iter=1000, tolerance=1e-7,
 
         else:
             # standard single shot
+            basic_kwargs = {'fit_kwargs': fit_kwargs, 'metric': metric_fn,
+                            'fitter': fitter_fn, 'profile': profile,
+                            'evaluator': evaluator,
+                            'batch_metric': batch_metric,
+                            'residual_metric': residual_metric}
+            analysis = nems.analysis.api.fit_basic
+            if coarse_to_fine:
+                analysis = partial(nems.analysis.api.fit_coarse_to_fine,
+                                   factors=coarse_to_fine, analysis=analysis)
+            if start_fraction:
+                analysis = partial(nems.analysis.api.fit_progressive_subsets,
+                                   start_fraction=start_fraction,
+                                   analysis=analysis)
+            if checkpoint and analysis is not nems.analysis.api.fit_basic:
+                log.warning('Checkpoints are only kept for single stage '
+                            'fits, not checkpointing')
+                checkpoint = None
             modelspecs = [
-                    nems.analysis.api.fit_basic(est, modelspec,
-                                                fit_kwargs=fit_kwargs,
-                                                metric=metric_fn,
-                                                fitter=fitter_fn)[0]
-                    for modelspec in modelspecs
+                    analysis(est, modelspec, **basic_kwargs,
+                             checkpoint=_checkpoint_path(checkpoint, i,
+                                                         len(modelspecs)))[0]
+                    for i, modelspec in enumerate(modelspecs)
                     ]
 
     return {'modelspecs': modelspecs}
 
 
+def fit_population(modelspecs, est, max_iter=1000, tolerance=1e-7,
+                   metric='nmse', IsReload=False, **context):
+    '''
+    Fits all response channels of est at once, with independent
+    parameters for each channel (see nems.analysis.fit_population). The
+    error of each unit is saved in the 'unit_errors' metadata.
+    '''
+    if not IsReload:
+        metric_fn = getattr(metrics, metric + '_batch')
+        fit_kwargs = {'tolerance': tolerance, 'max_iter': max_iter}
+        modelspecs = [
+                nems.analysis.api.fit_population(est, modelspec,
+                                                 fit_kwargs=fit_kwargs,
+                                                 metric=metric_fn)[0]
+                for modelspec in modelspecs
+                ]
+
+    return {'modelspecs': modelspecs}
+
+
 def fit_iteratively(modelspecs, est, tol_iter=100, fit_iter=20, IsReload=False,
                     module_sets=None, invert=False, tolerances=[1e-4],
                     metric='nmse', fitter='scipy_minimize', fit_kwargs={},
                     jackknifed_fit=False, random_sample_fit=False,
-                    n_random_samples=0, random_fit_subset=None, **context):
+                    n_random_samples=0, random_fit_subset=None,
+                    profile=False, unique_stim=False, checkpoint=None,
+                    **context):
 
     fitter_fn = getattr(nems.fitters.api, fitter)
     metric_fn = lambda d: getattr(metrics, metric)(d, 'pred', 'resp')
+    evaluator = ms.evaluate_unique_stim if unique_stim else ms.evaluate
 
     if not IsReload:
         if jackknifed_fit:
@@ -630,29 +713,50 @@ def fit_iteratively(modelspecs, est, tol_iter=100, fit_iter=20, IsReload=False,
                             fitter=fitter_fn, module_sets=module_sets,
                             invert=invert, tolerances=tolerances,
                             tol_iter=tol_iter, fit_iter=fit_iter,
-                            metric=metric_fn)[0]
-                    for modelspec in modelspecs
+                            metric=metric_fn, profile=profile,
+                            evaluator=evaluator,
+                            checkpoint=_checkpoint_path(checkpoint, i,
+                                                        len(modelspecs)))[0]
+                    for i, modelspec in enumerate(modelspecs)
                     ]
 
     return {'modelspecs': modelspecs}
 
 
+def _checkpoint_path(checkpoint, i, n):
+    '''
+    Path of the checkpoint of the fit of modelspec i of n, or None.
+    '''
+    if not checkpoint or n == 1:
+        return checkpoint or None
+    return '{}.{}'.format(checkpoint, i)
+
+
 def fit_nfold(modelspecs, est, tolerance=1e-7, max_iter=1000,
               IsReload=False, metric='nmse', fitter='scipy_minimize',
               analysis='fit_basic', tolerances=None, module_sets=None,
-              tol_iter=100, fit_iter=20, **context):
-    ''' fitting n fold, one from each entry in est '''
+              tol_iter=100, fit_iter=20, max_time=None, max_evals=None,
+              min_improvement=None, residual_metric=None, **context):
+    '''
+    fitting n fold, one from each entry in est. max_time, max_evals and
+    min_improvement bound the fit of each fold, and residual_metric is
+    passed to it for least-squares fitters (see fit_basic).
+    '''
     if not IsReload:
         metric = lambda d: getattr(metrics, metric)(d, 'pred', 'resp')
         fitter_fn = getattr(nems.fitters.api, fitter)
         fit_kwargs = {'tolerance': tolerance, 'max_iter': max_iter}
+        budgets = {'max_time': max_time, 'max_evals': max_evals,
+                   'min_improvement': min_improvement}
+        fit_kwargs.update({k: v for k, v in budgets.items() if v is not None})
         if fitter == 'coordinate_descent':
             fit_kwargs['step_size'] = 0.05
         modelspecs = nems.analysis.api.fit_nfold(
                 est, modelspecs, fitter=fitter_fn,
                 fit_kwargs=fit_kwargs, analysis=analysis,
                 tolerances=tolerances, module_sets=module_sets,
-                tol_iter=tol_iter, fit_iter=fit_iter)
+                tol_iter=tol_iter, fit_iter=fit_iter,
+                residual_metric=residual_metric)
 
     return {'modelspecs': modelspecs}
 
@@ -709,6 +813,10 @@ def add_summary_statistics(est, val, modelspecs, fn='standard_correlation',
 def plot_summary(modelspecs, val, figures=None, IsReload=False, **context):
     # CANNOT initialize figures=[] in optional args our you will create a bug
 
+    # Plotting is only imported when needed so that headless fits don't pay
+    # for loading matplotlib.
+    import nems.plots.api as nplt
+
     if figures is None:
         figures = []
     if not IsReload:
@@ -873,6 +981,7 @@ def plot_heatmap(ctx, signal_name, cutoff=None, rec_key='val', rec_idx=0,
     array = get_signal_as_array(ctx, signal_name, cutoff, rec_key, rec_idx,
                                 mspec_idx, start, stop)
     array = array[:, ~np.all(np.isnan(array), axis=0)]
+    import matplotlib.pyplot as plt
     plt.imshow(array, aspect='auto')
 
 
@@ -881,6 +990,7 @@ def plot_timeseries(ctx, signal_name, cutoff=None, rec_key='val', rec_idx=0,
 
     array = get_signal_as_array(ctx, signal_name, cutoff, rec_key, rec_idx,
                                 mspec_idx, start, stop)
+    import matplotlib.pyplot as plt
     plt.plot(array.T)
 
 
@@ -2,6 +2,7 @@ import pytest
 
 import numpy as np
 
+from nems.benchmarks.synthetic import synthetic_recording
 from nems.recording import Recording
 from nems.initializers import from_keywords
 from nems.priors import set_mean_phi
@@ -24,3 +25,23 @@ def simple_recording():
     resp = np.random.rand(1, 200)
     return Recording.load_from_arrays([stim, resp], 'simple_recording', 100,
                                       sig_names=['stim', 'resp'])
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+            'markers', 'synthetic_rec(**kwargs): arguments of '
+            'synthetic_recording for the synthetic_rec fixture')
+
+
+@pytest.fixture
+def synthetic_rec(request):
+    '''
+    A synthetic recording (see nems.benchmarks.synthetic) of 4 stimuli
+    repeated 3 times. Other sizes are asked for with a marker on the test
+    or module, e.g. pytestmark = pytest.mark.synthetic_rec(n_units=3).
+    '''
+    kwargs = {'n_stim': 4, 'n_reps': 3}
+    marker = request.node.get_closest_marker('synthetic_rec')
+    if marker is not None:
+        kwargs.update(marker.kwargs)
+    return synthetic_recording(**kwargs)
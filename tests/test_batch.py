@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import nems.metrics.api as metrics
+import nems.modelspec as ms
+import nems.priors
+from nems.analysis.api import fit_basic
+from nems.fitters.api import coordinate_descent, dummy_fitter
+from nems.fitters.mappers import simple_vector
+from nems.initializers import from_keywords
+
+
+@pytest.mark.parametrize('keywords', [
+    'wc.18x1-fir.1x15-lvl.1-dexp.1',
+    'wc.18x2-stp.2-fir.2x15-lvl.1-qsig.1',
+    'wc.18x1-fir.1x15-lvl.1-stategain.S',
+])
+def test_evaluate_batch(synthetic_rec, keywords):
+    modelspec = from_keywords(keywords, rec=synthetic_rec)
+    modelspec = nems.priors.set_random_phi(modelspec)
+    for m in modelspec:
+        if m['fn'] == 'nems.modules.stp.short_term_plasticity':
+            m['phi']['u'] = np.array([0.3, 0.05])
+            m['phi']['tau'] = np.array([0.1, 0.2])
+    packer, unpacker, _ = simple_vector(modelspec)
+    rng = np.random.RandomState(0)
+    sigmas = packer(modelspec) + 0.01 * rng.randn(5, len(packer(modelspec)))
+
+    pred = ms.evaluate_batch(synthetic_rec, (unpacker(s) for s in sigmas))
+    assert pred.shape[0] == 5
+    resp = synthetic_rec['resp'].as_continuous()
+    errors = metrics.nmse_batch(pred, resp)
+    for k, sigma in enumerate(sigmas):
+        result = ms.evaluate(synthetic_rec.copy(), unpacker(sigma))
+        assert np.allclose(pred[k], result['pred'].as_continuous())
+        assert np.isclose(errors[k], metrics.nmse(result))
+        assert np.isclose(metrics.mse_batch(pred, resp)[k],
+                          metrics.mse(result))
+
+
+def test_fit_basic_batch(synthetic_rec):
+    modelspec = from_keywords('wc.18x1-fir.1x15-lvl.1', rec=synthetic_rec)
+    modelspec = nems.priors.set_random_phi(modelspec)
+    fit_kwargs = {'max_iter': 10}
+    expected = fit_basic(synthetic_rec, modelspec, fitter=coordinate_descent,
+                         fit_kwargs=fit_kwargs)[0]
+    result = fit_basic(synthetic_rec, modelspec, fitter=coordinate_descent,
+                       fit_kwargs=fit_kwargs,
+                       batch_metric=metrics.nmse_batch)[0]
+    for m, e in zip(result, expected):
+        for k in m['phi']:
+            assert np.allclose(m['phi'][k], e['phi'][k])
+
+    # finite-difference gradients for scipy_minimize
+    result = fit_basic(synthetic_rec, modelspec, fit_kwargs=fit_kwargs,
+                       batch_metric=metrics.nmse_batch)[0]
+    start = ms.evaluate(synthetic_rec.copy(), modelspec)
+    end = ms.evaluate(synthetic_rec.copy(), result)
+    assert metrics.nmse(end) < metrics.nmse(start)
+
+    # fitters without a batch_cost_fn are given the scalar cost only
+    result = fit_basic(synthetic_rec, modelspec, fitter=dummy_fitter,
+                       batch_metric=metrics.nmse_batch)[0]
+    assert ms.get_modelspec_metadata(result)['n_evals'] > 0
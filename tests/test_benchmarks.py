@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+
+from nems.recording import Recording
+
+from nems.benchmarks.synthetic import synthetic_recording
+from nems.benchmarks.suite import run_benchmarks, save_results, \
+    load_results, compare_results
+
+
+def test_synthetic_recording():
+    rec = synthetic_recording(n_stim=3, n_reps=2, n_units=2, n_state=2)
+    assert rec['stim'].shape == (18, 1200)
+    assert rec['resp'].shape == (2, 1200)
+    assert rec['state'].shape == (3, 1200)
+    assert len(rec.get_epoch_indices('TRIAL')) == 6
+
+    # repetitions of the same stimulus are identical
+    folded = rec['stim'].extract_epoch('STIM_000')
+    assert folded.shape[0] == 2
+    assert np.array_equal(folded[0], folded[1])
+
+
+def test_run_benchmarks(tmpdir):
+    results = run_benchmarks(repeat=1, cases=['extract_epochs', 'jackknife'])
+    cases = [r['case'] for r in results['results']]
+    assert cases == ['extract_epochs', 'jackknife']
+    assert all(r['throughput'] > 0 for r in results['results'])
+
+    path = str(tmpdir.join('bench.json'))
+    save_results(results, path)
+    loaded = load_results(path)
+    assert json.dumps(loaded) == json.dumps(results)
+    rows = compare_results(loaded, results)
+    assert len(rows) == 2
+    assert all(row[-1] == 1.0 for row in rows)
+
+
+def test_run_benchmarks_lazy_setup(monkeypatch):
+    saved = []
+    save_targz = Recording.save_targz
+    monkeypatch.setattr(Recording, 'save_targz',
+                        lambda self, uri: saved.append(uri) or
+                        save_targz(self, uri))
+    run_benchmarks(repeat=1, cases=['extract_epochs'])
+    assert not saved
+    results = run_benchmarks(repeat=1, cases=['recording_load'])
+    assert len(saved) == 1
+    assert [r['case'] for r in results['results']] == ['recording_load']
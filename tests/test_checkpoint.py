@@ -0,0 +1,87 @@
+import copy
+import os
+
+import numpy as np
+import pytest
+
+import nems.metrics.api as metrics
+from nems.analysis.api import fit_basic, fit_iteratively
+from nems.benchmarks.synthetic import synthetic_recording
+from nems.fitters.api import coordinate_descent, dummy_fitter
+from nems.fitters.checkpoint import Checkpoint
+from nems.initializers import from_keywords
+
+pytestmark = pytest.mark.synthetic_rec(n_reps=2)
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(n):
+    calls = []
+
+    def metric(data):
+        calls.append(1)
+        if len(calls) > n:
+            raise Interrupted()
+        return metrics.nmse(data, 'pred', 'resp')
+
+    return metric
+
+
+# interrupted in the first iteration of coordinate descent, and later on
+@pytest.mark.parametrize('n_evals', [50, 300])
+@pytest.mark.parametrize('fit, kwargs', [
+    (fit_basic, {'fitter': coordinate_descent,
+                 'fit_kwargs': {'max_iter': 20}}),
+    (fit_iteratively, {'fit_iter': 5, 'tol_iter': 2,
+                       'tolerances': [1e-4, 1e-6]}),
+])
+def test_resume_fit(synthetic_rec, tmpdir, fit, kwargs, n_evals):
+    modelspec = from_keywords('wc.18x1-fir.1x15-lvl.1', rec=synthetic_rec)
+    expected = fit(synthetic_rec, copy.deepcopy(modelspec), **kwargs)[0]
+
+    path = str(tmpdir.join('fit.ckpt'))
+    with pytest.raises(Interrupted):
+        fit(synthetic_rec, copy.deepcopy(modelspec),
+            metric=interrupt_after(n_evals),
+            checkpoint=Checkpoint(path, every=7),
+            **kwargs)
+    assert 'coordinate_descent' in Checkpoint(path).state
+
+    result = fit(synthetic_rec, copy.deepcopy(modelspec), checkpoint=path,
+                 **kwargs)[0]
+    assert not os.path.exists(path)
+    for m, e in zip(result, expected):
+        for k in m['phi']:
+            assert np.allclose(m['phi'][k], e['phi'][k])
+
+
+def test_checkpoint_fitter_without_state(synthetic_rec, tmpdir):
+    # the fitter keeps no state of its own, so only the best sigma is kept
+    modelspec = from_keywords('wc.18x1-fir.1x15-lvl.1', rec=synthetic_rec)
+    path = str(tmpdir.join('fit.ckpt'))
+    fit_basic(synthetic_rec, modelspec, fitter=dummy_fitter, checkpoint=path)
+    assert not os.path.exists(path)
+
+
+def test_checkpoint_from_other_fit_ignored(synthetic_rec, tmpdir):
+    modelspec = from_keywords('wc.18x1-fir.1x15-lvl.1', rec=synthetic_rec)
+    kwargs = {'fitter': coordinate_descent, 'fit_kwargs': {'max_iter': 5}}
+    path = str(tmpdir.join('fit.ckpt'))
+    with pytest.raises(Interrupted):
+        fit_basic(synthetic_rec, copy.deepcopy(modelspec),
+                  metric=interrupt_after(100),
+                  checkpoint=Checkpoint(path, every=7), **kwargs)
+
+    # same number of parameters, different data
+    other_rec = synthetic_recording(n_stim=3, n_reps=2)
+    expected = fit_basic(other_rec, copy.deepcopy(modelspec), **kwargs)[0]
+    checkpoint = Checkpoint(path)
+    assert 'sigma' in checkpoint.state
+    result = fit_basic(other_rec, copy.deepcopy(modelspec),
+                       checkpoint=checkpoint, **kwargs)[0]
+    for m, e in zip(result, expected):
+        for k in m['phi']:
+            assert np.allclose(m['phi'][k], e['phi'][k])
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import nems.metrics.api as metrics
+import nems.modelspec as ms
+import nems.priors
+from nems.analysis.api import fit_coarse_to_fine
+from nems.initializers import from_keywords
+from nems.plugins.default_fitters import basic
+from nems.recording import Recording
+from nems.signal import PointProcess, RasterizedSignal, TiledSignal
+
+
+def test_resample_signal():
+    data = np.arange(20, dtype=float).reshape(2, 10)
+    data[1, 3] = np.nan
+    sig = RasterizedSignal(100, data, 'resp', 'test')
+    result = sig.resample(50, method='mean')
+    assert result.fs == 50
+    assert result.shape == (2, 5)
+    assert np.allclose(result.as_continuous()[0], [0.5, 2.5, 4.5, 6.5, 8.5])
+    assert np.isnan(result.as_continuous()[1, 1])
+    assert np.isfinite(sig.resample(50).as_continuous()[0]).all()
+
+    mask = RasterizedSignal(100, np.arange(10)[np.newaxis, :] > 2, 'mask',
+                            'test')
+    assert mask.resample(50).as_continuous().tolist() == \
+        [[False, False, True, True, True]]
+
+    with pytest.raises(ValueError):
+        sig.resample(30)
+
+
+def test_resample_recording_segments(synthetic_rec):
+    rec = synthetic_rec.select_times([[0, 10], [20, 30]])
+    result = rec.resample(25)
+    for name in ('stim', 'resp'):
+        assert result[name].fs == 25
+        assert result[name].shape[1] == rec[name].shape[1] // 4
+    assert result['resp'].epochs is rec['resp'].epochs
+
+
+def test_resample_tiled_and_point_process():
+    epochs = pd.DataFrame({'start': [0.0], 'end': [2.0],
+                           'name': ['STIM_A']})
+    stim = TiledSignal(fs=100, data={'STIM_A': np.ones((2, 200))},
+                       name='stim', recording='test', epochs=epochs)
+    # one spike per 10 ms bin
+    resp = PointProcess(fs=100, data={'cell1': (np.arange(200) + 0.5) / 100},
+                        name='resp', recording='test', epochs=epochs)
+    rec = Recording({'stim': stim, 'resp': resp})
+    for method in ('mean', 'filter'):
+        result = rec.resample(25, method)
+        assert result['stim'].fs == result['resp'].fs == 25
+        assert result['stim'].shape == (2, 50)
+        assert result['resp'].shape == (1, 50)
+        # rates stay rates, rather than becoming counts per coarse bin
+        assert np.allclose(result['stim'].as_continuous(), 1)
+        assert np.allclose(result['resp'].as_continuous(), 1)
+
+
+@pytest.mark.parametrize('keywords', [
+    'wc.18x1-fir.1x15-lvl.1',
+    'wc.18x2-fir.1x15x2-lvl.2',
+])
+def test_resample_modelspec(synthetic_rec, keywords):
+    modelspec = nems.priors.set_random_phi(
+            from_keywords(keywords, rec=synthetic_rec))
+    coarse = ms.resample_modelspec(modelspec, 4)
+    assert np.shape(coarse[1]['phi']['coefficients'])[-1] == 4
+    fine = ms.resample_modelspec(coarse, 1 / 4, like=modelspec)
+    assert (np.shape(fine[1]['phi']['coefficients']) ==
+            np.shape(modelspec[1]['phi']['coefficients']))
+    # blocks of taps keep their sum
+    assert np.allclose(fine[1]['phi']['coefficients'][..., :4].sum(axis=-1),
+                       coarse[1]['phi']['coefficients'][..., 0])
+
+    # a slow filter predicts about the same response at a quarter the rate
+    modelspec[1]['phi']['coefficients'] = np.ones_like(
+            modelspec[1]['phi']['coefficients']) / 15
+    coarse = ms.resample_modelspec(modelspec, 4)
+    pred = ms.evaluate(synthetic_rec.copy(), modelspec)['pred']
+    coarse_pred = ms.evaluate(synthetic_rec.resample(25), coarse)['pred']
+    expected = pred.resample(25, method='mean').as_continuous()
+    assert np.corrcoef(expected.ravel(),
+                       coarse_pred.as_continuous().ravel())[0, 1] > 0.95
+
+
+def test_fit_coarse_to_fine(synthetic_rec):
+    modelspec = from_keywords('wc.18x1-fir.1x15-lvl.1', rec=synthetic_rec)
+    result = fit_coarse_to_fine(synthetic_rec, modelspec, factors=[2, 1],
+                                fit_kwargs={'max_iter': 20})[0]
+    stages = ms.get_modelspec_metadata(result)['coarse_to_fine']
+    assert [s['factor'] for s in stages] == [2, 1]
+    assert (np.shape(result[1]['phi']['coefficients']) ==
+            np.shape(nems.priors.set_mean_phi(modelspec)[1]['phi']
+                     ['coefficients']))
+    start = ms.evaluate(synthetic_rec.copy(),
+                        nems.priors.set_mean_phi(modelspec))
+    end = ms.evaluate(synthetic_rec.copy(), result)
+    assert metrics.nmse(end) < metrics.nmse(start)
+
+    with pytest.raises(ValueError):
+        fit_coarse_to_fine(synthetic_rec, modelspec, factors=[4, 2])
+
+
+def test_c2f_keyword():
+    assert basic('basic.c2f')[0][1]['coarse_to_fine'] == [4, 2, 1]
+    assert basic('basic.c2f8,2')[0][1]['coarse_to_fine'] == [8, 2, 1]
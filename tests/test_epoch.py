@@ -329,3 +329,13 @@ def test_add_epoch(epoch_df):
     expected = [[1, 2], [30, 31]]
     values = result.loc[m, ['start', 'end']].values
     assert np.array_equal(expected, values)
+
+
+def test_epoch_index(epoch_df):
+    from nems.epoch import epoch_index, epoch_names_matching
+    index = epoch_index(epoch_df)
+    assert epoch_index(epoch_df) is index
+    assert np.array_equal(index.bounds('child_a'), [[1, 2], [30, 31]])
+    assert index.bounds('missing').shape == (0, 2)
+    assert epoch_names_matching(epoch_df, '^parent_') == ['parent_1',
+                                                         'parent_2']
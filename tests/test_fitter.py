@@ -1,8 +1,18 @@
+import copy
+
 import pytest
 
 import numpy as np
+from scipy.optimize import rosen
 
-from nems.fitters.mappers import simple_vector, to_bounds_array
+import nems.metrics.api as metrics
+from nems.fitters.api import coordinate_descent, scipy_minimize, least_squares
+from nems.fitters.mappers import (simple_vector, to_bounds_array,
+                                  compiled_vector, CompiledVector)
+from nems.fitters.util import memoize_cost
+from nems.plugins.default_fitters import basic
+from nems.recording import Recording
+from nems.signal import RasterizedSignal
 
 
 def test_simple_vector_subset(simple_modelspec_with_phi):
@@ -75,6 +85,43 @@ def test_simple_vector_bounds_subset(simple_modelspec_with_phi):
     assert np.all(np.equal(ub[2:], np.inf))
 
 
+@pytest.mark.parametrize('subset', [None, [0], [0, 2], [2, 1]])
+def test_compiled_vector(simple_modelspec_with_phi, subset):
+    modelspec = simple_modelspec_with_phi
+    modelspec[0].setdefault('bounds', {})['mean'] = (-1, [2, 3])
+    expected_packer, _, expected_bounds = simple_vector(modelspec, subset)
+    packer, unpacker, bounds = compiled_vector(modelspec, subset)
+    expected = np.array(expected_packer(modelspec))
+    assert np.array_equal(packer(modelspec), expected)
+    for b, e in zip(bounds(modelspec), expected_bounds(modelspec)):
+        assert np.array_equal(b, e)
+
+    vector = np.arange(len(expected), dtype=float)
+    _, expected_unpacker, _ = simple_vector(copy.deepcopy(modelspec), subset)
+    expected_modelspec = expected_unpacker(vector)
+    assert unpacker(vector) is modelspec
+    phi = modelspec[-1]['phi']
+    for m, e in zip(modelspec, expected_modelspec):
+        for k in e['phi']:
+            assert np.shape(m['phi'][k]) == np.shape(e['phi'][k])
+            assert np.array_equal(m['phi'][k], e['phi'][k])
+    assert np.array_equal(packer(modelspec), vector)
+
+    # later unpacks write into the same arrays
+    unpacker(vector + 1)
+    assert modelspec[-1]['phi'] is phi
+    assert np.array_equal(packer(modelspec), vector + 1)
+
+
+def test_compiled_vector_subsets(simple_modelspec_with_phi):
+    mapper = CompiledVector(simple_modelspec_with_phi)
+    assert mapper.size == 38
+    assert np.array_equal(mapper.indices([2, 0]),
+                          np.r_[0:4, 34:38])
+    with pytest.raises(ValueError):
+        mapper(simple_modelspec_with_phi[:2])
+
+
 def test_benchmark_packer_unpacker(benchmark, simple_modelspec_with_phi):
     packer, unpacker, _ = simple_vector(simple_modelspec_with_phi)
     vector = np.arange(38)
@@ -166,3 +213,137 @@ def test_partial_definition(bounds_modelspec):
     # Don't need to assert anything here, just shouldn't get an error
     # for leaving 'sd' bounds undefined.
     x = bounds(bounds_modelspec)
+
+
+def test_memoize_cost():
+    calls = []
+
+    def cost_fn(sigma):
+        calls.append(list(sigma))
+        return float(np.sum(np.square(sigma)))
+
+    memoized = memoize_cost(cost_fn, maxsize=2)
+    assert memoized(np.array([1.0, 2.0])) == 5
+    assert memoized([1, 2]) == 5
+    memoized(np.array([0.0, 1.0]))
+    memoized(np.array([1.0, 1.0]))
+    # [1, 2] was the least recently used and has been dropped
+    memoized(np.array([1.0, 2.0]))
+    assert (memoized.hits, memoized.misses) == (1, 4)
+    assert len(calls) == 4
+
+    memoized = memoize_cost(cost_fn)
+    sigma = coordinate_descent(np.array([0.3, -0.2]), memoized,
+                               bounds=([0, -1], [1, 1]), max_iter=50)
+    assert np.allclose(sigma, [0, 0], atol=1e-3)
+    assert memoized.hits > 0
+
+
+@pytest.mark.parametrize('fitter', [coordinate_descent, scipy_minimize])
+def test_fit_budgets(fitter):
+    def cost_fn(sigma):
+        return float(rosen(sigma))
+
+    sigma = np.zeros(20)
+    bounds = ([None] * 20, [None] * 20)
+
+    stepinfo = {}
+    fitter(sigma.copy(), cost_fn, bounds=bounds, max_iter=1000,
+           tolerance=1e-12, max_evals=50, stepinfo=stepinfo)
+    assert stepinfo['stop_reason'] == 'max_evals'
+    # coordinate descent checks between iterations of 2 * 20 probes
+    assert 50 <= stepinfo['n_evals'] <= 90
+
+    fitter(sigma.copy(), cost_fn, bounds=bounds, max_iter=1000,
+           tolerance=1e-12, max_time=0, stepinfo=stepinfo)
+    assert stepinfo['stop_reason'] == 'max_time'
+
+    result = fitter(sigma.copy(), cost_fn, bounds=bounds, max_iter=1000,
+                    tolerance=1e-12, min_improvement=0.5, window=2,
+                    stepinfo=stepinfo)
+    assert stepinfo['stop_reason'] == 'improvement_rate'
+    assert cost_fn(result) < cost_fn(sigma)
+
+
+def rosen_residuals(sigma):
+    return np.concatenate([10 * (sigma[1:] - sigma[:-1] ** 2),
+                           1 - sigma[:-1]])
+
+
+def test_least_squares():
+    def cost_fn(sigma):
+        return float(rosen(sigma))
+
+    sigma = np.zeros(5)
+    bounds = ([None] * 5, [None] * 5)
+    assert np.isclose(np.sum(rosen_residuals(sigma + 0.3) ** 2),
+                      cost_fn(sigma + 0.3))
+
+    stepinfo = {}
+    result = least_squares(sigma, cost_fn, residual_fn=rosen_residuals,
+                           bounds=bounds, tolerance=1e-12, stepinfo=stepinfo)
+    assert np.allclose(result, 1, atol=1e-4)
+    n_evals = stepinfo['n_evals']
+    scipy_minimize(sigma, cost_fn, bounds=bounds, tolerance=1e-12,
+                   stepinfo=stepinfo)
+    assert n_evals < stepinfo['n_evals']
+
+    # a start outside the bounds is moved inside them
+    result = least_squares(np.full(5, 2.0), cost_fn,
+                           residual_fn=rosen_residuals,
+                           bounds=([None] * 5, [0.5] * 5), max_evals=20,
+                           stepinfo=stepinfo)
+    assert stepinfo['stop_reason'] == 'max_evals'
+    assert np.all(result <= 0.5)
+
+    with pytest.raises(ValueError):
+        least_squares(sigma, cost_fn, bounds=bounds)
+
+    assert basic('basic.ls')[0][1]['fitter'] == 'least_squares'
+
+
+def test_residual_metrics():
+    resp = np.array([[1.0, 2.0, np.nan, 4.0, 3.0]])
+    pred = np.array([[1.5, 2.0, np.nan, 3.0, 2.0]])
+
+    def recording(pred):
+        return Recording({
+            'resp': RasterizedSignal(10, resp, 'resp', 'test'),
+            'pred': RasterizedSignal(10, pred, 'pred', 'test')})
+
+    rec = recording(pred)
+    residuals = metrics.mse_residuals(rec)
+    assert residuals.shape == (5,)
+    assert np.isclose(np.sum(residuals ** 2), metrics.mse(rec))
+    assert np.isclose(np.sum(metrics.nmse_residuals(rec) ** 2),
+                      metrics.nmse(rec) ** 2)
+
+    # a diverging prediction costs more than a constant one, however much
+    # of it diverges
+    constant = recording(np.full_like(pred, np.nanmean(resp)))
+    worst = np.sum(metrics.nmse_residuals(constant) ** 2)
+    for bad in [np.inf, -np.inf, np.nan]:
+        diverged = recording(np.full_like(pred, bad))
+        residuals = metrics.nmse_residuals(diverged)
+        assert residuals.shape == (5,)
+        assert np.all(np.isfinite(residuals))
+        assert np.sum(residuals ** 2) > worst
+        half = recording(np.where(np.arange(5) < 2, resp, bad))
+        assert np.sum(metrics.nmse_residuals(half) ** 2) > worst
+        assert np.sum(metrics.mse_residuals(half) ** 2) > \
+            np.sum(metrics.mse_residuals(constant) ** 2)
+
+
+@pytest.mark.synthetic_rec(n_stim=2, n_reps=1)
+def test_fit_basic_minimal_fitter(synthetic_rec):
+    from nems.analysis.api import fit_basic
+    from nems.initializers import from_keywords
+    import nems.modelspec as ms
+
+    def fitter(sigma, cost_fn, bounds=None, tolerance=None, max_iter=None):
+        cost_fn(sigma)
+        return sigma
+
+    modelspec = from_keywords('wc.18x1-fir.1x15-lvl.1', rec=synthetic_rec)
+    result = fit_basic(synthetic_rec, modelspec, fitter=fitter)[0]
+    assert ms.get_modelspec_metadata(result)['stop_reason'] is None
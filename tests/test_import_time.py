@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Wall time budget for importing nems.xforms in seconds. Generous by
+# default so slow CI machines don't fail; tighten locally to catch
+# regressions, e.g. NEMS_IMPORT_BUDGET=0.5 pytest tests/test_import_time.py
+BUDGET = float(os.environ.get('NEMS_IMPORT_BUDGET', 5.0))
+
+# Modules that headless fits never need and should only be imported on use.
+LAZY_MODULES = ['matplotlib', 'PyQt5', 'requests', 'nems.plots']
+
+
+def _import(module):
+    '''
+    Imports `module` in a fresh interpreter and returns the wall time the
+    import took in seconds and the names of all modules loaded by then.
+    '''
+    statement = (
+        'import sys, time; t0 = time.perf_counter(); import {}; '
+        'print(time.perf_counter() - t0); print(" ".join(sys.modules))'
+        .format(module))
+    out = subprocess.run([sys.executable, '-c', statement],
+                         stdout=subprocess.PIPE, universal_newlines=True,
+                         check=True)
+    elapsed, modules = out.stdout.splitlines()[-2:]
+    return float(elapsed), modules.split()
+
+
+@pytest.fixture(scope='module')
+def xforms_import():
+    return _import('nems.xforms')
+
+
+def test_import_xforms_is_headless(xforms_import):
+    _, modules = xforms_import
+    assert 'nems.xforms' in modules
+    for name in modules:
+        assert not any(name == m or name.startswith(m + '.')
+                       for m in LAZY_MODULES), name
+
+
+def test_import_xforms_budget(xforms_import):
+    elapsed, _ = xforms_import
+    assert elapsed < BUDGET
+
+
+@pytest.mark.parametrize('module', ['nems', 'nems.xforms',
+                                    'nems.xform_helper'])
+def test_import_does_not_load_config(module):
+    out = subprocess.run(
+            [sys.executable, '-c',
+             'import nems, {}; print(nems._config is None)'.format(module)],
+            stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    assert out.stdout.strip() == 'True'
+
+
+def test_import_sets_up_log_file(tmpdir):
+    env = dict(os.environ, NEMS_LOG_ROOT=str(tmpdir),
+               NEMS_LOG_FILENAME='nems.log')
+    subprocess.run(
+            [sys.executable, '-c',
+             'import logging, nems.xforms; '
+             'logging.getLogger("nems.xforms").info("logged on import")'],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            check=True)
+    assert 'logged on import' in tmpdir.join('nems.log').read()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import nems.initializers as init
+import nems.modelspec as ms
+from nems.recording import Recording
+from nems.signal import RasterizedSignal
+
+
+@pytest.fixture()
+def linear_rec():
+    '''A response that is exactly a rank-1 wc-fir filter of the stimulus.'''
+    rng = np.random.RandomState(0)
+    stim = rng.normal(size=(6, 2000))
+    w = rng.normal(size=(1, 6))
+    h = np.exp(-np.arange(8) / 2.0)[np.newaxis, :]
+    x = np.concatenate([np.repeat(w @ stim[:, :1], 7, axis=1), w @ stim],
+                       axis=1)
+    resp = np.convolve(x[0], h[0], mode='valid')[np.newaxis, :] + 2
+    signals = {
+        'stim': RasterizedSignal(100, stim, 'stim', 'test'),
+        'resp': RasterizedSignal(100, resp, 'resp', 'test'),
+    }
+    return Recording(signals)
+
+
+def test_lagged_moments(linear_rec):
+    x = linear_rec['stim'].as_continuous()
+    y = linear_rec['resp'].as_continuous()
+    moments = init.lagged_moments(x, y, 8, n_folds=3, chunk_size=300)
+    assert init.lagged_moments(x, y, 8, n_folds=3, chunk_size=300) is moments
+    # cached on the values, e.g. of a fresh evaluation of the same model
+    assert init.lagged_moments(x.copy(), y, 8, n_folds=3) is moments
+    assert init.lagged_moments(x + 1, y, 8, n_folds=3) is not moments
+
+    # explicit lagged design matrix
+    padded = np.concatenate([np.repeat(x[:, :1], 7, axis=1), x], axis=1)
+    X = np.stack([padded[c, 7 - l:7 - l + x.shape[1]]
+                  for c in range(6) for l in range(8)] + [np.ones(2000)],
+                 axis=1)
+    assert np.allclose(moments['XtX'].sum(axis=0), X.T @ X)
+    assert np.allclose(moments['Xty'].sum(axis=0), X.T @ y.T)
+    assert moments['n'].sum() == 2000
+
+
+@pytest.mark.parametrize('keywords', [
+    'wc.6x1-fir.1x8-lvl.1',
+    'wc.6x2-fir.2x8-lvl.1-dexp.1',
+])
+def test_init_ridge(linear_rec, keywords):
+    modelspec = init.from_keywords(keywords, rec=linear_rec)
+    modelspec = init.init_ridge(linear_rec, modelspec, alphas=[1e-8, 1e-6])
+    linear = modelspec[:3]
+    pred = ms.evaluate(linear_rec.copy(), linear)['pred'].as_continuous()
+    assert np.allclose(pred, linear_rec['resp'].as_continuous(), atol=1e-3)
+    assert all('phi' not in m for m in modelspec[3:])
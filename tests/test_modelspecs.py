@@ -31,3 +31,49 @@ def test_best(modelspecs):
     best = get_best_modelspec(modelspecs, metakey='r_test',
                               comparison='least')
     assert best[0][0]['fn'] == 'three'
+
+
+@pytest.mark.parametrize('keywords', [
+    'wc.18x1-fir.1x15-lvl.1-dexp.1',
+    'wc.18x1-fir.1x15-lvl.1-stategain.S',
+    'wc.18x1-stp.1-fir.1x15-lvl.1',
+])
+def test_evaluate_unique_stim(synthetic_rec, keywords):
+    import numpy as np
+    import nems.modelspec as ms
+    import nems.priors
+    from nems.initializers import from_keywords
+
+    modelspec = from_keywords(keywords, rec=synthetic_rec)
+    modelspec = nems.priors.set_random_phi(modelspec)
+    expected = ms.evaluate(synthetic_rec.copy(), modelspec)['pred']
+    actual = ms.evaluate_unique_stim(synthetic_rec, modelspec)['pred']
+    assert np.allclose(expected.as_continuous(), actual.as_continuous())
+    assert 'pred' not in synthetic_rec.signals
+
+    partial = ms.evaluate_unique_stim(synthetic_rec, modelspec, stop=2)
+    expected = ms.evaluate(synthetic_rec.copy(), modelspec, stop=2)
+    assert np.allclose(expected['pred'].as_continuous(),
+                       partial['pred'].as_continuous())
+
+
+def test_evaluate_unique_stim_differing_history(synthetic_rec):
+    import numpy as np
+    import nems.modelspec as ms
+    import nems.priors
+    from nems.initializers import from_keywords
+
+    # Make one repetition differ just before its stimulus epoch, so that
+    # its FIR history no longer matches the other occurrences.
+    stim = synthetic_rec['stim']
+    data = stim.as_continuous().copy()
+    lb = stim.get_epoch_indices('STIM_001')[1, 0]
+    data[:, lb-1] += 1
+    rec = synthetic_rec.copy()
+    rec.add_signal(stim._modified_copy(data))
+
+    modelspec = from_keywords('wc.18x1-fir.1x15-lvl.1', rec=rec)
+    modelspec = nems.priors.set_random_phi(modelspec)
+    expected = ms.evaluate(rec.copy(), modelspec)['pred'].as_continuous()
+    actual = ms.evaluate_unique_stim(rec, modelspec)['pred'].as_continuous()
+    assert np.allclose(expected, actual)
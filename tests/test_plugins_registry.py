@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 
 from nems.registry import KeywordRegistry
 from nems.plugins import default_loaders
@@ -71,3 +72,68 @@ def test_jsonify(model_registry):
     unjson = KeywordRegistry.from_json(json)
     unjson.keywords == model_registry.keywords
     return json, unjson
+
+
+def test_registry_cache(model_registry):
+    one = model_registry['fir.2x15']
+    two = model_registry['fir.2x15']
+    assert one['fn'] == two['fn']
+    assert one is not two
+
+    # Copies are independent of each other and of the cached fragment
+    mean = one['prior']['coefficients'][1]['mean']
+    assert mean.flags.writeable
+    mean[:] = 5
+    three = model_registry['fir.2x15']
+    assert (three['prior']['coefficients'][1]['mean'] == 0).all()
+
+
+def test_registry_parses_once():
+    calls = []
+
+    def mykw(kw, extra=None):
+        calls.append(kw)
+        return {'fn': 'my.fn', 'fn_kwargs': {'extra': extra}}
+
+    registry = KeywordRegistry(extra=1, ignored=2)
+    registry['mykw'] = mykw
+    assert registry['mykw.1'] == {'fn': 'my.fn', 'fn_kwargs': {'extra': 1}}
+    registry['mykw.1']
+    assert calls == ['mykw.1']
+    assert 'mykw' in registry
+
+    # Re-registering a keyword invalidates the cache
+    registry['mykw'] = mykw
+    registry['mykw.1']
+    assert calls == ['mykw.1', 'mykw.1']
+
+
+def test_register_plugins_on_use(tmpdir):
+    tmpdir.join('lazy_keywords.py').write(
+            "def lazykw(kw):\n    return {'fn': 'lazy.fn'}\n")
+    requested = []
+
+    def get_pkgs():
+        requested.append(1)
+        return [str(tmpdir)]
+
+    registry = KeywordRegistry()
+    registry.register_plugins_on_use(get_pkgs)
+    assert not requested
+    assert registry['lazykw.1'] == {'fn': 'lazy.fn'}
+    assert 'lazykw' in registry
+    assert requested == [1]
+
+
+def test_registry_cache_leaves_parser_arrays_writeable():
+    default_mean = np.zeros(3)
+
+    def mykw(kw):
+        return {'fn': 'my.fn', 'prior': {'mean': default_mean}}
+
+    registry = KeywordRegistry()
+    registry['mykw'] = mykw
+    registry['mykw.1']
+    assert default_mean.flags.writeable
+    default_mean[:] = 1
+    assert (registry['mykw.1']['prior']['mean'] == 0).all()
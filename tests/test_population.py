@@ -0,0 +1,61 @@
+import copy
+
+import numpy as np
+import pytest
+
+import nems.metrics.api as metrics
+import nems.modelspec as ms
+import nems.priors
+from nems.analysis.api import fit_basic, fit_population, population_blocks
+from nems.fitters.api import coordinate_descent
+from nems.initializers import from_keywords
+
+
+pytestmark = pytest.mark.synthetic_rec(n_units=3)
+
+
+def _unit(modelspec, i):
+    modelspec = copy.deepcopy(modelspec)
+    for m in modelspec:
+        m['phi'] = {k: np.asarray(v)[i:i+1] for k, v in m['phi'].items()}
+        if 'bank_count' in m['fn_kwargs']:
+            m['fn_kwargs']['bank_count'] = 1
+    return modelspec
+
+
+def test_population_blocks(synthetic_rec):
+    modelspec = from_keywords('wc.18xR-fir.1x15xR-lvl.R', rec=synthetic_rec)
+    modelspec = nems.priors.set_mean_phi(modelspec)
+    blocks = population_blocks(modelspec, 3)
+    assert np.array_equal(np.bincount(blocks), [34, 34, 34])
+
+    for keywords in ['wc.18xR-fir.1x15xR-lvl.1', 'wc.18xR-fir.3x15-lvl.R']:
+        modelspec = from_keywords(keywords, rec=synthetic_rec)
+        modelspec = nems.priors.set_mean_phi(modelspec)
+        with pytest.raises(ValueError):
+            population_blocks(modelspec, 3)
+
+
+def test_fit_population(synthetic_rec):
+    modelspec = from_keywords('wc.18xR-fir.1x15xR-lvl.R-dexp.R',
+                              rec=synthetic_rec)
+    modelspec = nems.priors.set_mean_phi(modelspec)
+    fit_kwargs = {'max_iter': 5}
+    result = fit_population(synthetic_rec, modelspec,
+                            fit_kwargs=fit_kwargs)[0]
+    meta = ms.get_modelspec_metadata(result)
+    assert meta['units'] == synthetic_rec['resp'].chans
+    assert len(meta['unit_errors']) == 3
+
+    # each unit's parameters are fit as coordinate_descent fits that unit
+    # on its own
+    for i, chan in enumerate(synthetic_rec['resp'].chans):
+        rec = synthetic_rec.copy()
+        rec['resp'] = rec['resp'].extract_channels([chan])
+        alone = fit_basic(rec, _unit(modelspec, i), fitter=coordinate_descent,
+                          fit_kwargs=fit_kwargs)[0]
+        pred = ms.evaluate(rec, alone)
+        assert np.isclose(meta['unit_errors'][i], metrics.nmse(pred))
+        for m, a in zip(_unit(result, i), alone):
+            for k in m['phi']:
+                assert np.allclose(m['phi'][k], a['phi'][k])
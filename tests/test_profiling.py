@@ -0,0 +1,55 @@
+import pytest
+
+import nems.profiling
+import nems.modelspec as ms
+from nems.analysis.api import fit_basic
+
+
+def test_evaluate_not_profiled_by_default(simple_recording,
+                                          simple_modelspec_with_phi):
+    nems.profiling.reset()
+    ms.evaluate(simple_recording, simple_modelspec_with_phi)
+    assert not nems.profiling.get_stats()
+
+
+def test_evaluate_profiled(simple_recording, simple_modelspec_with_phi):
+    nems.profiling.enable()
+    ms.evaluate(simple_recording, simple_modelspec_with_phi)
+    ms.evaluate(simple_recording, simple_modelspec_with_phi, stop=2)
+    nems.profiling.disable()
+    stats = nems.profiling.get_stats()
+
+    keys = ['evaluate:%d--%s' % (i, m['fn'])
+            for i, m in enumerate(simple_modelspec_with_phi)]
+    assert list(stats.keys()) == keys
+    assert [stats[k]['calls'] for k in keys] == [2, 2, 1]
+    assert all(stats[k]['total'] >= 0 for k in keys)
+    assert 'evaluate:0' in nems.profiling.format_table(stats)
+
+
+def test_fit_basic_profile(simple_recording, simple_modelspec_with_phi):
+    fit_kwargs = {'options': {'maxiter': 3}}
+    result = fit_basic(simple_recording, simple_modelspec_with_phi,
+                       fit_kwargs=fit_kwargs, profile=True)[0]
+    assert not nems.profiling.enabled()
+
+    profile = ms.get_modelspec_metadata(result)['profile']
+    for k in ['cost_function', 'segmentor', 'evaluator', 'metric',
+              'fitter_overhead']:
+        assert k in profile
+    assert profile['cost_function']['calls'] == \
+        profile['metric']['calls'] > 0
+    assert profile['evaluate:0--nems.modules.weight_channels.gaussian'][
+            'calls'] == profile['cost_function']['calls']
+
+
+def test_fit_basic_profile_fitter_error(simple_recording,
+                                        simple_modelspec_with_phi):
+    def failing_fitter(sigma, cost_fn, bounds=None, **kwargs):
+        cost_fn(sigma)
+        raise RuntimeError('fitter failed')
+
+    with pytest.raises(RuntimeError):
+        fit_basic(simple_recording, simple_modelspec_with_phi,
+                  fitter=failing_fitter, profile=True)
+    assert not nems.profiling.enabled()
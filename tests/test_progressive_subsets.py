@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+import nems.metrics.api as metrics
+import nems.modelspec as ms
+from nems.analysis.api import fit_basic, fit_progressive_subsets
+from nems.initializers import from_keywords
+from nems.plugins.default_fitters import basic
+
+
+pytestmark = pytest.mark.synthetic_rec(n_reps=4)
+
+
+def test_fit_progressive_subsets(synthetic_rec):
+    modelspec = from_keywords('wc.18x1-fir.1x15-lvl.1', rec=synthetic_rec)
+    fit_kwargs = {'max_iter': 1000}
+    expected = fit_basic(synthetic_rec, modelspec, fit_kwargs=fit_kwargs)[0]
+    result = fit_progressive_subsets(synthetic_rec, modelspec,
+                                     start_fraction=0.25,
+                                     fit_kwargs=fit_kwargs)[0]
+    schedule = ms.get_modelspec_metadata(result)['subset_schedule']
+    assert [s['fraction'] for s in schedule] == [0.25, 0.5, 1.0]
+    assert np.isclose(metrics.nmse(ms.evaluate(synthetic_rec.copy(), result)),
+                      metrics.nmse(ms.evaluate(synthetic_rec.copy(),
+                                               expected)),
+                      rtol=1e-4)
+
+
+def test_progressive_subsets_with_mask(synthetic_rec):
+    rec = synthetic_rec.create_mask(True)
+    stages = []
+
+    def analysis(data, modelspec, **kwargs):
+        stages.append(data['mask'].as_continuous().mean())
+        return [modelspec]
+
+    fit_progressive_subsets(rec, [{'fn': 'x', 'phi': {}}], start_fraction=0.25,
+                            analysis=analysis)
+    assert np.allclose(stages, [0.25, 0.5, 1.0])
+
+
+def test_ps_keyword():
+    assert basic('basic.ps')[0][1]['start_fraction'] == 1 / 8
+    assert basic('basic.ps4')[0][1]['start_fraction'] == 1 / 4
@@ -194,3 +194,93 @@ def test_recording_copy(recording):
     # Ensure we get a true copy of recording
     recording_copy = recording.copy()
     assert id(recording.signals) != id(recording_copy.signals)
+
+
+def test_recording_shares_epochs(recording):
+    s1, s2 = recording.signals.values()
+    # Equal epoch tables are merged into one referenced by every signal
+    assert s1.epochs is s2.epochs
+
+    epochs = recording.epochs
+    assert epochs['name'].tolist() == ['trial', 'pupil_closed',
+                                       'pupil_closed', 'trial2']
+    # The merged table is cached, but callers get their own copy
+    epochs.loc[0, 'name'] = 'changed'
+    assert recording.epochs['name'][0] == 'trial'
+
+    # Adding epochs to one signal invalidates the cached table
+    s3 = s1.copy()
+    s3.add_epoch('extra', np.array([[0, 1]]))
+    assert s1.epochs is s2.epochs
+    recording.add_signal(s3)
+    assert 'extra' in recording.epochs['name'].tolist()
+
+
+def test_recording_shares_epochs_by_copy(signal1, signal2):
+    signals = {signal1.name: signal1, signal2.name: signal2}
+    epochs1, epochs2 = signal1.epochs, signal2.epochs
+    recording = Recording(signals)
+    s1, s2 = recording.signals.values()
+    assert s1.epochs is s2.epochs
+    # the caller's signals and dict are left alone
+    assert signal1.epochs is epochs1 and signal2.epochs is epochs2
+    assert signals == {signal1.name: signal1, signal2.name: signal2}
+
+
+def test_epochs_edited_in_place(recording):
+    s1 = recording['dummy_signal_1']
+    assert recording.epochs['name'][0] == 'trial'
+    assert s1.extract_epoch('trial2').shape[0] == 1
+
+    # the cached merged table and epoch index follow the edit
+    s1.epochs.loc[s1.epochs['name'] == 'trial2', 'name'] = 'trial3'
+    assert 'trial3' in recording.epochs['name'].tolist()
+    assert s1.extract_epoch('trial3').shape[0] == 1
+    with pytest.raises(IndexError):
+        s1.extract_epoch('trial2')
+
+
+def test_jackknife_by_epoch(recording):
+    for invert in (False, True):
+        jk = recording.jackknife_by_epoch(2, 1, 'pupil_closed', invert=invert)
+        for name, s in recording.signals.items():
+            expected = s.jackknife_by_epoch(2, 1, 'pupil_closed',
+                                            invert=invert)
+            assert np.array_equal(jk[name].as_continuous(),
+                                  expected.as_continuous(), equal_nan=True)
+
+
+def test_jackknife_mask_by_epoch(recording):
+    est = recording.jackknife_mask_by_epoch(2, 0, 'pupil_closed')
+    val = recording.jackknife_mask_by_epoch(2, 0, 'pupil_closed', invert=True)
+    # Folds only differ in their mask; the data signals are shared
+    for name, s in recording.signals.items():
+        assert est[name] is s
+        assert val[name] is s
+    est_mask = est['mask'].as_continuous()[0]
+    val_mask = val['mask'].as_continuous()[0]
+    assert not np.any(est_mask & val_mask)
+    assert np.array_equal(np.flatnonzero(~est_mask), np.arange(15, 60))
+    assert np.array_equal(np.flatnonzero(val_mask), np.arange(15, 60))
+
+
+def test_apply_mask(recording):
+    # A contiguous mask gives views of the original data
+    mask = np.zeros(250, dtype=bool)
+    mask[20:120] = True
+    rec = recording.create_mask(mask)
+    masked = rec.apply_mask()
+    for name, s in recording.signals.items():
+        x = masked[name].as_continuous()
+        assert x.shape == (3, 100)
+        assert np.shares_memory(x, s.as_continuous())
+        assert np.array_equal(x, s.as_continuous()[:, 20:120])
+
+    # Several blocks are gathered with one index shared by all signals
+    mask[150:160] = True
+    rec = recording.create_mask(mask)
+    masked = rec.apply_mask()
+    for name, s in recording.signals.items():
+        assert np.array_equal(masked[name].as_continuous(),
+                              s.as_continuous()[:, mask])
+    assert rec['mask']._mask_times.shape == (2, 2)
@@ -0,0 +1,57 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import nems.modelspec as ms
+import nems.priors
+from nems.initializers import from_keywords
+from nems.serving import load_model
+
+
+@pytest.mark.parametrize('keywords', [
+    'wc.18x1-fir.1x15-lvl.1-dexp.1',
+    'wc.18x2-stp.2-fir.2x15-lvl.1-qsig.1',
+    'wc.18x1-fir.1x15-lvl.1-stategain.S',
+])
+def test_export_modelspec(synthetic_rec, keywords, tmpdir):
+    modelspec = from_keywords(keywords, rec=synthetic_rec)
+    modelspec = nems.priors.set_random_phi(modelspec)
+    for m in modelspec:
+        if m['fn'] == 'nems.modules.stp.short_term_plasticity':
+            m['phi']['u'] = np.array([0.3, 0.05])
+            m['phi']['tau'] = np.array([0.1, 0.2])
+    ms.set_modelspec_metadata(modelspec, 'cellid', 'cell_1')
+    expected = ms.evaluate(synthetic_rec.copy(), modelspec)['pred']
+
+    path = str(tmpdir.join('model.nems'))
+    ms.export_modelspec(modelspec, path, fs=synthetic_rec['stim'].fs)
+    model = load_model(path)
+    assert model.meta['cellid'] == 'cell_1'
+    pred = model.predict(synthetic_rec['stim'].as_continuous(),
+                         state=synthetic_rec['state'].as_continuous())
+    assert np.allclose(pred, expected.as_continuous())
+
+
+def test_export_unsupported():
+    modelspec = [{'fn': 'nems.modules.signal_mod.average_sig',
+                  'fn_kwargs': {}, 'phi': {}}]
+    with pytest.raises(ValueError):
+        ms.compile_modelspec(modelspec, fs=100)
+
+
+def test_serving_imports_only_numpy():
+    out = subprocess.run(
+            [sys.executable, '-c',
+             'import sys, nems.serving; '
+             'print(" ".join(m for m in sys.modules '
+             'if m.split(".")[0] in ("nems", "pandas", "scipy")))'],
+            stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    # the module kernels it shares import nothing but NumPy either, and
+    # `import nems` only reads the logging settings
+    modules = [m for m in out.stdout.split()
+               if m.split('.')[:2] != ['nems', 'configs']]
+    assert sorted(modules) == [
+            'nems', 'nems.modules', 'nems.modules.nonlinearity',
+            'nems.modules.signal_mod', 'nems.modules.stp', 'nems.serving']
@@ -165,6 +165,11 @@ def test_jackknife_by_time(signal):
     assert np.sum(np.isnan(jdata)) == 30
     assert np.sum(np.isnan(idata)) == 570
 
+    # The excised validation set is a view of the original data
+    xsig = signal.jackknife_by_time(20, 2, invert=True, excise=True)
+    assert xsig.shape == (3, 10)
+    assert np.shares_memory(xsig.as_continuous(), signal.as_continuous())
+
 
 def test_concatenate_time(signal):
     sig1 = signal
@@ -382,7 +387,176 @@ def test_rasterized_signal_subset(signal):
     assert subset.average_epoch('pupil_closed').shape == (3, 45)
 
 
+def test_rasterized_signal_subset_clips_bounds(signal):
+    # a negative lower bound selects from the start, not from the end
+    data = signal.as_continuous()
+    subset = signal.select_times([(-0.2, 0.2), (0.3, 0.5), (3.9, 5)])
+    expected = np.concatenate([data[:, :10], data[:, 15:25],
+                               data[:, 195:]], axis=-1)
+    assert np.array_equal(subset.as_continuous(), expected)
+    subset = signal.select_times([(-0.2, 0.2)])
+    assert np.array_equal(subset.as_continuous(), data[:, :10])
+
+
 def test_epoch_to_signal(signal):
     s = signal.epoch_to_signal('pupil_closed')
     assert s.as_continuous().shape == (1, 200)
     assert s.as_continuous().sum() == 85
+
+
+def test_modified_copy(signal):
+    data = signal.as_continuous()[:2] * 2
+    copied = signal._modified_copy(data, name='doubled')
+    assert copied.epochs is signal.epochs
+    assert copied.segments is signal.segments
+    assert copied.name == 'doubled'
+    assert copied.shape == (2, signal.ntimes)
+    assert not copied.as_continuous().flags.writeable
+
+    attributes = signal._get_attributes()
+    attributes['name'] = 'doubled'
+    expected = nems.signal.RasterizedSignal(data=data, safety_checks=False,
+                                            **attributes)
+    for k in ['fs', 'chans', 'recording', 'normalization', 'signal_type',
+              'nchans', 'ntimes']:
+        assert getattr(copied, k) == getattr(expected, k)
+    assert np.array_equal(copied.iloc[:, 10:20].as_continuous(),
+                          expected.iloc[:, 10:20].as_continuous())
+
+
+@pytest.fixture()
+def point_process():
+    spikes = {
+        'cell2': np.array([0.0, 0.011, 0.019, 0.5, 1.99]),
+        'cell1': np.array([0.25, 0.251, 3.0]),
+        'cell3': np.array([]),
+    }
+    epochs = pd.DataFrame({'start': [0.0], 'end': [2.0], 'name': ['TRIAL']})
+    return nems.signal.PointProcess(fs=100, data=spikes, name='resp',
+                                    recording='dummy_recording',
+                                    epochs=epochs)
+
+
+def test_point_process_rasterize(point_process):
+    r = point_process.rasterize()
+    assert r.chans == ['cell1', 'cell2', 'cell3']
+    assert r.shape == (3, 200)
+
+    # compare against binning one spike at a time
+    expected = np.zeros((3, 200))
+    for i, c in enumerate(r.chans):
+        for t in point_process._data[c]:
+            b = int(np.floor(t*100))
+            if b < 200:
+                expected[i, b] += 1
+    assert np.array_equal(r.as_continuous(), expected)
+
+    r50 = point_process.rasterize(fs=50)
+    assert r50.fs == 50
+    assert r50.shape == (3, 100)
+    assert r50.as_continuous().sum() == expected.sum()
+
+
+def test_point_process_raster_cache(point_process):
+    one = point_process.rasterize()
+    two = point_process.rasterize()
+    assert one._data is two._data
+    assert not one._data.flags.writeable
+    assert point_process.rasterize(fs=50)._data is not one._data
+
+
+def test_point_process_csr_storage(point_process):
+    data = point_process._data
+    assert isinstance(data, nems.signal.EventTimes)
+    assert list(data) == ['cell1', 'cell2', 'cell3']
+    assert data['cell1'].tolist() == [0.25, 0.251, 3.0]
+    assert data['cell3'].size == 0
+    assert data.offsets.tolist() == [0, 3, 8, 8]
+
+    sub = point_process.extract_channels(['cell3', 'cell2'])
+    assert list(sub._data) == ['cell2', 'cell3']
+    assert np.array_equal(sub._data['cell2'], data['cell2'])
+
+    # compares equal to a plain dict with the same arrays
+    as_dict = {k: np.array(v) for k, v in data.items()}
+    assert data == as_dict
+    as_dict['cell1'] = as_dict['cell1'] + 1
+    assert data != as_dict
+    assert data != {'cell1': data['cell1']}
+    assert data != 'cell1'
+
+
+def test_point_process_concatenate(point_process):
+    both = point_process.append_time(point_process)
+    assert both._data['cell1'].tolist() == [0.25, 0.251, 3.0,
+                                            2.25, 2.251, 5.0]
+    assert both.rasterize().shape == (3, 400)
+
+    three = point_process.concatenate_time([point_process] * 3)
+    assert three._data.offsets.tolist() == [0, 9, 24, 24]
+    assert three._data['cell2'][-1] == 1.99 + 4
+    # the original signal is unchanged
+    assert point_process._data.offsets.tolist() == [0, 3, 8, 8]
+
+
+def test_point_process_save_load(point_process, signal_tmpdir):
+    point_process.save(str(signal_tmpdir))
+    basepath = str(signal_tmpdir.join('dummy_recording.resp'))
+    loaded = nems.signal.load_signal(basepath)
+    assert isinstance(loaded, nems.signal.PointProcess)
+    assert loaded._data == point_process._data
+
+
+def test_point_process_load_legacy_h5(point_process, tmpdir):
+    # older files have one dataset per channel
+    import h5py
+    point_process._save_metadata_to_dirpath(str(tmpdir))
+    basepath = str(tmpdir.join('dummy_recording.resp'))
+    with h5py.File(basepath + '.h5', 'w') as f:
+        for k, v in point_process._data.items():
+            f.create_dataset(k, data=v)
+    loaded = nems.signal.load_signal(basepath)
+    assert loaded._data == point_process._data
+
+
+@pytest.fixture()
+def tiled_signal():
+    tiles = {
+        'STIM_A': np.array([[1.0, 2.0, 3.0], [0.0, np.nan, 1.0]]),
+        'STIM_B': np.array([[4.0, 5.0], [6.0, 7.0]]),
+    }
+    epochs = pd.DataFrame({'start': [0.0, 0.04, 0.07, 0.1],
+                           'end': [0.03, 0.06, 0.1, 0.12],
+                           'name': ['STIM_A', 'STIM_B', 'STIM_A', 'TRIAL']})
+    return nems.signal.TiledSignal(fs=100, data=tiles, name='stim',
+                                   recording='dummy_recording',
+                                   chans=['lo', 'hi'], epochs=epochs)
+
+
+def test_tiled_signal_rasterize(tiled_signal):
+    expected = np.array([[1, 2, 3, 0, 4, 5, 0, 1, 2, 3, 0, 0],
+                         [0, 0, 1, 0, 6, 7, 0, 0, 0, 1, 0, 0]])
+    x = tiled_signal.as_continuous()
+    assert np.array_equal(x, expected)
+    # cached, and read-only since it is shared
+    assert tiled_signal.as_continuous() is x
+    assert not x.flags.writeable
+
+
+def test_tiled_signal_pointwise_transform(tiled_signal):
+    fn = lambda x: np.array([[1.0, -1.0]]) @ x + 2
+    expected = tiled_signal.rasterize().transform(fn, 'pred')
+    compact = tiled_signal.transform(fn, 'pred', pointwise=True)
+    assert isinstance(compact, nems.signal.TiledSignal)
+    assert compact.name == 'pred'
+    assert np.allclose(compact.as_continuous(), expected.as_continuous())
+    # two channels in, one out, so the channel names don't apply
+    assert tiled_signal.chans == ['lo', 'hi']
+    assert compact.chans is None
+    assert compact.rasterize().chans is None
+    assert tiled_signal.transform(np.exp, pointwise=True).chans == \
+        ['lo', 'hi']
+
+    full = tiled_signal.transform(fn, 'pred')
+    assert isinstance(full, nems.signal.RasterizedSignal)
+    assert np.allclose(full.as_continuous(), expected.as_continuous())
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+import nems.metrics.api as metrics
+import nems.modelspec as ms
+import nems.priors
+from nems.initializers import from_keywords
+from nems.recording import Recording
+from nems.streaming import OnlinePredictor, StreamingStats, \
+    check_chunkable, evaluate_chunked
+
+
+@pytest.mark.parametrize('keywords', [
+    'wc.18x1-fir.1x15-lvl.1-dexp.1',
+    'wc.18x2-stp.2-fir.2x15-lvl.1',
+    'wc.18x1-fir.1x15-lvl.1-stategain.S',
+])
+def test_evaluate_chunked(synthetic_rec, keywords):
+    modelspec = from_keywords(keywords, rec=synthetic_rec)
+    modelspec = nems.priors.set_random_phi(modelspec)
+    for m in modelspec:
+        if m['fn'] == 'nems.modules.stp.short_term_plasticity':
+            m['phi']['u'] = np.array([0.3, 0.05])
+            m['phi']['tau'] = np.array([0.1, 0.2])
+    full = ms.evaluate(synthetic_rec.copy(), modelspec)
+    expected = full['pred'].as_continuous()
+
+    # Blocks that do not line up with trials or filter lengths
+    out = np.zeros_like(expected)
+    stats = evaluate_chunked(synthetic_rec, modelspec, chunk_size=133,
+                             out=out)
+    assert np.allclose(out, expected)
+    assert np.allclose(stats.corrcoef()[0], metrics.corrcoef(full))
+    assert np.allclose(stats.mse()[0], metrics.mse(full))
+    assert np.allclose(stats.nmse()[0], metrics.nmse(full))
+
+
+def test_evaluate_chunked_mmap(synthetic_rec, tmpdir):
+    path = synthetic_rec.save_dir(str(tmpdir), fmt='npy')
+    rec = Recording.load_dir(path, mmap=True)
+    assert isinstance(rec['stim']._data, np.memmap)
+    assert np.array_equal(rec['stim'].as_continuous(),
+                          synthetic_rec['stim'].as_continuous())
+
+    modelspec = from_keywords('wc.18x1-fir.1x15-lvl.1', rec=rec)
+    modelspec = nems.priors.set_random_phi(modelspec)
+    expected = ms.evaluate(synthetic_rec.copy(), modelspec)
+    stats = evaluate_chunked(rec, modelspec, chunk_size=500,
+                             signals=['stim', 'resp'])
+    assert np.allclose(stats.corrcoef()[0], metrics.corrcoef(expected))
+
+
+def test_check_chunkable():
+    modelspec = [{'fn': 'nems.modules.signal_mod.average_sig',
+                  'fn_kwargs': {}, 'phi': {}}]
+    with pytest.raises(ValueError):
+        check_chunkable(modelspec)
+
+
+def test_streaming_stats():
+    rng = np.random.RandomState(0)
+    pred = rng.normal(1e3, 1, size=(2, 1000))
+    resp = pred + rng.normal(0, 1, size=(2, 1000))
+    resp[0, 10:20] = np.nan
+    stats = StreamingStats()
+    for t0 in range(0, 1000, 300):
+        stats.update(pred[:, t0:t0+300], resp[:, t0:t0+300])
+
+    for c in range(2):
+        ff = np.isfinite(resp[c])
+        p, r = pred[c, ff], resp[c, ff]
+        assert stats.n[c] == ff.sum()
+        assert np.isclose(stats.corrcoef()[c], np.corrcoef(p, r)[0, 1])
+        assert np.isclose(stats.mse()[c], np.mean((p - r)**2))
+        assert np.isclose(stats.nmse()[c],
+                          np.sqrt(np.mean((p - r)**2)) / np.std(r))
+
+
+@pytest.mark.parametrize('keywords', [
+    'wc.18x1-fir.1x15-lvl.1-dexp.1',
+    'wc.18x2-stp.2-fir.2x15-lvl.1',
+    'wc.18x1-fir.1x15-lvl.1-stategain.S',
+])
+def test_online_predictor(synthetic_rec, keywords):
+    modelspec = from_keywords(keywords, rec=synthetic_rec)
+    modelspec = nems.priors.set_random_phi(modelspec)
+    for m in modelspec:
+        if m['fn'] == 'nems.modules.stp.short_term_plasticity':
+            m['phi']['u'] = np.array([0.3, 0.05])
+            m['phi']['tau'] = np.array([0.1, 0.2])
+    expected = ms.evaluate(synthetic_rec.copy(), modelspec)['pred']
+    expected = expected.as_continuous()
+    stim = synthetic_rec['stim'].as_continuous()
+    state = synthetic_rec['state'].as_continuous()
+
+    predictor = OnlinePredictor(modelspec, fs=synthetic_rec['stim'].fs)
+    rng = np.random.RandomState(0)
+    for repeat in range(2):
+        pred = []
+        t0 = 0
+        while t0 < stim.shape[1]:
+            t1 = t0 + rng.randint(1, 40)
+            pred.append(predictor.push(stim[:, t0:t1],
+                                       state=state[:, t0:t1]))
+            t0 = t1
+        assert np.allclose(np.concatenate(pred, axis=1), expected)
+        predictor.reset()
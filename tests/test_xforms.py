@@ -48,3 +48,18 @@ def test_get_module(context):
 
 #def test_get_signal_as_array(context, rec_key='rec'):
 #    a = xf.get_signal_as_array(context, 'stim', rec_key='rec')
+
+
+@pytest.mark.synthetic_rec(n_stim=2, n_reps=1)
+def test_fit_basic_nfold_budgets(synthetic_rec):
+    from nems.initializers import from_keywords
+    import nems.modelspec as ms
+
+    rec = synthetic_rec
+    modelspec = from_keywords('wc.18x1-fir.1x15-lvl.1', rec=rec)
+    for fitter in ('scipy_minimize', 'least_squares'):
+        result = xf.fit_basic([modelspec], [rec, rec.copy()], fitter=fitter,
+                              jackknifed_fit=True, max_evals=20)
+        assert len(result['modelspecs']) == 2
+        for m in result['modelspecs']:
+            assert ms.get_modelspec_metadata(m)['stop_reason'] == 'max_evals'